@@ -0,0 +1,252 @@
+"""
+Benchmark of the functions of the data engine on synthetic data, runs without Streamlit.
+
+Generates match and goal tables at multiples of the size of data/results.csv, times every function and the full
+team summary for a few representative filter combinations, records the peak memory and writes the results as JSON:
+
+    python benchmark.py --scales 1 10 100 --output benchmark.json
+    python benchmark.py --scales 1 --budgets budgets.json
+
+A budgets file maps "<function>@<scale>x" to the maximum median time in ms, the run exits with status 1 when one is exceeded.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import engine
+from cache import NullCache
+from store import apply_types
+
+BASE_MATCHES = 47_379
+BASE_GOALS = 44_151
+N_TEAMS = 330
+N_TOURNAMENTS = 175
+N_SCORERS_PER_TEAM = 60
+
+
+def synthetic_tables(scale, seed=0):
+    """
+    Generates typed tables shaped like the store, with scale times the number of matches of data/results.csv.
+
+    Parameters:
+    scale (int):    The multiple of the size of data/results.csv.
+    seed (int):     The seed of the random generator.
+
+    Returns:
+    dict: A dictionary with the table name as key and the typed DataFrame as value.
+    """
+    rng = np.random.default_rng(seed)
+    n_matches = BASE_MATCHES * scale
+    teams = np.array([f'Team {i:03d}' for i in range(N_TEAMS)], dtype=object)
+    tournaments = np.array(['Friendly'] + [f'Tournament {i:03d}' for i in range(N_TOURNAMENTS - 1)], dtype=object)
+
+    # Some teams and tournaments play a lot more than others, like in the real data
+    team_weights = rng.pareto(1.5, N_TEAMS) + 1
+    home = rng.choice(N_TEAMS, n_matches, p=team_weights / team_weights.sum())
+    away = (home + rng.integers(1, N_TEAMS, n_matches)) % N_TEAMS
+    tournament_weights = np.r_[N_TOURNAMENTS, rng.pareto(1.2, N_TOURNAMENTS - 1) + 1]
+    days = np.sort(rng.integers(np.datetime64('1872-11-30').astype(int), np.datetime64('2024-07-14').astype(int), n_matches))
+    home_score = rng.poisson(1.5, n_matches).astype(float)
+    away_score = rng.poisson(1.1, n_matches).astype(float)
+
+    df_results = pd.DataFrame({
+        'date': days.astype('datetime64[D]').astype('datetime64[s]'),
+        'home_team': teams[home],
+        'away_team': teams[away],
+        'home_score': home_score,
+        'away_score': away_score,
+        'tournament': tournaments[rng.choice(N_TOURNAMENTS, n_matches, p=tournament_weights / tournament_weights.sum())],
+        'city': 'City',
+        'country': teams[home],
+        'neutral': rng.random(n_matches) < 0.25,
+    })
+
+    # Goals are only known for the more recent matches, pick those until the goal count matches the real ratio
+    goals_per_match = (home_score + away_score).astype(int)
+    n_recent = np.searchsorted(np.cumsum(goals_per_match[::-1]), BASE_GOALS * scale) + 1
+    with_goals = np.arange(max(n_matches - n_recent, 0), n_matches)
+    match = np.repeat(with_goals, goals_per_match[with_goals])
+    # The first goals of every match are scored by the home team
+    goal_number = np.arange(len(match)) - np.repeat(np.cumsum(goals_per_match[with_goals]) - goals_per_match[with_goals], goals_per_match[with_goals])
+    is_home = goal_number < home_score[match]
+    scoring_team = np.where(is_home, home[match], away[match])
+
+    df_goals = pd.DataFrame({
+        'date': df_results['date'].to_numpy()[match],
+        'home_team': teams[home[match]],
+        'away_team': teams[away[match]],
+        'team': teams[scoring_team],
+        'scorer': np.char.add(np.char.add(teams[scoring_team].astype(str), ' player '), rng.integers(0, N_SCORERS_PER_TEAM, len(match)).astype(str)),
+        'minute': rng.integers(1, 91, len(match)).astype(float),
+        'own_goal': rng.random(len(match)) < 0.02,
+        'penalty': rng.random(len(match)) < 0.08,
+    })
+    df_shootouts = pd.DataFrame({
+        'date': df_results['date'].iloc[:0], 'home_team': [], 'away_team': [], 'winner': [], 'first_shooter': [],
+    })
+    df_locations = pd.DataFrame({'country': teams, 'lat': rng.uniform(-60, 70, N_TEAMS), 'lon': rng.uniform(-180, 180, N_TEAMS)})
+
+    return apply_types({'goalscorers': df_goals, 'results': df_results, 'shootouts': df_shootouts, 'country_coords': df_locations})
+
+
+def filter_cases(tables, index):
+    """
+    Picks representative selections: the team with the most matches and a median team, with and without filters.
+
+    Returns:
+    list of tuple: The name of the case and the keyword arguments of the selection.
+    """
+    df_results = tables['results']
+    counts = pd.concat([df_results['home_team'], df_results['away_team']]).value_counts()
+    busy, median = counts.index[0], counts.index[len(counts) // 2]
+    df_team = engine.team_matches(df_results, index, busy)
+    top_tournaments = df_team['tournament'].value_counts().index[:2].tolist()
+    top_opponents = pd.concat([df_team['home_team'], df_team['away_team']]).value_counts().index[1:4].tolist()
+    max_year = int(df_results['date'].dt.year.max())
+
+    return [
+        ('default', {'team': busy, 'years': (1980, max_year)}),
+        ('median_team', {'team': median, 'years': (1980, max_year)}),
+        ('all_years', {'team': busy, 'years': (1872, max_year)}),
+        ('tournaments', {'team': busy, 'tournaments': top_tournaments, 'years': (1980, max_year)}),
+        ('opponents', {'team': busy, 'opponents': top_opponents, 'years': (1872, max_year)}),
+    ]
+
+
+def measure(function, repeat):
+    """
+    Times a function and measures its peak memory in a separate run, so tracing does not slow down the timings.
+
+    Returns:
+    dict: The median and minimum time in ms and the peak memory in MB.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'median_ms': float(np.median(timings)), 'min_ms': float(np.min(timings)), 'peak_mb': peak / 2**20}
+
+
+def benchmark_scale(scale, repeat):
+    """
+    Runs all benchmarks on synthetic data of one scale.
+
+    Returns:
+    list of dict: A result per function and case.
+    """
+    tables = synthetic_tables(scale)
+    df_results, df_goals, df_locations = tables['results'], tables['goalscorers'], tables['country_coords']
+    # Without a cache every query is timed cold, a warm query is a single cache lookup
+    query_engine = engine.Engine(tables, cache=NullCache())
+    index, cube = query_engine.index, query_engine.cube
+    results = []
+
+    def record(name, case, function, repeat=repeat):
+        result = measure(function, repeat)
+        results.append({'scale': scale, 'matches': len(df_results), 'goals': len(df_goals), 'function': name, 'case': case, **result})
+        print(f'{scale:>4}x  {name:<28} {case:<12} {result["median_ms"]:>10.2f} ms  {result["peak_mb"]:>8.1f} MB', file=sys.stderr)
+
+    record('build_team_index', 'all', lambda: engine.build_team_index(df_results, df_goals), repeat=1)
+    record('build_outcome_cube', 'all', lambda: engine.build_outcome_cube(df_results), repeat=1)
+    record('build_goal_cube', 'all', lambda: engine.build_goal_cube(df_goals, df_results), repeat=1)
+    record('build_form', 'all', lambda: engine.build_form(df_results), repeat=1)
+    record('build_venue_cube', 'all', lambda: engine.build_venue_cube(df_results), repeat=1)
+
+    for case, selection in filter_cases(tables, index):
+        team, tournaments, opponents, years = (selection.get(key) for key in ['team', 'tournaments', 'opponents', 'years'])
+        df_team = engine.team_matches(df_results, index, team)
+        df_filtered = engine.filter_dataframe(df_team, home_team=team, tournaments=tournaments, opponents=opponents, year_range=years)
+        team_goals = engine.team_goals(df_goals, index, team)
+
+        record('team_matches', case, lambda: engine.team_matches(df_results, index, team))
+        record('filter_dataframe', case, lambda: engine.filter_dataframe(df_results, home_team=team, tournaments=tournaments, opponents=opponents, year_range=years))
+        record('filter_dataframe_team_rows', case, lambda: engine.filter_dataframe(df_team, home_team=team, tournaments=tournaments, opponents=opponents, year_range=years))
+        record('calculate_team_stats', case, lambda: engine.calculate_team_stats(df_filtered, team))
+        record('team_won', case, lambda: engine.team_won(df_filtered, team))
+        record('match_outcomes', case, lambda: engine.match_outcomes(df_filtered, team))
+        record('team_form', case, lambda: engine.team_form(query_engine.form, team, years))
+        record('rolling_win_rate', case, lambda: engine.rolling_win_rate(query_engine.form, team, 10, years))
+        record('cube_team_stats', case, lambda: engine.cube_team_stats(engine.cube_cells(cube, team, tournaments, opponents, years)))
+        record('cube_win_percentage_per_year', case, lambda: engine.cube_win_percentage_per_year(engine.cube_cells(cube, team, tournaments, opponents, years)))
+        record('goal_timing', case, lambda: engine.goal_timing(engine.cube_cells(query_engine.goal_cube, team, tournaments, opponents, years)))
+        record('count_top_scorers', case, lambda: engine.count_top_scorers(team_goals, df_filtered['match_id']))
+        record('get_win_ratio', case, lambda: engine.get_win_ratio(df_filtered, df_locations, team))
+        record('team_summary', case, lambda: query_engine.team_summary(team, tournaments, opponents, years))
+
+    # Comparing k teams in one batched pass against k summaries one after the other, the first should grow sub-linearly
+    counts = pd.concat([df_results['home_team'], df_results['away_team']]).value_counts()
+    max_year = int(df_results['date'].dt.year.max())
+    for k in [1, 2, 4, 8]:
+        teams = counts.index[:k].tolist()
+        record('compare_teams', f'{k}_teams', lambda: engine.compare_teams(cube, index, df_results, df_goals, teams, year_range=(1980, max_year)))
+        record('team_summaries', f'{k}_teams', lambda: [query_engine.team_summary(team, years=(1980, max_year)) for team in teams])
+    return results
+
+
+def check_budgets(results, budgets):
+    """
+    Compares the median times with the budgets.
+
+    Returns:
+    list of str: A message per exceeded budget.
+    """
+    worst = {}
+    for result in results:
+        key = f'{result["function"]}@{result["scale"]}x'
+        worst[key] = max(worst.get(key, 0.0), result['median_ms'])
+    return [f'{key}: {worst[key]:.2f} ms > {budget} ms' for key, budget in budgets.items() if key in worst and worst[key] > budget]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the functions of the engine on synthetic data.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the JSON to this file instead of stdout')
+    parser.add_argument('--budgets', help='a JSON file mapping "<function>@<scale>x" to the maximum median time in ms')
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        results += benchmark_scale(scale, args.repeat)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+
+    if args.budgets:
+        with open(args.budgets, 'r') as file:
+            exceeded = check_budgets(results, json.load(file))
+        for message in exceeded:
+            print(f'Budget exceeded: {message}', file=sys.stderr)
+        if exceeded:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""
+Caching helpers that do not depend on Streamlit.
+
+A cache is any object with a get_or_compute(key, compute) method, so the engine can use any of the classes below.
+"""
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by DiskCache.get for a key that is not stored, since None can be a stored value
+MISSING = object()
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded cache that evicts the least recently used entry and counts its hits and misses.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value of a key, or computes, stores and returns it when the key is not cached.
+
+        Parameters:
+        key (hashable):         The key of the value.
+        compute (callable):     A function without arguments that computes the value.
+
+        Returns:
+        The cached or computed value.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Compute outside the lock so other sessions are not blocked, two sessions may then compute the same key once
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        """
+        Removes all entries, the counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the number of entries, hits, misses and evictions.
+
+        Returns:
+        dict: The statistics of the cache.
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NullCache:
+    """
+    A cache that stores nothing, every call computes its value (e.g. for benchmarks and batch jobs).
+    """
+
+    def __init__(self):
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        self.misses += 1
+        return compute()
+
+    def stats(self):
+        return {'size': 0, 'hits': 0, 'misses': self.misses}
+
+
+class DiskCache:
+    """
+    A persistent, size-bounded cache in a SQLite file, so computed results survive restarts and are shared by all
+    processes and replicas that use the same file. The least recently used entries are evicted once the pickled values
+    take more than maxbytes.
+
+    A hit does not write to the file, so readers never wait for the write lock of SQLite. The time a value was read is
+    kept in memory and written together with the next put, or at most once per touch_interval seconds, and only for
+    values whose stored access time is older than that. The eviction order is therefore accurate to touch_interval.
+
+    The keys are stored as JSON, so they should consist of strings, numbers, None and tuples of those. The values are pickled,
+    so a file written with another schema (e.g. by code whose results have a different shape) is emptied when opened.
+    """
+
+    def __init__(self, path, maxbytes=256 * 2**20, schema=1, touch_interval=60):
+        self.path = path
+        self.maxbytes = maxbytes
+        self.schema = schema
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # The time of the last read per key text, not written to the file yet
+        self._touches = {}
+        self._flushed = time.time()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        connection = self._connection()
+        # Write-ahead logging lets readers in other processes continue while one process writes
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('BEGIN IMMEDIATE')
+        if connection.execute('PRAGMA user_version').fetchone()[0] != schema:
+            connection.execute('DROP TABLE IF EXISTS entries')
+            connection.execute(f'PRAGMA user_version = {int(schema)}')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        connection.execute('COMMIT')
+
+    def _connection(self):
+        # A SQLite connection can only be used by the thread that opened it. Without an isolation level every
+        # statement commits on its own, transactions are started explicitly with BEGIN IMMEDIATE.
+        if not hasattr(self._local, 'connection'):
+            self._local.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return self._local.connection
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def get(self, key, default=MISSING):
+        """
+        Returns the stored value of a key without computing it, this does not count as a hit or miss.
+
+        Parameters:
+        key (tuple):    The key of the value.
+        default:        The value to return when the key is not stored.
+
+        Returns:
+        The stored value, or default.
+        """
+        connection = self._connection()
+        text = json.dumps(key)
+        row = connection.execute('SELECT value, accessed FROM entries WHERE key = ?', (text,)).fetchone()
+        if row is None:
+            return default
+        try:
+            value = pickle.loads(row[0])
+        except Exception:
+            # Written by another version of the code, compute it again
+            return default
+        now = time.time()
+        if now - row[1] >= self.touch_interval:
+            with self._lock:
+                self._touches[text] = now
+                due = now - self._flushed >= self.touch_interval
+            if due:
+                self.flush()
+        return value
+
+    def _take_touches(self):
+        with self._lock:
+            touches, self._touches = self._touches, {}
+            self._flushed = time.time()
+        # Never move an access time back, another process may have written a later one
+        return [(accessed, text, accessed) for text, accessed in touches.items()]
+
+    def flush(self):
+        """
+        Writes the access times of the values read since the last write in one transaction.
+        """
+        touches = self._take_touches()
+        if not touches:
+            return
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany('UPDATE entries SET accessed = ? WHERE key = ? AND accessed < ?', touches)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the stored value of a key, or computes, stores and returns it when the key is not stored.
+
+        Parameters:
+        key (tuple):            The key of the value.
+        compute (callable):     A function without arguments that computes the value.
+
+        Returns:
+        The stored or computed value.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            self._count('hits')
+            return value
+
+        self._count('misses')
+        value = compute()
+        self.put_many([(key, value)])
+        return value
+
+    def put_many(self, items):
+        """
+        Stores many values in one transaction, e.g. the results of a warm-up, and evicts the least recently used entries
+        when the cache grows beyond maxbytes.
+
+        Parameters:
+        items (iterable of tuple): The (key, value) pairs to store.
+        """
+        now = time.time()
+        rows = []
+        for key, value in items:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((json.dumps(key), data, len(data), now))
+
+        connection = self._connection()
+        touches = self._take_touches()
+        # Take the write lock at the start, so two processes never both read the size and then both evict
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # The pending access times go first, so the eviction sees which values were read recently
+            connection.executemany('UPDATE entries SET accessed = ? WHERE key = ? AND accessed < ?', touches)
+            connection.executemany('INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)', rows)
+            evicted = connection.execute(
+                'DELETE FROM entries WHERE key IN ('
+                '  SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS total FROM entries) WHERE total > ?'
+                ')',
+                (self.maxbytes,),
+            ).rowcount
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._count('evictions', evicted)
+
+    def clear(self):
+        """
+        Removes all entries, the counters are kept.
+        """
+        self._connection().execute('DELETE FROM entries')
+
+    def stats(self):
+        """
+        Returns the number of entries and their size in bytes, and the hits, misses and evictions of this process.
+
+        Returns:
+        dict: The statistics of the cache.
+        """
+        size, nbytes = self._connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        with self._lock:
+            return {
+                'size': size, 'bytes': nbytes, 'maxbytes': self.maxbytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+            }
+
+
+class TieredCache:
+    """
+    Combines a fast cache with a slower, larger one: a miss in the first is looked up in the second before it is computed.
+    """
+
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    def get_or_compute(self, key, compute):
+        return self.first.get_or_compute(key, lambda: self.second.get_or_compute(key, compute))
+
+    def stats(self):
+        return {'first': self.first.stats(), 'second': self.second.stats()}
@@ -0,0 +1,375 @@
+"""
+Consistency checks of the engine and the refresh of the store, run in CI next to the import time check:
+
+    python checks.py
+
+The checks work on a temporary copy of the data, on generated data or on the csv files only, so the store and cache
+of the app are not touched. The cubes, the form and the goal timing are compared with the same numbers counted from
+the rows for seeded random filters, so a failure can be run again. The run prints a line per failed check and exits with status 1 when one fails.
+"""
+from functools import cache
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from cache import DiskCache, NullCache
+from engine import (
+    GOAL_BUCKETS, RESULTS_SCHEMA, Engine, calculate_team_stats, cube_cells, cube_games_per_tournament, cube_team_stats,
+    cube_win_percentage_per_year, filter_dataframe, goal_timing, team_form, team_won, top_counts,
+)
+from ingest import ingest
+from refresh import SOURCE_TABLES, DirectorySource, refresh
+from store import DATA_DIR, TABLES, initial_manifest, load_tables, read_csv_tables, read_manifest, write_manifest, write_store
+
+
+def build_store(data_dir, store_dir):
+    """
+    Copies the csv files into data_dir and imports them into a new store in store_dir, like `python store.py`.
+    """
+    os.makedirs(data_dir)
+    for name in TABLES:
+        shutil.copyfile(os.path.join(DATA_DIR, f'{name}.csv'), os.path.join(data_dir, f'{name}.csv'))
+    tables = read_csv_tables(data_dir)
+    write_store(tables, store_dir)
+    write_manifest(initial_manifest(tables), store_dir)
+
+
+def load_engine(data_dir, store_dir, cache):
+    manifest = read_manifest(store_dir)
+    return Engine(load_tables(data_dir, store_dir), version=manifest['version'], cache=cache, manifest=manifest)
+
+
+@cache
+def csv_engine():
+    """
+    Builds the engine on the csv files once, for the checks that only read it.
+    """
+    return Engine(read_csv_tables(DATA_DIR), cache=NullCache())
+
+
+def random_filters(rng, engine):
+    """
+    Draws a team with a selection of the sidebar: up to two of its tournaments, up to three of its opponents and, seven
+    times out of ten, a year range within the years it played.
+
+    Returns:
+    tuple: The team, the tournaments, the opponents and the year range, None for a filter that is not set.
+    """
+    team = str(rng.choice(engine.teams()))
+    options = engine.options(team)
+    tournaments = rng.choice(options['tournaments'], size=min(int(rng.integers(0, 3)), len(options['tournaments'])), replace=False)
+    opponents = rng.choice(options['opponents'], size=min(int(rng.integers(0, 4)), len(options['opponents'])), replace=False)
+    years = None
+    if rng.random() < 0.7:
+        years = tuple(sorted(int(year) for year in rng.integers(options['min_year'], options['max_year'] + 1, size=2)))
+    return team, [str(name) for name in tournaments] or None, [str(name) for name in opponents] or None, years
+
+
+def check_refresh_keeps_cached_results():
+    """
+    Refreshes a copy of the store with one changed score. The cached summaries of the teams that did not play the match
+    should still be found in the on-disk cache (and be right), those of the two teams that did should be computed again.
+
+    Returns:
+    list of str: The failures.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        data_dir, store_dir, source_dir = (os.path.join(directory, name) for name in ['data', 'store', 'source'])
+        build_store(data_dir, store_dir)
+
+        # The source has the same files, with one more home goal in the last played match
+        os.makedirs(source_dir)
+        for name in SOURCE_TABLES:
+            shutil.copyfile(os.path.join(data_dir, f'{name}.csv'), os.path.join(source_dir, f'{name}.csv'))
+        df_results = pd.read_csv(os.path.join(source_dir, 'results.csv'))
+        row = df_results['home_score'].last_valid_index()
+        df_results.loc[row, 'home_score'] += 1
+        df_results.to_csv(os.path.join(source_dir, 'results.csv'), index=False)
+        touched = [df_results.loc[row, 'home_team'], df_results.loc[row, 'away_team']]
+        untouched = [team for team in ['Netherlands', 'Brazil', 'Japan'] if team not in touched]
+
+        cache_path = os.path.join(store_dir, 'cache.sqlite')
+        before = load_engine(data_dir, store_dir, DiskCache(cache_path, schema=RESULTS_SCHEMA))
+        for team in touched + untouched:
+            before.team_summary(team)
+
+        refresh(DirectorySource(source_dir), data_dir, store_dir)
+        after = load_engine(data_dir, store_dir, DiskCache(cache_path, schema=RESULTS_SCHEMA))
+        uncached = load_engine(data_dir, store_dir, NullCache())
+
+        failures = []
+        for team in touched + untouched:
+            hits = after.cache.hits
+            summary = after.team_summary(team)
+            cached = after.cache.hits > hits
+            if cached != (team in untouched):
+                failures.append(f'the summary of {team} was {"" if cached else "not "}served from the cache after the refresh')
+            if summary.stats != uncached.team_summary(team).stats:
+                failures.append(f'the summary of {team} after the refresh differs from a new computation')
+        return failures
+
+
+def check_top_counts_ties():
+    """
+    Checks on random counts with many ties that top_counts returns the same scorers as a full sort on the count (most
+    first) and the code, so a tie at the n-th place is broken by code and every page ranks the scorers the same way.
+
+    Returns:
+    list of str: The failures.
+    """
+    rng = np.random.default_rng(0)
+    for _ in range(1000):
+        counts = rng.integers(0, 4, size=rng.integers(1, 50))
+        n = int(rng.integers(1, 15))
+        order = np.lexsort((np.arange(len(counts)), -counts))
+        expected = order[counts[order] > 0][:n]
+        found = top_counts(counts, pd.Index(np.arange(len(counts))), n)['scorer'].to_numpy()
+        if not np.array_equal(found, expected):
+            return [f'top_counts of {counts.tolist()} with n={n} returned the codes {found.tolist()} instead of {expected.tolist()}']
+    return []
+
+
+def check_ingest_matches_store():
+    """
+    Folds the csv files in small chunks with ingest.py and compares the outcome and scorer cubes with the statistics and
+    top scorers the engine computes from the same files, for a few teams over all years and over a year range. The
+    scorers are compared by their counts, the names of tied scorers can differ since ingest numbers them in file order.
+
+    Returns:
+    list of str: The failures.
+    """
+    aggregates = ingest(DATA_DIR, chunksize=10_000, progress=lambda *args: None)
+    outcomes, scorers = aggregates['outcomes'], aggregates['scorers']
+    engine = csv_engine()
+
+    failures = []
+    for team in ['Netherlands', 'Brazil', 'Fiji', 'Japan']:
+        for years in [None, (1980, 2024)]:
+            if cube_team_stats(cube_cells(outcomes, team, year_range=years)) != cube_team_stats(cube_cells(engine.cube, team, year_range=years)):
+                failures.append(f'the ingested statistics of {team} in {years} differ from the store')
+            cells = cube_cells(scorers, team, year_range=years)
+            counts = np.bincount(cells['scorer'].to_numpy(), weights=cells['goals'].to_numpy(), minlength=len(scorers['scorers']))
+            top = top_counts(counts.astype(np.int64), scorers['scorers'], 10)
+            if top['counts'].tolist() != engine.team_summary(team, years=years).top_scorers['counts'].tolist():
+                failures.append(f'the ingested top scorers of {team} in {years} differ from the store')
+    return failures
+
+
+def check_compare_skips_unmatched_goals():
+    """
+    Compares the top scorers of compare_teams with those of the team summaries when the goals of one team have no match
+    (match_id -1, as assign_match_ids leaves goals it cannot place). The goal key of such a goal equals that of the last
+    match of the team before it, so the first team plays the last match of the results and the second team has the
+    goals without a match.
+
+    Returns:
+    list of str: The failures.
+    """
+    tables = read_csv_tables(DATA_DIR)
+    df_results = tables['results']
+    # Only keep the results up to the last played match, so the last match id belongs to a played match
+    tables['results'] = df_results = df_results.iloc[:df_results['home_score'].last_valid_index() + 1]
+    first = str(df_results['home_team'].iloc[-1])
+    second = next(team for team in ['Brazil', 'Germany'] if team != first)
+    df_goals = tables['goalscorers']
+    df_goals.loc[df_goals['team'] == second, 'match_id'] = -1
+    engine = Engine(tables, cache=NullCache())
+
+    failures = []
+    compared = engine.compare([first, second])['top_scorers']
+    for team in [first, second]:
+        found = compared[compared['team'] == team][['scorer', 'counts']].astype({'scorer': str}).reset_index(drop=True)
+        expected = engine.team_summary(team).top_scorers.astype({'scorer': str}).reset_index(drop=True)
+        if not found.equals(expected):
+            failures.append(f'compare_teams counted other top scorers for {team} than its summary: {found.to_dict("records")} != {expected.to_dict("records")}')
+    return failures
+
+
+def check_cube_matches_filtered_rows():
+    """
+    Compares the statistics, the win percentage per year and the games per tournament from the outcome cube with those
+    of the rows filter_dataframe selects, for random filters of the sidebar.
+
+    Returns:
+    list of str: The failures.
+    """
+    engine = csv_engine()
+    rng = np.random.default_rng(0)
+    failures = []
+    for _ in range(150):
+        team, tournaments, opponents, years = random_filters(rng, engine)
+        try:
+            df = filter_dataframe(engine.df_results, home_team=team, tournaments=tournaments, opponents=opponents, year_range=years)
+        except ValueError:
+            continue
+        cells = cube_cells(engine.cube, team, tournaments=tournaments, opponents=opponents, year_range=years)
+        selection = f'{team} with {tournaments}, {opponents} and {years}'
+
+        expected = {name: int(value) for name, value in calculate_team_stats(df, team).items()}
+        found = {name: int(value) for name, value in cube_team_stats(cells).items()}
+        if found != expected:
+            failures.append(f'the cube statistics of {selection} are {found} instead of {expected}')
+
+        expected = [(int(year), round(len(team_won(matches, team)) / len(matches) * 100, 1)) for year, matches in df.groupby(df['date'].dt.year)]
+        per_year = cube_win_percentage_per_year(cells)
+        found = list(zip(per_year['Year'].tolist(), per_year['Win Percentage'].tolist()))
+        if found != expected:
+            failures.append(f'the cube win percentage per year of {selection} differs from the filtered rows')
+
+        expected = df['tournament'].astype(str).value_counts().to_dict()
+        per_tournament = cube_games_per_tournament(engine.cube, cells)
+        found = {str(name): int(count) for name, count in zip(per_tournament['tournament'], per_tournament['count']) if count}
+        if found != expected:
+            failures.append(f'the cube games per tournament of {selection} are {found} instead of {expected}')
+        if len(failures) >= 5:
+            break
+    return failures
+
+
+def form_record(goals_for, goals_against):
+    """
+    Sums the record of a list of matches like window_record.
+    """
+    games = len(goals_for)
+    wins = int((goals_for > goals_against).sum())
+    return {
+        'games': games, 'wins': wins, 'draws': int((goals_for == goals_against).sum()), 'losses': int((goals_for < goals_against).sum()),
+        'goals_for': int(goals_for.sum()), 'goals_against': int(goals_against.sum()),
+        'win_percentage': round(wins / games * 100, 1) if games else None,
+    }
+
+
+def longest_and_current_run(flags):
+    """
+    Walks the flags and returns the length of the run of True flags at the end and of the longest run.
+    """
+    current = longest = 0
+    for flag in flags:
+        current = current + 1 if flag else 0
+        longest = max(longest, current)
+    return current, longest
+
+
+def check_team_form():
+    """
+    Compares team_form with the records and streaks walked over the played matches of the team in date order, for random
+    teams and year ranges.
+
+    Returns:
+    list of str: The failures.
+    """
+    engine = csv_engine()
+    df_results = engine.df_results
+    played = df_results[df_results['home_score'].notna() & df_results['away_score'].notna()].sort_values('date', kind='stable')
+    rng = np.random.default_rng(0)
+    failures = []
+    for _ in range(100):
+        team, _, _, years = random_filters(rng, engine)
+        matches = played[(played['home_team'] == team) | (played['away_team'] == team)]
+        if years:
+            matches = matches[matches['date'].dt.year.between(*years)]
+        home = (matches['home_team'] == team).to_numpy()
+        goals_for = np.where(home, matches['home_score'], matches['away_score'])
+        goals_against = np.where(home, matches['away_score'], matches['home_score'])
+        match_years = matches['date'].dt.year.to_numpy()
+        last_year = years[1] if years else (int(match_years[-1]) if len(matches) else None)
+
+        expected = {'games': len(matches), 'last_matches': {}, 'last_years': {}}
+        for n in (5, 10, 20):
+            expected['last_matches'][n] = form_record(goals_for[-n:], goals_against[-n:])
+        for n in (1, 4):
+            # The matches are within the range already, so the window only needs its first year
+            within = match_years > last_year - n if last_year is not None else np.zeros(len(matches), dtype=bool)
+            expected['last_years'][n] = form_record(goals_for[within], goals_against[within])
+        for name, flags in [('win', goals_for > goals_against), ('unbeaten', goals_for >= goals_against)]:
+            expected[f'current_{name}_streak'], expected[f'longest_{name}_streak'] = longest_and_current_run(flags)
+
+        found = team_form(engine.form, team, years)
+        if found != expected:
+            failures.append(f'the form of {team} in {years} is {found} instead of {expected}')
+        if len(failures) >= 5:
+            break
+    return failures
+
+
+def check_goal_timing():
+    """
+    Compares goal_timing from the goal cube with the goals of the team and of its opponents counted from the goalscorers
+    table, for random filters of the sidebar. The tournament of a goal is that of its match, the year that of its date.
+
+    Returns:
+    list of str: The failures.
+    """
+    engine = csv_engine()
+    df_goals = engine.df_goals.astype({'home_team': str, 'away_team': str, 'team': str})
+    match_ids = df_goals['match_id'].to_numpy()
+    tournaments_per_match = engine.df_results['tournament'].astype(str).to_numpy()
+    df_goals['tournament'] = np.where(match_ids >= 0, tournaments_per_match[np.maximum(match_ids, 0)], None)
+    # The buckets of GOAL_BUCKETS as minute intervals, minute 0 or less counts as the first and after 90 as the last
+    edges = [-np.inf, 15, 30, 45, 60, 75, 90, np.inf]
+
+    rng = np.random.default_rng(0)
+    failures = []
+    for _ in range(150):
+        team, tournaments, opponents, years = random_filters(rng, engine)
+        at_home, away = df_goals['home_team'] == team, df_goals['away_team'] == team
+        scored = df_goals[(df_goals['team'] == team) & (at_home | away)]
+        scored = scored.assign(opponent=np.where(scored['home_team'] == team, scored['away_team'], scored['home_team']))
+        conceded = df_goals[(at_home & (df_goals['team'] == df_goals['away_team'])) | (away & (df_goals['team'] == df_goals['home_team']))]
+        conceded = conceded.assign(opponent=conceded['team'])
+
+        def select(goals):
+            if tournaments:
+                goals = goals[goals['tournament'].isin(tournaments)]
+            # Like filter_team, selecting the team itself as opponent keeps all of its goals
+            if opponents and team not in opponents:
+                goals = goals[goals['opponent'].isin(opponents)]
+            if years:
+                goals = goals[goals['date'].dt.year.between(*years)]
+            return goals
+
+        def per_bucket(goals):
+            buckets = pd.cut(goals['minute'].dropna(), edges, labels=GOAL_BUCKETS)
+            return buckets.value_counts().reindex(GOAL_BUCKETS).astype(int).tolist()
+
+        def share(part, goals):
+            return round(int(goals[part].sum()) / len(goals) * 100, 1) if len(goals) else None
+
+        scored, conceded = select(scored), select(conceded)
+        expected = {
+            'Scored': per_bucket(scored), 'Conceded': per_bucket(conceded), 'goals': len(scored), 'conceded': len(conceded),
+            'penalty_share': share('penalty', scored), 'own_goal_share': share('own_goal', scored),
+            'penalty_share_conceded': share('penalty', conceded), 'own_goal_share_conceded': share('own_goal', conceded),
+        }
+        timing = goal_timing(cube_cells(engine.goal_cube, team, tournaments=tournaments, opponents=opponents, year_range=years))
+        found = {'Scored': timing['minutes']['Scored'].tolist(), 'Conceded': timing['minutes']['Conceded'].tolist(), **timing['shares']}
+        if found != expected:
+            failures.append(f'the goal timing of {team} with {tournaments}, {opponents} and {years} is {found} instead of {expected}')
+        if len(failures) >= 5:
+            break
+    return failures
+
+
+CHECKS = [
+    check_refresh_keeps_cached_results, check_top_counts_ties, check_ingest_matches_store, check_compare_skips_unmatched_goals,
+    check_cube_matches_filtered_rows, check_team_form, check_goal_timing,
+]
+
+
+def main():
+    failures = []
+    for check in CHECKS:
+        found = check()
+        print(f'{check.__name__}: {"FAILED" if found else "ok"}')
+        failures += found
+    for failure in failures:
+        print(f'FAILED: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
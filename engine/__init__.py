@@ -0,0 +1,444 @@
+"""
+The data engine of the dashboard, without any dependency on Streamlit.
+
+The functions work on the typed tables of the store and are split by feature over the modules of this package:
+the team index (index), the filters (filters), the outcome cube (cubes), head-to-head records (h2h), Elo ratings
+(ratings), goal timing and shootouts (goals), form (form), venues (venues), the world map (maps) and the team
+comparison (compare). They are all imported here, so `from engine import ...` finds every one of them.
+
+The Engine class bundles the tables with their indexes and cubes and answers the queries of the dashboard,
+e.g. team_summary, through a pluggable cache.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+import hashlib
+import json
+
+import pandas as pd
+import numpy as np
+
+from cache import DiskCache, LRUCache, TieredCache
+from instrument import span
+from store import CACHE_PATH, load_tables, read_manifest, read_ratings
+from .encoding import column_codes, encode, encode_one, team_codes
+from .index import build_metadata, build_team_index, first_seen, index_rows, inverted_index, team_goals, team_matches
+from .filters import (
+    filter_dataframe, filter_key, filter_team, filter_tournament, filter_years, team_mask, tournament_mask, years_mask,
+)
+from .stats import calculate_team_stats, count_top_scorers, team_won, top_counts
+from .history import HISTORY_COLUMNS, OUTCOMES, history_page, match_history, match_outcomes
+from .cubes import (
+    CUBE_COLUMNS, build_outcome_cube, cells_mask, combine_cells, cube_cells, cube_from_cells, cube_games_per_tournament,
+    cube_team_stats, cube_win_percentage_per_year, outcome_cells,
+)
+from .h2h import (
+    build_head_to_head, head_to_head_matrix, head_to_head_record, opponent_records, pair_sums, prefix_sums, range_sums,
+    record_frame,
+)
+from .ratings import (
+    ELO_HOME_ADVANTAGE, ELO_K, ELO_START, build_ratings, elo_k, elo_matches, play_matches, rating_per_year, ratings_at,
+)
+from .goals import (
+    GOAL_BUCKETS, GOAL_COLUMNS, SHOOTOUT_COLUMNS, build_goal_cube, build_shootout_cube, count_cells, goal_timing,
+    match_tournaments, shootout_record, shootout_table,
+)
+from .form import FORM_COLUMNS, build_form, form_span, rolling_win_rate, run_lengths, team_form, window_record
+from .venues import VENUES, VENUE_COLUMNS, build_venue_cube, venue_cells, venue_countries, venue_records, venue_splits
+from .maps import (
+    WIN_RATIO_COLORS, get_win_ratio, point_features, render_map, team_perspective, team_records, venue_geojson,
+    win_ratio_geojson,
+)
+from .compare import compare_teams, gather_ranges
+
+
+def frame_records(df: pd.DataFrame):
+    """
+    Converts a DataFrame to a list of JSON-serializable records, with dates in ISO format.
+    """
+    return json.loads(df.to_json(orient='records', date_format='iso'))
+
+
+# The first year of the year range the dashboard starts with
+DEFAULT_START_YEAR = 1980
+# The schema of the results in the on-disk cache, increase it when the result of a query changes shape
+RESULTS_SCHEMA = 1
+
+
+def combine_versions(versions):
+    """
+    Combines the versions of the teams or years a result depends on into the version of its cache key.
+
+    Parameters:
+    versions (dict):    The version per team or year, see the manifest of the store.
+
+    Returns:
+    str: The version when they are all the same (e.g. right after `python store.py`, so the keys stay the same as
+         those of the whole dataset), otherwise a short hash of all of them. None when there are no versions.
+    """
+    distinct = set(versions.values())
+    if len(distinct) <= 1:
+        return next(iter(distinct), None)
+    text = '|'.join(f'{name}:{version}' for name, version in sorted(versions.items()))
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def default_cache(version, path=CACHE_PATH):
+    """
+    Creates the cache of the app: an LRUCache in memory in front of the on-disk cache that warmup.py fills.
+
+    Parameters:
+    version (str):  The dataset version, without one (the store is not built) the results only stay in memory,
+                    since they could not be told apart from those of another dataset.
+    path (str):     The path of the SQLite file of the on-disk cache.
+    """
+    memory = LRUCache(maxsize=512)
+    if version is None:
+        return memory
+    return TieredCache(memory, DiskCache(path, schema=RESULTS_SCHEMA))
+
+
+@dataclass
+class TeamSummary:
+    """
+    The sections at the top of the dashboard for one team and one set of filters.
+    The sections further down are separate queries, see Engine.games_per_tournament and Engine.win_ratio_map.
+    """
+    team: str
+    tournaments: tuple
+    opponents: tuple
+    years: tuple
+    stats: dict                             # wins, losses, draws and total_games
+    win_percentage_per_year: pd.DataFrame   # Year, Win Percentage and Type ('Filtered' or 'Total')
+    top_scorers: pd.DataFrame               # scorer and counts
+    last_matches: pd.DataFrame              # the ten most recent played matches, with their original index
+
+    def to_dict(self):
+        """
+        Converts the summary to a JSON-serializable dictionary.
+        """
+        return {
+            'team': self.team,
+            'tournaments': list(self.tournaments),
+            'opponents': list(self.opponents),
+            'years': list(self.years) if self.years else None,
+            'stats': {key: int(value) for key, value in self.stats.items()},
+            'win_percentage_per_year': frame_records(self.win_percentage_per_year),
+            'top_scorers': frame_records(self.top_scorers),
+            'last_matches': frame_records(self.last_matches.drop(columns='match_id')),
+        }
+
+
+class Engine:
+    """
+    The tables of one dataset version with their indexes and cubes, answering the queries of the dashboard.
+
+    Results are cached in `cache`, any object with a get_or_compute(key, compute) method can be plugged in (see cache.py).
+    The keys start with the query name and the version of the data the result depends on: the versions of its teams
+    (see team_version) or of its years (see years_version) in the manifest. A refresh of the store therefore only
+    invalidates the results of the teams and years it touched, and one cache can be shared between engines.
+    """
+
+    def __init__(self, tables, version=None, cache=None, ratings=None, manifest=None):
+        self.version = version
+        # The version at which every team and year last changed, empty when the store is not built
+        self.team_versions = manifest['teams'] if manifest else {}
+        self.year_versions = manifest['years'] if manifest else {}
+        self.df_goals = tables['goalscorers']
+        self.df_results = tables['results']
+        self.df_shootouts = tables['shootouts']
+        self.df_locations = tables['country_coords']
+        self.index = build_team_index(self.df_results, self.df_goals)
+        self.cube = build_outcome_cube(self.df_results)
+        self.metadata = build_metadata(self.df_results, self.index)
+        self.h2h = build_head_to_head(self.cube)
+        self.goal_cube = build_goal_cube(self.df_goals, self.df_results)
+        self.shootout_cube = build_shootout_cube(self.df_shootouts, self.df_results)
+        self.form = build_form(self.df_results)
+        self.venue_cube = build_venue_cube(self.df_results)
+        # The coordinates per country, joined to the venues of a team without copying the locations table every time
+        self.locations = self.df_locations.set_index('country')[['lat', 'lon']]
+        self.elo = elo_matches(self.df_results)
+        # The checkpoints of the store when given, otherwise all matches are replayed once
+        self.ratings = ratings if ratings is not None else build_ratings(self.elo)
+        self.cache = cache if cache is not None else default_cache(version)
+
+    @classmethod
+    def load(cls, cache=None):
+        """
+        Loads the engine from the store (or the csv files when the store is not built).
+
+        Parameters:
+        cache (optional):   The cache for the query results, see default_cache when not given.
+        """
+        manifest = read_manifest()
+        return cls(load_tables(), version=manifest['version'], cache=cache, ratings=read_ratings(manifest['version']), manifest=manifest)
+
+    def team_version(self, *teams):
+        """
+        Returns the version of the matches of one or more teams, it only changes when a refresh touches one of their matches.
+        Falls back to the dataset version for teams that are not in the manifest.
+        """
+        return combine_versions({str(team): self.team_versions.get(str(team), self.version) for team in teams})
+
+    def years_version(self, years=None):
+        """
+        Returns the version of the matches within a year range (all years when not given), it only changes when a refresh
+        touches a match in one of those years. Falls back to the dataset version without a manifest.
+        """
+        start, end = years if years else (-np.inf, np.inf)
+        versions = {year: version for year, version in self.year_versions.items() if start <= int(year) <= end}
+        return combine_versions(versions) or self.version
+
+    def cached(self, query, version, key, compute):
+        # Recorded as a span when instrumentation is on, a hit when the value did not have to be computed
+        with span(query, cache='hit') as fields:
+            def miss():
+                fields['cache'] = 'miss'
+                return compute()
+            return self.cache.get_or_compute((query, version) + key, miss)
+
+    def teams(self):
+        """
+        Returns the sorted names of all teams that played a home match.
+        """
+        return self.metadata['teams']
+
+    def options(self, team):
+        """
+        Returns the filter options of a team: its tournaments and opponents and the range of years it played in.
+
+        Parameters:
+        team (str): The team to get the options for.
+
+        Returns:
+        dict: The tournaments, opponents, min_year and max_year, shared with other callers so it should be treated as read-only.
+
+        Raises:
+        KeyError: If the team did not play any match.
+        """
+        return self.metadata['options'][team]
+
+    def default_years(self, team):
+        """
+        Returns the year range the dashboard starts with: from DEFAULT_START_YEAR, or the first year of the team when that is later.
+        """
+        options = self.options(team)
+        return max(DEFAULT_START_YEAR, options['min_year']), options['max_year']
+
+    def filtered_matches(self, team, tournaments=None, opponents=None, years=None):
+        """
+        Returns the played matches of a team that pass the filters, see filter_dataframe.
+        """
+        key = filter_key(team, tournaments, opponents, years)
+        return self.cached('filtered_matches', self.team_version(team), key, lambda: filter_dataframe(
+            team_matches(self.df_results, self.index, team), home_team=team, tournaments=tournaments, opponents=opponents, year_range=years
+        ))
+
+    def team_summary(self, team, tournaments=None, opponents=None, years=None):
+        """
+        Answers all sections of the dashboard for one team and one set of filters.
+
+        Parameters:
+        team (str):                             The team to summarize.
+        tournaments (list of str, optional):    The tournaments to filter by.
+        opponents (list of str, optional):      The opponents to filter by.
+        years (tuple, optional):                A tuple specifying the start and end years (inclusive) to filter by.
+
+        Returns:
+        TeamSummary: The summary, shared with other callers so it should be treated as read-only.
+
+        Raises:
+        ValueError: If the team or opponents are not present within the filtered matches, see filter_dataframe.
+        """
+        key = filter_key(team, tournaments, opponents, years)
+        return self.cached('team_summary', self.team_version(team), key, lambda: self._team_summary(team, tournaments, opponents, years))
+
+    def _team_summary(self, team, tournaments, opponents, years):
+        df_filtered = self.filtered_matches(team, tournaments, opponents, years)
+        cells = cube_cells(self.cube, team, tournaments=tournaments, opponents=opponents, year_range=years)
+
+        win_percentage_per_year = pd.concat([
+            cube_win_percentage_per_year(cells).assign(Type='Filtered'),
+            cube_win_percentage_per_year(cube_cells(self.cube, team, year_range=years)).assign(Type='Total'),
+        ], ignore_index=True)
+
+        last_matches = df_filtered.sort_values(by='date', ascending=False)
+        last_matches = last_matches[last_matches['date'] <= datetime.now()].head(10)
+
+        _, tournaments, opponents, years = filter_key(team, tournaments, opponents, years)
+        return TeamSummary(
+            team=team,
+            tournaments=tournaments,
+            opponents=opponents,
+            years=years,
+            stats=cube_team_stats(cells),
+            win_percentage_per_year=win_percentage_per_year,
+            top_scorers=count_top_scorers(team_goals(self.df_goals, self.index, team), df_filtered['match_id'], n=10),
+            last_matches=last_matches,
+        )
+
+    def match_history(self, team, tournaments=None, opponents=None, years=None, sort_by='date', ascending=False, page=1, page_size=25):
+        """
+        Returns one page of the played matches of a team that pass the filters, sorted over all of them, see history_page.
+        The history itself is cached per filter, every page and sort order is taken from it.
+        """
+        key = filter_key(team, tournaments, opponents, years)
+        history = self.cached('match_history', self.team_version(team), key, lambda: match_history(self.filtered_matches(team, tournaments, opponents, years), team))
+        return history_page(history, sort_by=sort_by, ascending=ascending, page=page, page_size=page_size)
+
+    def games_per_tournament(self, team, tournaments=None, opponents=None, years=None):
+        """
+        Returns the number of played matches per tournament of a team that pass the filters.
+
+        Returns:
+        pd.DataFrame: The tournament and count, the most played tournament first.
+        """
+        key = filter_key(team, tournaments, opponents, years)
+        return self.cached('games_per_tournament', self.team_version(team), key, lambda: cube_games_per_tournament(
+            self.cube, cube_cells(self.cube, team, tournaments=tournaments, opponents=opponents, year_range=years)
+        ))
+
+    def win_ratios(self, team, tournaments=None, opponents=None, years=None):
+        """
+        Returns the win ratio of a team against every country in the matches that pass the filters, see get_win_ratio.
+        """
+        key = filter_key(team, tournaments, opponents, years)
+        return self.cached('win_ratios', self.team_version(team), key, lambda: get_win_ratio(
+            self.filtered_matches(team, tournaments, opponents, years), self.df_locations, team
+        ))
+
+    def head_to_head(self, team, opponent, tournaments=None, years=None):
+        """
+        Returns the record of a team against one opponent, see head_to_head_record.
+        """
+        key = filter_key(team, tournaments, opponent, years)
+        return self.cached('head_to_head', self.team_version(team), key, lambda: head_to_head_record(self.h2h, team, opponent, tournaments, years))
+
+    def opponent_records(self, team, tournaments=None, years=None):
+        """
+        Returns the record of a team against every opponent it played, see opponent_records.
+        """
+        key = filter_key(team, tournaments, None, years)
+        return self.cached('opponent_records', self.team_version(team), key, lambda: opponent_records(self.h2h, team, tournaments, years))
+
+    def head_to_head_matrix(self, teams, value='wins', tournaments=None, years=None):
+        """
+        Returns a team by team matrix of one value of the head-to-head records, see head_to_head_matrix.
+        """
+        # The order of the teams is kept, it is the order of the rows and columns
+        key = (tuple(teams), value) + filter_key(None, tournaments, None, years)
+        return self.cached('head_to_head_matrix', self.team_version(*teams), key, lambda: head_to_head_matrix(self.h2h, teams, value, tournaments, years))
+
+    def compare(self, teams, tournaments=None, opponents=None, years=None, n=10):
+        """
+        Returns the statistics, the win percentage per year and the top scorers of several teams, see compare_teams.
+        """
+        # The order of the teams is kept, it is the order of the rows and the legends
+        key = (tuple(teams), n) + filter_key(None, tournaments, opponents, years)
+        return self.cached('compare', self.team_version(*teams), key, lambda: compare_teams(self.cube, self.index, self.df_results, self.df_goals, teams, tournaments, opponents, years, n))
+
+    def goal_timing(self, team, tournaments=None, opponents=None, years=None):
+        """
+        Returns the goals of a team by minute and its penalty and own goal shares, see goal_timing.
+        """
+        key = filter_key(team, tournaments, opponents, years)
+        return self.cached('goal_timing', self.team_version(team), key, lambda: goal_timing(
+            cube_cells(self.goal_cube, team, tournaments=tournaments, opponents=opponents, year_range=years)
+        ))
+
+    def shootout_record(self, team, tournaments=None, opponents=None, years=None):
+        """
+        Returns the penalty shootout record of a team, see shootout_record.
+        """
+        key = filter_key(team, tournaments, opponents, years)
+        return self.cached('shootout_record', self.team_version(team), key, lambda: shootout_record(
+            cube_cells(self.shootout_cube, team, tournaments=tournaments, opponents=opponents, year_range=years)
+        ))
+
+    def shootout_table(self, tournaments=None, years=None, min_shootouts=1):
+        """
+        Returns the penalty shootout records of all teams, see shootout_table.
+        """
+        key = (min_shootouts,) + filter_key(None, tournaments, None, years)
+        return self.cached('shootout_table', self.years_version(years), key, lambda: shootout_table(self.shootout_cube, tournaments, years, min_shootouts))
+
+    def team_form(self, team, years=None):
+        """
+        Returns the form of a team at the end of the year range: its record over the last 5, 10 and 20 matches and
+        the last 1 and 4 years, and its streaks, see team_form. All matches count, whatever the tournament or opponent.
+        """
+        key = filter_key(team, None, None, years)
+        return self.cached('team_form', self.team_version(team), key, lambda: team_form(self.form, team, years))
+
+    def rolling_win_rate(self, team, window=10, years=None):
+        """
+        Returns the win percentage over the last `window` matches after every match of a team, see rolling_win_rate.
+        """
+        key = (window,) + filter_key(team, None, None, years)
+        return self.cached('rolling_win_rate', self.team_version(team), key, lambda: rolling_win_rate(self.form, team, window, years))
+
+    def rating_per_year(self, team, years=None):
+        """
+        Returns the Elo rating of a team at the end of every year, see rating_per_year.
+        """
+        key = filter_key(team, None, None, years)
+        version = self.years_version((-np.inf, years[1]) if years else None)
+        return self.cached('rating_per_year', version, key, lambda: rating_per_year(self.ratings, team, years))
+
+    def rating_at(self, team, date):
+        """
+        Returns the Elo rating of a team after the matches played up to and including a date.
+
+        Parameters:
+        team (str):             The team.
+        date (datetime-like):   The date.
+
+        Returns:
+        float: The rating, the initial rating for unknown teams.
+        """
+        return float(ratings_at(self.elo, self.ratings, date).get(team, ELO_START))
+
+    def venues(self, team, tournaments=None, opponents=None, years=None):
+        """
+        Returns the record of a team at home, away and on neutral ground and per country it played in.
+
+        Returns:
+        dict: The records per venue type ('splits', see venue_splits) and per country ('countries', see venue_countries).
+        """
+        key = filter_key(team, tournaments, opponents, years)
+
+        def compute():
+            cells = cube_cells(self.venue_cube, team, tournaments=tournaments, opponents=opponents, year_range=years)
+            return {'splits': venue_splits(cells), 'countries': venue_countries(self.venue_cube, cells)}
+        return self.cached('venues', self.team_version(team), key, compute)
+
+    def venue_map(self, team, tournaments=None, opponents=None, years=None):
+        """
+        Returns the markers of the countries a team played in as one GeoJSON layer, see venue_geojson.
+        """
+        key = filter_key(team, tournaments, opponents, years)
+        return self.cached('venue_map', self.team_version(team), key, lambda: venue_geojson(self.venues(team, tournaments, opponents, years)['countries'], self.locations))
+
+    def map_html(self, team, layer='opponents', tournaments=None, opponents=None, years=None):
+        """
+        Returns the world map of a team as HTML, rendered once per layer and filters and then served from the cache.
+
+        Parameters:
+        layer (str):    'opponents' for the win ratio against every country (see win_ratio_map), 'venues' for the record
+                        per country the team played in (see venue_map).
+
+        Raises:
+        ValueError: If the layer is unknown.
+        """
+        layers = {'opponents': self.win_ratio_map, 'venues': self.venue_map}
+        if layer not in layers:
+            raise ValueError(f'Unknown map layer {layer}, choose one of {", ".join(layers)}')
+        key = (layer,) + filter_key(team, tournaments, opponents, years)
+        return self.cached('map_html', self.team_version(team), key, lambda: render_map(layers[layer](team, tournaments, opponents, years)))
+
+    def win_ratio_map(self, team, tournaments=None, opponents=None, years=None):
+        """
+        Returns the markers of the world map as one GeoJSON layer, see win_ratio_geojson.
+        """
+        key = filter_key(team, tournaments, opponents, years)
+        return self.cached('win_ratio_map', self.team_version(team), key, lambda: win_ratio_geojson(self.win_ratios(team, tournaments, opponents, years)))
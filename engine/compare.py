@@ -0,0 +1,118 @@
+"""
+Team comparison.
+
+Several teams are compared in one batched pass instead of a summary per team: the rows of all selected teams are
+gathered from their offsets at once and every team gets a slot. The statistics and the win percentage per year of
+all teams are each one bincount over a key that starts with the slot, and the goals are counted per (slot, scorer)
+in one bincount before the scorers of every team are ranked.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .cubes import CUBE_COLUMNS, cells_mask
+from .encoding import column_codes, encode, encode_one, team_codes
+from .filters import tournament_mask, years_mask
+from .stats import top_counts
+
+
+def gather_ranges(offsets, codes):
+    """
+    Gathers the positions of several codes from a table with offsets per code, e.g. the cells of several teams.
+
+    Parameters:
+    offsets (np.ndarray):   The offsets per code, the rows of code c are offsets[c] to offsets[c + 1].
+    codes (np.ndarray):     The codes to gather.
+
+    Returns:
+    tuple: The positions of the rows and the index in codes they belong to.
+    """
+    starts, lengths = offsets[codes], offsets[codes + 1] - offsets[codes]
+    slots = np.repeat(np.arange(len(codes)), lengths)
+    # The position of every row is the start of its code plus its place within the code
+    firsts = np.cumsum(lengths) - lengths
+    return np.repeat(starts, lengths) + np.arange(lengths.sum()) - np.repeat(firsts, lengths), slots
+
+
+@instrumented
+def compare_teams(cube, index, df_results: pd.DataFrame, df_goals: pd.DataFrame, teams, tournaments=None, opponents=None, year_range=None, n=10):
+    """
+    Calculates the statistics, the win percentage per year and the top scorers of several teams in one batched pass.
+
+    Parameters:
+    cube (dict):                            The outcome cube, see build_outcome_cube.
+    index (dict):                           The team index, see build_team_index.
+    df_results (pd.DataFrame):              The DataFrame containing match data the index was built from.
+    df_goals (pd.DataFrame):                The DataFrame containing the goals the index was built from.
+    teams (list of str):                    The teams to compare, unknown teams are left out.
+    tournaments (list of str, optional):    The tournaments to filter by.
+    opponents (list of str, optional):      The opponents to filter by.
+    year_range (tuple, optional):           A tuple specifying the start and end years (inclusive) to filter by.
+    n (int):                                The number of top scorers per team.
+
+    Returns:
+    dict: The statistics per team ('stats', like cube_team_stats with the goals and the win_percentage), the win
+          percentage per team per year ('win_percentage_per_year', with the columns Team, Year and Win Percentage)
+          and the top scorers per team ('top_scorers', with the columns team, scorer and counts).
+    """
+    teams = [team for team in dict.fromkeys(teams) if encode_one(cube['teams'], team) >= 0]
+    codes = encode(cube['teams'], teams)
+    k = len(teams)
+
+    # Statistics and win percentage per year from the outcome cube
+    positions, slots = gather_ranges(cube['offsets'], codes)
+    cells = cube['cells'].iloc[positions]
+    keep = cells_mask(cube, cells, tournaments, opponents, year_range)
+    cells, slots = cells[keep], slots[keep]
+    sums = {column: np.bincount(slots, weights=cells[column].to_numpy(), minlength=k).astype(int) for column in CUBE_COLUMNS}
+
+    stats = pd.DataFrame({'team': teams, **sums})
+    stats.insert(1, 'total_games', stats['wins'] + stats['draws'] + stats['losses'])
+    stats['win_percentage'] = (stats['wins'] / stats['total_games'].replace(0, np.nan) * 100).round(1)
+
+    years = cells['year'].to_numpy().astype(np.int64)
+    first_year = years.min(initial=0)
+    span = int(years.max(initial=0) - first_year + 1)
+    keys = slots.astype(np.int64) * span + (years - first_year)
+    wins = np.bincount(keys, weights=cells['wins'].to_numpy(), minlength=k * span)
+    games = np.bincount(keys, weights=cells[['wins', 'draws', 'losses']].to_numpy().sum(axis=1), minlength=k * span)
+    played = np.flatnonzero(games)
+    per_year = pd.DataFrame({
+        'Team': np.asarray(teams, dtype=object)[played // span],
+        'Year': (played % span + first_year).astype(int),
+        'Win Percentage': (wins[played] / games[played] * 100).round(1),
+    })
+
+    # Top scorers from the goals of every team within its filtered matches, like count_top_scorers
+    rows, match_slots = gather_ranges(index['results'][1], codes)
+    rows = index['results'][0][rows]
+    matches = df_results.iloc[rows]
+    home_codes, away_codes, _ = team_codes(matches)
+    opponent_codes = np.where(home_codes == codes[match_slots], away_codes, home_codes)
+    mask = matches.notna().all(axis=1).to_numpy().copy()
+    if tournaments:
+        mask &= tournament_mask(matches, tournaments)
+    if opponents:
+        wanted = encode(cube['teams'], opponents)
+        mask &= np.isin(opponent_codes, wanted) | np.isin(codes[match_slots], wanted)
+    if year_range:
+        mask &= years_mask(matches, year_range)
+    n_matches = int(df_results['match_id'].max()) + 1
+    match_keys = match_slots[mask].astype(np.int64) * n_matches + matches['match_id'].to_numpy()[mask]
+
+    goal_rows, goal_slots = gather_ranges(index['goals'][1], codes)
+    goals = df_goals.iloc[index['goals'][0][goal_rows]]
+    scorer_codes, scorers = column_codes(goals['scorer'])
+    goal_match_ids = goals['match_id'].to_numpy()
+    goal_keys = goal_slots.astype(np.int64) * n_matches + goal_match_ids
+    # A goal without a match (match_id -1) would get the key of the last match of the slot before, so it is left out like in count_top_scorers
+    selected = np.isin(goal_keys, match_keys) & (goal_match_ids >= 0) & (scorer_codes >= 0)
+
+    # Count the goals per (slot, scorer) in one pass, then rank the scorers of every slot with top_counts like a single team
+    counts = np.bincount(
+        goal_slots[selected].astype(np.int64) * len(scorers) + scorer_codes[selected], minlength=k * len(scorers)
+    ).reshape(k, len(scorers))
+    frames = [top_counts(counts[slot], scorers, n).assign(team=team) for slot, team in enumerate(teams)]
+    top_scorers = pd.concat(frames, ignore_index=True)[['team', 'scorer', 'counts']] if frames else pd.DataFrame(columns=['team', 'scorer', 'counts'])
+
+    return {'stats': stats, 'win_percentage_per_year': per_year, 'top_scorers': top_scorers}
@@ -0,0 +1,193 @@
+"""
+The outcome cube.
+
+The outcomes of all played matches summed per (team, opponent, tournament, year), with a row per team per match.
+The statistics of the page are answered by summing the cells of one team instead of scanning the matches.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .encoding import column_codes, encode, encode_one, team_codes
+
+
+CUBE_COLUMNS = ['wins', 'draws', 'losses', 'goals_for', 'goals_against']
+
+
+def outcome_cells(df_results: pd.DataFrame):
+    """
+    Sums the outcomes of the played matches per (team, opponent, tournament, year) in one grouped pass.
+
+    Parameters:
+    df_results (pd.DataFrame):  The DataFrame containing match data, matches with missing values are left out like in filter_dataframe.
+
+    Returns:
+    pd.DataFrame: The cells with the team, opponent and tournament codes, the year and the CUBE_COLUMNS, sorted by team.
+    """
+    df = df_results.dropna()  # Drop missing values, e.g. games still to come
+    home_teams, away_teams, _ = team_codes(df)
+    tournaments, _ = column_codes(df['tournament'])
+    years = df['date'].dt.year.to_numpy(dtype=np.int16)
+    home_scores = df['home_score'].to_numpy()
+    away_scores = df['away_score'].to_numpy()
+
+    goals_for = np.concatenate([home_scores, away_scores])
+    goals_against = np.concatenate([away_scores, home_scores])
+    long = pd.DataFrame({
+        'team': np.concatenate([home_teams, away_teams]),
+        'opponent': np.concatenate([away_teams, home_teams]),
+        'tournament': np.concatenate([tournaments, tournaments]),
+        'year': np.concatenate([years, years]),
+        'wins': goals_for > goals_against,
+        'draws': goals_for == goals_against,
+        'losses': goals_for < goals_against,
+        'goals_for': goals_for,
+        'goals_against': goals_against,
+    })
+    return combine_cells([long], CUBE_COLUMNS)
+
+
+def combine_cells(parts, value_columns):
+    """
+    Combines partial cells (e.g. of several chunks of data) by summing the values of equal keys.
+
+    Parameters:
+    parts (list of pd.DataFrame):   The partial cells, with the same key columns and the value columns.
+    value_columns (list of str):    The columns to sum, all other columns are keys.
+
+    Returns:
+    pd.DataFrame: The combined cells, sorted by their keys.
+    """
+    cells = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    keys = [column for column in cells.columns if column not in value_columns]
+    cells = cells.groupby(keys, sort=True)[value_columns].sum()
+    return cells.astype(np.int32).reset_index()
+
+
+def cube_from_cells(cells: pd.DataFrame, teams: pd.Index, **categories):
+    """
+    Creates a cube from cells sorted by team code.
+
+    Parameters:
+    cells (pd.DataFrame):   The cells, with the team code as first key.
+    teams (pd.Index):       The team names the team and opponent codes refer to.
+    categories (pd.Index):  The names other codes in the cells refer to, e.g. tournaments.
+
+    Returns:
+    dict: The cube, with the team names ('teams'), the other names, the cells ('cells') and the offsets of every team in the cells ('offsets').
+    """
+    offsets = np.searchsorted(cells['team'].to_numpy(), np.arange(len(teams) + 1))
+    return {'teams': teams, **categories, 'cells': cells, 'offsets': offsets}
+
+
+def build_outcome_cube(df_results: pd.DataFrame):
+    """
+    Builds the outcome cube from the match data in one grouped pass.
+
+    Parameters:
+    df_results (pd.DataFrame):  The DataFrame containing match data, matches with missing values are left out.
+
+    Returns:
+    dict: The team names ('teams'), the tournament names ('tournaments'), the cells sorted by team ('cells')
+          and the offsets of every team in the cells ('offsets').
+    """
+    _, _, teams = team_codes(df_results)
+    _, tournaments = column_codes(df_results['tournament'])
+    return cube_from_cells(outcome_cells(df_results), teams, tournaments=tournaments)
+
+
+@instrumented(rows='result')
+def cube_cells(cube, team, tournaments=None, opponents=None, year_range=None):
+    """
+    Selects the cells of a team in the outcome cube, with the same filters as filter_dataframe.
+
+    Parameters:
+    cube (dict):                            The outcome cube, see build_outcome_cube.
+    team (str):                             The team to select the cells for.
+    tournaments (list of str, optional):    The tournaments to filter by.
+    opponents (list of str, optional):      The opponents to filter by.
+    year_range (tuple, optional):           A tuple specifying the start and end years (inclusive) to filter by.
+
+    Returns:
+    pd.DataFrame: The selected cells.
+    """
+    team_code = encode_one(cube['teams'], team)
+    if team_code < 0:
+        return cube['cells'].iloc[:0]
+    cells = cube['cells'].iloc[cube['offsets'][team_code]:cube['offsets'][team_code + 1]]
+    return cells[cells_mask(cube, cells, tournaments, opponents, year_range)]
+
+
+def cells_mask(cube, cells: pd.DataFrame, tournaments=None, opponents=None, year_range=None):
+    """
+    Selects the cells of a cube that pass the filters, for the cells of one team or of several teams at once.
+
+    Returns:
+    np.ndarray: A boolean mask that is True for the cells to keep.
+    """
+    mask = np.ones(len(cells), dtype=bool)
+    if tournaments:
+        mask &= np.isin(cells['tournament'].to_numpy(), encode(cube['tournaments'], tournaments))
+    if opponents:
+        wanted = encode(cube['teams'], opponents)
+        # Like filter_team, selecting a team itself as opponent keeps all of its matches
+        mask &= np.isin(cells['opponent'].to_numpy(), wanted) | np.isin(cells['team'].to_numpy(), wanted)
+    if year_range:
+        start, end = year_range
+        years = cells['year'].to_numpy()
+        mask &= (years >= start) & (years <= end)
+    return mask
+
+
+@instrumented
+def cube_team_stats(cells: pd.DataFrame):
+    """
+    Calculates the wins, losses, draws, and total games played from cells of the outcome cube.
+
+    Parameters:
+    cells (pd.DataFrame):   The cells of one team, see cube_cells.
+
+    Returns:
+    dict: A dictionary containing the number of wins, losses, draws, and total games played, like calculate_team_stats.
+    """
+    wins, draws, losses = (cells[column].to_numpy().sum() for column in ['wins', 'draws', 'losses'])
+    return {'wins': wins, 'losses': losses, 'draws': draws, 'total_games': wins + losses + draws}
+
+
+@instrumented
+def cube_win_percentage_per_year(cells: pd.DataFrame):
+    """
+    Calculates the win percentage per year from cells of the outcome cube.
+
+    Parameters:
+    cells (pd.DataFrame):   The cells of one team, see cube_cells.
+
+    Returns:
+    pd.DataFrame: A DataFrame with the columns Year and Win Percentage.
+    """
+    per_year = cells.groupby('year')[['wins', 'draws', 'losses']].sum()
+    games = per_year.sum(axis=1)
+    return pd.DataFrame({
+        'Year': per_year.index.astype(int),
+        'Win Percentage': (per_year['wins'] / games * 100).round(1).to_numpy(),
+    })
+
+
+@instrumented
+def cube_games_per_tournament(cube, cells: pd.DataFrame):
+    """
+    Counts the games played per tournament from cells of the outcome cube.
+
+    Parameters:
+    cube (dict):            The outcome cube, see build_outcome_cube.
+    cells (pd.DataFrame):   The cells of one team, see cube_cells.
+
+    Returns:
+    pd.DataFrame: A DataFrame with the columns tournament and count, sorted from most to least games.
+    """
+    games = cells['wins'] + cells['draws'] + cells['losses']
+    counts = games.groupby(cells['tournament']).sum()
+    return pd.DataFrame({
+        'tournament': cube['tournaments'][counts.index],
+        'count': counts.to_numpy(),
+    }).sort_values(by='count', ascending=False)
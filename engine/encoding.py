@@ -0,0 +1,72 @@
+"""
+Integer encoding of the team, tournament and scorer names.
+
+The store types these columns as categoricals at load time (all team columns share one dtype),
+so filtering compares their small integer codes instead of strings.
+"""
+import pandas as pd
+
+
+def column_codes(series: pd.Series):
+    """
+    Returns the integer codes of a column together with the categories they refer to.
+
+    Parameters:
+    series (pd.Series): A categorical column, other columns are encoded on the fly.
+
+    Returns:
+    tuple: An array with the code per row (-1 for missing values) and a pd.Index with the categories.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    return series.cat.codes.to_numpy(), series.cat.categories
+
+
+def team_codes(df: pd.DataFrame):
+    """
+    Returns the integer codes of the home and away team columns, encoded with the same categories.
+
+    Parameters:
+    df (pd.DataFrame):  The input DataFrame containing match data.
+
+    Returns:
+    tuple: The home team codes, the away team codes and a pd.Index with the team names they refer to.
+    """
+    home_teams, away_teams = df['home_team'], df['away_team']
+    if not (isinstance(home_teams.dtype, pd.CategoricalDtype) and home_teams.dtype == away_teams.dtype):
+        dtype = pd.CategoricalDtype(pd.concat([home_teams, away_teams]).dropna().unique())
+        home_teams, away_teams = home_teams.astype(dtype), away_teams.astype(dtype)
+    return home_teams.cat.codes.to_numpy(), away_teams.cat.codes.to_numpy(), home_teams.cat.categories
+
+
+def encode(categories: pd.Index, values):
+    """
+    Looks up the codes of the given names with a hash lookup, names that are not in the categories are left out.
+
+    Parameters:
+    categories (pd.Index):  The categories of an encoded column.
+    values (list of str):   The names to encode.
+
+    Returns:
+    np.ndarray: The codes of the known names.
+    """
+    codes = categories.get_indexer(list(values))
+    return codes[codes >= 0]
+
+
+def encode_one(categories: pd.Index, value):
+    """
+    Looks up the code of a single name.
+
+    Parameters:
+    categories (pd.Index):  The categories of an encoded column.
+    value (str):            The name to encode.
+
+    Returns:
+    int: The code of the name, or -2 when it is unknown so it never matches a code (missing values are -1).
+    """
+    # get_loc is a single hash lookup, without building an index of the names like encode
+    try:
+        return categories.get_loc(value)
+    except (KeyError, TypeError):
+        return -2
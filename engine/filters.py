@@ -0,0 +1,168 @@
+"""
+Filters of the match data by team, tournament, opponent and year, and the normalized key of a filter.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .encoding import column_codes, encode, team_codes
+
+
+def team_mask(df: pd.DataFrame, teams):
+    """
+    Selects the matches involving the specified teams.
+
+    Parameters:
+    df (pd.DataFrame):              The input DataFrame containing match data.
+    teams (str or list of str):     The team(s) to select. Can be a single team as a string or multiple teams as a list of strings.
+
+    Returns:
+    np.ndarray: A boolean mask that is True for the matches where the specified team(s) played as either the home or away team.
+
+    Raises:
+    ValueError: If the teams parameter is not a string or a list of strings.
+    """
+    if isinstance(teams, str):
+        teams = [teams]
+    if not isinstance(teams, list):
+        raise ValueError("Teams should be a string or a list of strings")
+
+    home_codes, away_codes, categories = team_codes(df)
+    wanted = encode(categories, teams)
+    return np.isin(home_codes, wanted) | np.isin(away_codes, wanted)
+
+def tournament_mask(df: pd.DataFrame, choices):
+    """
+    Selects the matches from the specified tournaments.
+
+    Parameters:
+    df (pd.DataFrame):      The input DataFrame containing match data.
+    choices (list of str):  The list of tournaments to select.
+
+    Returns:
+    np.ndarray: A boolean mask that is True for the matches from the specified tournaments.
+    """
+    tournament_codes, categories = column_codes(df['tournament'])
+    return np.isin(tournament_codes, encode(categories, choices))
+
+def years_mask(df: pd.DataFrame, year_range):
+    """
+    Selects the matches within the specified year range.
+
+    Parameters:
+    df (pd.DataFrame):      The input DataFrame containing match data.
+    year_range (tuple):     A tuple specifying the start and end years (inclusive) to select.
+
+    Returns:
+    np.ndarray: A boolean mask that is True for the matches within the specified year range.
+    """
+    start, end = year_range
+    years = df["date"].dt.year.to_numpy()
+    return (years >= start) & (years <= end)
+
+def filter_team(df: pd.DataFrame, teams):
+    """
+    Filters the DataFrame for matches involving the specified teams.
+
+    Parameters:
+    df (pd.DataFrame):              The input DataFrame containing match data.
+    teams (str or list of str):     The team(s) to filter by. Can be a single team as a string or multiple teams as a list of strings.
+
+    Returns:
+    pd.DataFrame: A DataFrame containing only the matches where the specified team(s) played as either the home or away team.
+
+    Raises:
+    ValueError: If the teams parameter is not a string or a list of strings, or if the teams are not present in the DataFrame.
+    """
+    mask = team_mask(df, teams)
+
+    # An empty selection means none of the teams is present in the DataFrame
+    if mask.any():
+        return df[mask]
+    else:
+        raise ValueError("One or more given teams are not available within the current set of filters")
+
+def filter_tournament(df: pd.DataFrame, choices):    
+    """
+    Filters the DataFrame for matches from the specified tournaments.
+
+    Parameters:
+    df (pd.DataFrame):      The input DataFrame containing match data.
+    choices (list of str):  The list of tournaments to filter by.
+
+    Returns:
+    pd.DataFrame: A DataFrame containing only the matches from the specified tournaments.
+    """
+    return df[tournament_mask(df, choices)]
+
+def filter_years(df: pd.DataFrame, year_range):
+    """
+    Filters the DataFrame for matches within the specified year range.
+
+    Parameters:
+    df (pd.DataFrame):      The input DataFrame containing match data.
+    year_range (tuple):     A tuple specifying the start and end years (inclusive) to filter by.
+
+    Returns:
+    pd.DataFrame: A DataFrame containing only the matches within the specified year range.
+    """
+    return df[years_mask(df, year_range)]
+
+@instrumented
+def filter_dataframe(df: pd.DataFrame, home_team=None, tournaments=None, opponents=None, year_range=None):
+    """
+    Filters the DataFrame based on multiple criteria including home team, tournaments, opponents, and year range.
+    The criteria are combined into one boolean mask, so the DataFrame is sliced only once.
+
+    Parameters:
+    df (pd.DataFrame):                          The input DataFrame containing match data.
+    home_team (str or list of str, optional):   The team(s) to filter by for home matches.
+    tournaments (list of str, optional):        The tournaments to filter by.
+    opponents (str or list of str, optional):   The team(s) to filter by for opponent matches.
+    year_range (tuple, optional):               A tuple specifying the start and end years (inclusive) to filter by.
+
+    Returns:
+    pd.DataFrame: A DataFrame filtered based on the specified criteria.
+
+    Raises:
+    ValueError: If the teams or opponents are not present within the matches selected so far, like filter_team.
+    """
+
+    mask = df.notna().all(axis=1).to_numpy()  # Drop missing values, e.g. games still to come
+    if home_team:
+        mask = mask & team_mask(df, home_team)
+        if not mask.any():
+            raise ValueError("One or more given teams are not available within the current set of filters")
+    if tournaments:
+        mask = mask & tournament_mask(df, tournaments)
+    if opponents:
+        mask = mask & team_mask(df, opponents)
+        if not mask.any():
+            raise ValueError("One or more given teams are not available within the current set of filters")
+    if year_range:
+        mask = mask & years_mask(df, year_range)
+    
+    return df[mask]
+
+def filter_key(home_team=None, tournaments=None, opponents=None, year_range=None):
+    """
+    Normalizes the filter criteria into a hashable key, so the same selection in any order gives the same key.
+
+    Parameters:
+    home_team (str or list of str, optional):   The team(s) to filter by for home matches.
+    tournaments (list of str, optional):        The tournaments to filter by.
+    opponents (str or list of str, optional):   The team(s) to filter by for opponent matches.
+    year_range (tuple, optional):               A tuple specifying the start and end years (inclusive) to filter by.
+
+    Returns:
+    tuple: The normalized (team, tournaments, opponents, year range) key.
+    """
+    def names(values):
+        if not values:
+            return ()
+        if isinstance(values, str):
+            values = [values]
+        return tuple(sorted(set(str(value) for value in values)))
+
+    years = (int(year_range[0]), int(year_range[1])) if year_range else None
+    return (names(home_team), names(tournaments), names(opponents), years)
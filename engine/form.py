@@ -0,0 +1,182 @@
+"""
+The form of a team.
+
+The played matches of every team in date order, concatenated per team with offsets like the team index, with one
+running sum of the wins, draws, losses and goals over all of them. The record over any window of matches or years
+is the difference of two running sums, and the length of the run of wins and of unbeaten matches ending at every
+match is kept next to them, so the form of a team never scans its matches.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .encoding import encode_one, team_codes
+
+
+FORM_COLUMNS = ['wins', 'draws', 'losses', 'goals_for', 'goals_against']
+
+def run_lengths(flags, starts):
+    """
+    Calculates the length of the run of True flags ending at every row, restarting at the start of every segment.
+
+    Parameters:
+    flags (np.ndarray):     The flag per row.
+    starts (np.ndarray):    The first row of every non-empty segment.
+
+    Returns:
+    np.ndarray: The run length per row, 0 where the flag is False.
+    """
+    positions = np.arange(len(flags))
+    # The last row that broke the run, the row before a segment counts as a break for a segment starting with True
+    breaks = np.where(flags, -1, positions)
+    breaks[starts] = np.where(flags[starts], starts - 1, starts)
+    return (positions - np.maximum.accumulate(breaks)).astype(np.int32)
+
+
+def build_form(df_results: pd.DataFrame):
+    """
+    Builds the running sums and runs of the played matches of all teams in date order.
+
+    Parameters:
+    df_results (pd.DataFrame):  The DataFrame containing match data.
+
+    Returns:
+    dict: The team names ('teams'), the offsets of the matches per team ('offsets'), the date per match ('date'),
+          the running sums of FORM_COLUMNS ('sums', where sums[i] is the total of the matches before match i)
+          and the runs of wins ('win_run') and unbeaten matches ('unbeaten_run') ending at every match.
+    """
+    home_codes, away_codes, teams = team_codes(df_results)
+    home_scores = df_results['home_score'].to_numpy(dtype=float)
+    away_scores = df_results['away_score'].to_numpy(dtype=float)
+    dates = df_results['date'].to_numpy()
+    rows = np.arange(len(df_results))
+
+    team = np.concatenate([home_codes, away_codes])
+    goals_for = np.concatenate([home_scores, away_scores])
+    goals_against = np.concatenate([away_scores, home_scores])
+    keep = (team >= 0) & ~np.isnan(goals_for) & ~np.isnan(goals_against)
+    # Per team in date order, matches on the same date in the order of the results table
+    order = np.lexsort((np.concatenate([rows, rows])[keep], np.concatenate([dates, dates])[keep], team[keep]))
+    team, goals_for, goals_against = team[keep][order], goals_for[keep][order], goals_against[keep][order]
+
+    offsets = np.zeros(len(teams) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(team, minlength=len(teams)), out=offsets[1:])
+    starts = offsets[:-1][np.diff(offsets) > 0]
+
+    values = np.column_stack([goals_for > goals_against, goals_for == goals_against, goals_for < goals_against, goals_for, goals_against])
+    sums = np.zeros((len(values) + 1, len(FORM_COLUMNS)), dtype=np.int64)
+    np.cumsum(values.astype(np.int64), axis=0, out=sums[1:])
+
+    return {
+        'teams': teams,
+        'offsets': offsets,
+        'date': np.concatenate([dates, dates])[keep][order],
+        'sums': sums,
+        'win_run': run_lengths(goals_for > goals_against, starts),
+        'unbeaten_run': run_lengths(goals_for >= goals_against, starts),
+    }
+
+
+def form_span(form, team, year_range=None):
+    """
+    Finds the matches of a team within a year range with two binary searches on its dates.
+
+    Returns:
+    tuple: The first and the last (exclusive) position of the matches, equal when there are none.
+    """
+    team_code = encode_one(form['teams'], team)
+    if team_code < 0:
+        return 0, 0
+    start, end = form['offsets'][team_code], form['offsets'][team_code + 1]
+    if year_range:
+        dates = form['date'][start:end]
+        bounds = np.array([f'{year_range[0]}-01-01', f'{year_range[1] + 1}-01-01'], dtype=dates.dtype)
+        start, end = start + np.searchsorted(dates, bounds, side='left')
+    return int(start), int(end)
+
+
+def window_record(form, start, end):
+    """
+    Sums the record of the matches start to end (exclusive) from the difference of two running sums.
+
+    Returns:
+    dict: The games, wins, draws, losses, goals_for, goals_against and win_percentage (None without games).
+    """
+    record = dict(zip(FORM_COLUMNS, (form['sums'][end] - form['sums'][start]).tolist()))
+    games = end - start
+    record = {'games': games, **record}
+    record['win_percentage'] = round(record['wins'] / games * 100, 1) if games else None
+    return record
+
+
+@instrumented
+def team_form(form, team, year_range=None, windows=(5, 10, 20), year_windows=(1, 4)):
+    """
+    Calculates the form of a team at the end of a year range: its record over the last matches and the last years,
+    its current streaks and its longest streaks within the range.
+
+    Parameters:
+    form (dict):                        The form table, see build_form.
+    team (str):                         The team.
+    year_range (tuple, optional):       A tuple specifying the start and end years (inclusive), all matches when not given.
+    windows (tuple of int):             The numbers of last matches to sum the record of.
+    year_windows (tuple of int):        The numbers of last years of the range to sum the record of.
+
+    Returns:
+    dict: The games in the range, the records per window ('last_matches') and per year window ('last_years'), and the
+          current and longest win and unbeaten streaks.
+    """
+    start, end = form_span(form, team, year_range)
+    last_year = year_range[1] if year_range else (int(form['date'][end - 1].astype('datetime64[Y]').astype(int)) + 1970 if end > start else None)
+
+    last_years = {}
+    for n in year_windows:
+        if last_year is None:
+            last_years[n] = window_record(form, start, start)
+            continue
+        low, high = form_span(form, team, (last_year - n + 1, last_year))
+        last_years[n] = window_record(form, max(low, start), high)
+
+    streaks = {}
+    for name in ['win', 'unbeaten']:
+        runs = form[f'{name}_run'][start:end]
+        # A run that started before the range only counts its matches within the range
+        runs = np.minimum(runs, np.arange(1, len(runs) + 1))
+        streaks[f'current_{name}_streak'] = int(runs[-1]) if len(runs) else 0
+        streaks[f'longest_{name}_streak'] = int(runs.max()) if len(runs) else 0
+
+    return {
+        'games': end - start,
+        'last_matches': {n: window_record(form, max(start, end - n), end) for n in windows},
+        'last_years': last_years,
+        **streaks,
+    }
+
+
+@instrumented
+def rolling_win_rate(form, team, window=10, year_range=None):
+    """
+    Calculates the win percentage over the last `window` matches after every match of a team within a year range.
+    The window reaches back before the range, so the first points of the range are over full windows as well.
+
+    Parameters:
+    form (dict):                    The form table, see build_form.
+    team (str):                     The team.
+    window (int):                   The number of matches per window.
+    year_range (tuple, optional):   A tuple specifying the start and end years (inclusive), all matches when not given.
+
+    Returns:
+    pd.DataFrame: The Date and the Win Percentage after every match.
+
+    Raises:
+    ValueError: If the window is smaller than 1.
+    """
+    if window < 1:
+        raise ValueError('The window should be at least 1 match')
+    first, _ = form_span(form, team)
+    start, end = form_span(form, team, year_range)
+
+    ends = np.arange(start + 1, end + 1)
+    starts = np.maximum(ends - window, first)
+    wins = form['sums'][ends, 0] - form['sums'][starts, 0]
+    return pd.DataFrame({'Date': form['date'][start:end], 'Win Percentage': (wins / (ends - starts) * 100).round(1)})
@@ -0,0 +1,226 @@
+"""
+Goal timing and penalty shootouts.
+
+The goals and shootouts are counted per (team, opponent, tournament, year) like the outcome cube, with bincount over
+one integer key per cell for all teams at once, so they can be selected with cube_cells and summed per team.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .cubes import cube_from_cells
+from .encoding import column_codes, encode, team_codes
+
+
+GOAL_BUCKETS = ['1-15', '16-30', '31-45', '46-60', '61-75', '76-90', '90+']
+GOAL_COLUMNS = (
+    [f'scored_{bucket}' for bucket in range(len(GOAL_BUCKETS))] + [f'conceded_{bucket}' for bucket in range(len(GOAL_BUCKETS))]
+    + ['goals', 'penalties', 'own_goals', 'conceded', 'penalties_conceded', 'own_goals_conceded']
+)
+SHOOTOUT_COLUMNS = ['shootouts', 'won', 'shot_first', 'won_shot_first']
+
+
+def count_cells(team, opponent, tournament, year, n_teams, n_tournaments):
+    """
+    Assigns every row to its (team, opponent, tournament, year) cell with one integer key.
+
+    Parameters:
+    team, opponent (np.ndarray):    The team codes per row.
+    tournament (np.ndarray):        The tournament code per row, -1 when unknown.
+    year (np.ndarray):              The year per row.
+    n_teams (int):                  The number of team codes.
+    n_tournaments (int):            The number of tournament codes.
+
+    Returns:
+    tuple: The cell of every row and the cells with their team, opponent, tournament and year, sorted like the outcome cube.
+    """
+    year = year.astype(np.int64)
+    first_year = int(year.min()) if len(year) else 0
+    n_years = int(year.max()) - first_year + 1 if len(year) else 1
+    # Shift the tournament codes by one, so unknown tournaments (-1) get a key of their own
+    key = ((team.astype(np.int64) * n_teams + opponent) * (n_tournaments + 1) + tournament + 1) * n_years + year - first_year
+    keys, cells = np.unique(key, return_inverse=True)
+
+    rest, years = np.divmod(keys, n_years)
+    rest, tournaments = np.divmod(rest, n_tournaments + 1)
+    teams, opponents = np.divmod(rest, n_teams)
+    return cells, pd.DataFrame({
+        'team': teams.astype(np.int16),
+        'opponent': opponents.astype(np.int16),
+        'tournament': (tournaments - 1).astype(np.int16),
+        'year': (years + first_year).astype(np.int16),
+    })
+
+
+def match_tournaments(df_results: pd.DataFrame, match_ids):
+    """
+    Looks up the tournament code of the matches with the given match_ids, -1 for rows without a match.
+    """
+    codes, tournaments = column_codes(df_results['tournament'])
+    match_ids = np.asarray(match_ids)
+    return np.where(match_ids >= 0, codes[np.maximum(match_ids, 0)], -1), tournaments
+
+
+def build_goal_cube(df_goals: pd.DataFrame, df_results: pd.DataFrame):
+    """
+    Counts the goals scored and conceded per minute bucket, and the penalties and own goals, per cell for all teams at once.
+
+    Parameters:
+    df_goals (pd.DataFrame):    The goals, typed with the same team categories as df_results and with their match_id.
+    df_results (pd.DataFrame):  The DataFrame containing match data.
+
+    Returns:
+    dict: The goal cube with the GOAL_COLUMNS per cell, see cube_from_cells.
+    """
+    home_codes, away_codes, teams = team_codes(df_goals)
+    scorers = pd.Categorical(df_goals['team'], categories=teams).codes.astype(np.int64)
+    # The conceding team is the other team of the match, goals of a team that did not play the match are left out
+    conceders = np.where(scorers == home_codes, away_codes, np.where(scorers == away_codes, home_codes, -1))
+    tournament_codes, tournaments = match_tournaments(df_results, df_goals['match_id'])
+    keep = (scorers >= 0) & (conceders >= 0)
+
+    # Every goal is counted twice: as scored by its team (side 0) and as conceded by the opponent (side 1)
+    n = int(keep.sum())
+    side = np.repeat([0, 1], n)
+    cells, keys = count_cells(
+        np.concatenate([scorers[keep], conceders[keep]]), np.concatenate([conceders[keep], scorers[keep]]),
+        np.tile(tournament_codes[keep], 2), np.tile(df_goals['date'].dt.year.to_numpy()[keep], 2),
+        len(teams), len(tournaments),
+    )
+
+    # Goals without a minute go to an extra bucket that is left out of the histogram
+    minutes = df_goals['minute'].to_numpy()[keep]
+    bucket = np.where(np.isnan(minutes), len(GOAL_BUCKETS), np.clip((np.nan_to_num(minutes) - 1) // 15, 0, len(GOAL_BUCKETS) - 1)).astype(np.int64)
+    n_cells, n_slots = len(keys), len(GOAL_BUCKETS) + 1
+    histogram = np.bincount((cells * 2 + side) * n_slots + np.tile(bucket, 2), minlength=n_cells * 2 * n_slots)
+    histogram = histogram.reshape(n_cells, 2, n_slots)[:, :, :len(GOAL_BUCKETS)]
+
+    def per_side(weights):
+        counts = np.bincount(cells * 2 + side, weights=np.tile(weights, 2), minlength=n_cells * 2).reshape(n_cells, 2)
+        return counts.astype(np.int32)
+
+    goals = per_side(np.ones(n))
+    penalties = per_side(df_goals['penalty'].to_numpy(dtype=float)[keep])
+    own_goals = per_side(df_goals['own_goal'].to_numpy(dtype=float)[keep])
+    values = np.column_stack([
+        histogram[:, 0], histogram[:, 1], goals[:, 0], penalties[:, 0], own_goals[:, 0], goals[:, 1], penalties[:, 1], own_goals[:, 1],
+    ])
+    cells = pd.concat([keys, pd.DataFrame(values.astype(np.int32), columns=GOAL_COLUMNS)], axis=1)
+    return cube_from_cells(cells, teams, tournaments=tournaments)
+
+
+def build_shootout_cube(df_shootouts: pd.DataFrame, df_results: pd.DataFrame):
+    """
+    Counts the penalty shootouts per cell for all teams at once: played, won, shot first and won when shooting first.
+
+    Parameters:
+    df_shootouts (pd.DataFrame):    The shootouts, typed with the same team categories as df_results and with their match_id.
+    df_results (pd.DataFrame):      The DataFrame containing match data.
+
+    Returns:
+    dict: The shootout cube with the SHOOTOUT_COLUMNS per cell, see cube_from_cells.
+    """
+    home_codes, away_codes, teams = team_codes(df_shootouts)
+    winners = pd.Categorical(df_shootouts['winner'], categories=teams).codes
+    first = pd.Categorical(df_shootouts['first_shooter'], categories=teams).codes
+    tournament_codes, tournaments = match_tournaments(df_results, df_shootouts['match_id'])
+    keep = (home_codes >= 0) & (away_codes >= 0) & (winners >= 0)
+
+    # Every shootout is counted for both teams
+    team = np.concatenate([home_codes[keep], away_codes[keep]])
+    opponent = np.concatenate([away_codes[keep], home_codes[keep]])
+    won = np.tile(winners[keep], 2) == team
+    shot_first = np.tile(first[keep], 2) == team
+    cells, keys = count_cells(
+        team, opponent, np.tile(tournament_codes[keep], 2), np.tile(df_shootouts['date'].dt.year.to_numpy()[keep], 2),
+        len(teams), len(tournaments),
+    )
+
+    values = np.column_stack([
+        np.bincount(cells, weights=weights, minlength=len(keys))
+        for weights in [np.ones(len(team)), won, shot_first, won & shot_first]
+    ])
+    cells = pd.concat([keys, pd.DataFrame(values.astype(np.int32), columns=SHOOTOUT_COLUMNS)], axis=1)
+    return cube_from_cells(cells, teams, tournaments=tournaments)
+
+
+@instrumented
+def goal_timing(cells: pd.DataFrame):
+    """
+    Sums the goals by minute and the penalty and own goal shares from cells of the goal cube.
+
+    Parameters:
+    cells (pd.DataFrame):   The cells of one team, see cube_cells.
+
+    Returns:
+    dict: The goals scored and conceded per 15 minutes ('minutes', a DataFrame with Minutes, Scored and Conceded) and
+          the totals and shares of penalties and own goals ('shares').
+    """
+    totals = dict(zip(GOAL_COLUMNS, cells[GOAL_COLUMNS].to_numpy().sum(axis=0).tolist()))
+    n = len(GOAL_BUCKETS)
+
+    def share(part, whole):
+        return round(totals[part] / totals[whole] * 100, 1) if totals[whole] else None
+
+    return {
+        'minutes': pd.DataFrame({
+            'Minutes': GOAL_BUCKETS,
+            'Scored': [totals[f'scored_{bucket}'] for bucket in range(n)],
+            'Conceded': [totals[f'conceded_{bucket}'] for bucket in range(n)],
+        }),
+        'shares': {
+            'goals': totals['goals'],
+            'conceded': totals['conceded'],
+            'penalty_share': share('penalties', 'goals'),
+            'own_goal_share': share('own_goals', 'goals'),
+            'penalty_share_conceded': share('penalties_conceded', 'conceded'),
+            'own_goal_share_conceded': share('own_goals_conceded', 'conceded'),
+        },
+    }
+
+
+@instrumented
+def shootout_record(cells: pd.DataFrame):
+    """
+    Sums the penalty shootouts from cells of the shootout cube.
+
+    Parameters:
+    cells (pd.DataFrame):   The cells of one team, see cube_cells.
+
+    Returns:
+    dict: The shootouts, won, lost, shot_first and won_shot_first.
+    """
+    record = dict(zip(SHOOTOUT_COLUMNS, (int(value) for value in cells[SHOOTOUT_COLUMNS].to_numpy().sum(axis=0))))
+    record['lost'] = record['shootouts'] - record['won']
+    return record
+
+
+@instrumented
+def shootout_table(cube, tournaments=None, year_range=None, min_shootouts=1):
+    """
+    Sums the penalty shootouts of all teams at once with bincount over the team codes.
+
+    Parameters:
+    cube (dict):                            The shootout cube, see build_shootout_cube.
+    tournaments (list of str, optional):    The tournaments to filter by.
+    year_range (tuple, optional):           A tuple specifying the start and end years (inclusive) to filter by.
+    min_shootouts (int):                    The minimum number of shootouts of a team to be listed.
+
+    Returns:
+    pd.DataFrame: The team, shootouts, won, lost and win_percentage, the best team first.
+    """
+    cells = cube['cells']
+    mask = np.ones(len(cells), dtype=bool)
+    if tournaments:
+        mask &= np.isin(cells['tournament'].to_numpy(), encode(cube['tournaments'], tournaments))
+    if year_range:
+        years = cells['year'].to_numpy()
+        mask &= (years >= year_range[0]) & (years <= year_range[1])
+    teams = cells['team'].to_numpy()[mask]
+    shootouts = np.bincount(teams, weights=cells['shootouts'].to_numpy()[mask], minlength=len(cube['teams'])).astype(int)
+    won = np.bincount(teams, weights=cells['won'].to_numpy()[mask], minlength=len(cube['teams'])).astype(int)
+
+    df = pd.DataFrame({'team': cube['teams'], 'shootouts': shootouts, 'won': won, 'lost': shootouts - won})
+    df = df[df['shootouts'] >= max(min_shootouts, 1)]
+    df['win_percentage'] = (df['won'] / df['shootouts'] * 100).round(1)
+    return df.sort_values(by=['win_percentage', 'shootouts'], ascending=False, ignore_index=True)
@@ -0,0 +1,193 @@
+"""
+Head-to-head records.
+
+The cells of the outcome cube are accumulated per team pair and per (team pair, tournament) in year order, in one
+running sum over all cells. The record of a pair over a year range is then the difference of two prefix sums,
+found with a binary search on the (segment, year) key of every cell.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .cubes import CUBE_COLUMNS
+from .encoding import encode, encode_one
+
+
+def prefix_sums(segments, years, values, first_year, span):
+    """
+    Accumulates values sorted by (segment, year) into prefix sums with a lookup key per row.
+
+    Parameters:
+    segments (np.ndarray):  The sorted segment code per row, e.g. a team pair.
+    years (np.ndarray):     The year per row, sorted within each segment.
+    values (np.ndarray):    The values per row, one column per value.
+    first_year (int):       The first year in the data.
+    span (int):             The number of years from the first to the last year in the data.
+
+    Returns:
+    dict: The key of every row ('lookup') and the prefix sums ('sums'), where sums[i] is the total of the rows before row i.
+    """
+    sums = np.zeros((len(values) + 1, values.shape[1]), dtype=np.int64)
+    np.cumsum(values, axis=0, out=sums[1:])
+    return {'lookup': segments.astype(np.int64) * span + (years.astype(np.int64) - first_year), 'sums': sums}
+
+
+def range_sums(table, segments, start, end, span):
+    """
+    Sums the values of every given segment over the years start to end (as offsets from the first year, inclusive).
+
+    Returns:
+    np.ndarray: The sums, one row per segment.
+    """
+    segments = np.asarray(segments, dtype=np.int64) * span
+    low = np.searchsorted(table['lookup'], segments + start, side='left')
+    high = np.searchsorted(table['lookup'], segments + end, side='right')
+    return table['sums'][high] - table['sums'][low]
+
+
+def build_head_to_head(cube):
+    """
+    Builds the prefix sums of all team pairs from the outcome cube, in one pass over its cells.
+
+    Parameters:
+    cube (dict):    The outcome cube, see build_outcome_cube, with its cells sorted by team, opponent, tournament and year.
+
+    Returns:
+    dict: The team and tournament names, the year range, the prefix sums per pair ('pairs') and per pair and tournament
+          ('tournament_pairs'), and the opponents of every team ('opponents', sliced by 'offsets').
+    """
+    cells = cube['cells']
+    n_teams, n_tournaments = len(cube['teams']), len(cube['tournaments'])
+    years = cells['year'].to_numpy().astype(np.int64)
+    first_year, last_year = (int(years.min()), int(years.max())) if len(years) else (0, 0)
+    span = last_year - first_year + 1
+
+    pairs = cells['team'].to_numpy().astype(np.int64) * n_teams + cells['opponent'].to_numpy()
+    values = cells[CUBE_COLUMNS].to_numpy()
+    # The cells are per tournament, summing them per pair and year keeps the order of the pairs
+    per_pair = pd.DataFrame(values, columns=CUBE_COLUMNS).groupby([pairs, years], sort=True).sum()
+    pair_codes = per_pair.index.get_level_values(0).to_numpy()
+    opponents = np.unique(pair_codes)
+
+    return {
+        'teams': cube['teams'],
+        'tournaments': cube['tournaments'],
+        'first_year': first_year,
+        'last_year': last_year,
+        'pairs': prefix_sums(pair_codes, per_pair.index.get_level_values(1).to_numpy(), per_pair.to_numpy(), first_year, span),
+        'tournament_pairs': prefix_sums(pairs * n_tournaments + cells['tournament'].to_numpy(), years, values, first_year, span),
+        'opponents': opponents % n_teams,
+        'offsets': np.searchsorted(opponents // n_teams, np.arange(n_teams + 1)),
+    }
+
+
+@instrumented
+def pair_sums(h2h, team_code, opponent_codes, tournaments=None, year_range=None):
+    """
+    Sums the outcomes of one team against each of the given opponents.
+
+    Parameters:
+    h2h (dict):                             The head-to-head prefix sums, see build_head_to_head.
+    team_code (int):                        The code of the team.
+    opponent_codes (np.ndarray):            The codes of the opponents.
+    tournaments (list of str, optional):    The tournaments to filter by.
+    year_range (tuple, optional):           A tuple specifying the start and end years (inclusive) to filter by.
+
+    Returns:
+    np.ndarray: The CUBE_COLUMNS per opponent.
+    """
+    first_year, last_year = h2h['first_year'], h2h['last_year']
+    span = last_year - first_year + 1
+    start, end = year_range if year_range else (first_year, last_year)
+    start, end = max(int(start), first_year) - first_year, min(int(end), last_year) - first_year
+    pairs = team_code * len(h2h['teams']) + np.asarray(opponent_codes, dtype=np.int64)
+    if start > end:
+        return np.zeros((len(pairs), len(CUBE_COLUMNS)), dtype=np.int64)
+    if not tournaments:
+        return range_sums(h2h['pairs'], pairs, start, end, span)
+
+    # One lookup per pair and tournament, summed per pair
+    tournament_codes = encode(h2h['tournaments'], tournaments)
+    segments = (pairs[:, None] * len(h2h['tournaments']) + tournament_codes[None, :]).ravel()
+    sums = range_sums(h2h['tournament_pairs'], segments, start, end, span)
+    return sums.reshape(len(pairs), len(tournament_codes), len(CUBE_COLUMNS)).sum(axis=1)
+
+
+def record_frame(opponents, sums):
+    """
+    Converts summed outcomes to a table of records with the games, goal difference and win percentage.
+    """
+    df = pd.DataFrame(sums, columns=CUBE_COLUMNS)
+    games = df['wins'] + df['draws'] + df['losses']
+    df.insert(0, 'opponent', opponents)
+    df.insert(1, 'games', games)
+    df['goal_difference'] = df['goals_for'] - df['goals_against']
+    df['win_percentage'] = (df['wins'] / games.where(games > 0) * 100).round(1)
+    return df
+
+
+def head_to_head_record(h2h, team, opponent, tournaments=None, year_range=None):
+    """
+    Looks up the record of a team against one opponent with two binary searches.
+
+    Parameters:
+    h2h (dict):                             The head-to-head prefix sums, see build_head_to_head.
+    team (str):                             The team to get the record of.
+    opponent (str):                         The opponent.
+    tournaments (list of str, optional):    The tournaments to filter by.
+    year_range (tuple, optional):           A tuple specifying the start and end years (inclusive) to filter by.
+
+    Returns:
+    dict: The wins, draws, losses, total_games, goals_for, goals_against and goal_difference of the team.
+    """
+    team_code, opponent_code = encode_one(h2h['teams'], team), encode_one(h2h['teams'], opponent)
+    if team_code < 0 or opponent_code < 0:
+        sums = np.zeros(len(CUBE_COLUMNS), dtype=np.int64)
+    else:
+        sums = pair_sums(h2h, team_code, [opponent_code], tournaments, year_range)[0]
+    record = {column: int(value) for column, value in zip(CUBE_COLUMNS, sums)}
+    record['total_games'] = record['wins'] + record['draws'] + record['losses']
+    record['goal_difference'] = record['goals_for'] - record['goals_against']
+    return record
+
+
+@instrumented
+def opponent_records(h2h, team, tournaments=None, year_range=None):
+    """
+    Looks up the record of a team against all of its opponents, with two binary searches per opponent.
+
+    Parameters:
+    h2h (dict):                             The head-to-head prefix sums, see build_head_to_head.
+    team (str):                             The team to get the records of.
+    tournaments (list of str, optional):    The tournaments to filter by.
+    year_range (tuple, optional):           A tuple specifying the start and end years (inclusive) to filter by.
+
+    Returns:
+    pd.DataFrame: A row per opponent played within the filters with the opponent, games, CUBE_COLUMNS, goal_difference
+                  and win_percentage, the most played opponent first.
+    """
+    team_code = encode_one(h2h['teams'], team)
+    opponents = h2h['opponents'][h2h['offsets'][team_code]:h2h['offsets'][team_code + 1]] if team_code >= 0 else np.zeros(0, dtype=np.int64)
+    df = record_frame(h2h['teams'][opponents], pair_sums(h2h, team_code, opponents, tournaments, year_range))
+    return df[df['games'] > 0].sort_values(by=['games', 'opponent'], ascending=[False, True], ignore_index=True)
+
+
+@instrumented
+def head_to_head_matrix(h2h, teams, value='wins', tournaments=None, year_range=None):
+    """
+    Builds a team by team matrix of one value of the head-to-head records, e.g. the wins of the row team against the column team.
+
+    Parameters:
+    h2h (dict):                             The head-to-head prefix sums, see build_head_to_head.
+    teams (list of str):                    The teams of the rows and columns.
+    value (str):                            One of CUBE_COLUMNS, 'games' or 'goal_difference'.
+    tournaments (list of str, optional):    The tournaments to filter by.
+    year_range (tuple, optional):           A tuple specifying the start and end years (inclusive) to filter by.
+
+    Returns:
+    pd.DataFrame: The matrix, indexed by the known teams on both axes.
+    """
+    codes = encode(h2h['teams'], teams)
+    names = h2h['teams'][codes]
+    rows = [record_frame(names, pair_sums(h2h, code, codes, tournaments, year_range))[value].to_numpy() for code in codes]
+    return pd.DataFrame(np.array(rows).reshape(len(codes), len(codes)), index=names, columns=names)
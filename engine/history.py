@@ -0,0 +1,83 @@
+"""
+The match history of a team, with the outcome of every match from its side and paging.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .encoding import encode_one, team_codes
+
+
+OUTCOMES = ['loss', 'draw', 'win']
+HISTORY_COLUMNS = ['date', 'home_team', 'away_team', 'home_score', 'away_score', 'tournament', 'city', 'country', 'neutral', 'outcome']
+
+def match_outcomes(df: pd.DataFrame, team):
+    """
+    Determines the outcome of every match for a team in one vectorized pass, instead of a check per row.
+
+    Parameters:
+    df (pd.DataFrame):  The input DataFrame containing match data.
+    team (str):         The team to determine the outcomes for.
+
+    Returns:
+    pd.Categorical: 'loss', 'draw' or 'win' per match, missing for matches without a score.
+    """
+    home_teams, away_teams, categories = team_codes(df)
+    goal_difference = df['home_score'].values - df['away_score'].values
+    # From the perspective of the team, so flipped for the matches it played away
+    goal_difference = np.where(away_teams == encode_one(categories, team), -goal_difference, goal_difference)
+    codes = np.select([goal_difference < 0, goal_difference == 0, goal_difference > 0], [0, 1, 2], -1)
+    return pd.Categorical.from_codes(codes, categories=OUTCOMES, ordered=True)
+
+@instrumented
+def match_history(df: pd.DataFrame, team):
+    """
+    Returns the matches of a team with their outcome, in chronological order.
+
+    Parameters:
+    df (pd.DataFrame):  The matches of the team, e.g. the filtered matches.
+    team (str):         The team the outcomes are for.
+
+    Returns:
+    pd.DataFrame: The HISTORY_COLUMNS of the matches.
+    """
+    history = df.assign(outcome=match_outcomes(df, team))[HISTORY_COLUMNS]
+    return history.sort_values('date', kind='stable', ignore_index=True)
+
+@instrumented
+def history_page(history: pd.DataFrame, sort_by='date', ascending=False, page=1, page_size=25):
+    """
+    Sorts the match history and takes one page of it, so only the rows of that page have to be styled and sent.
+
+    Parameters:
+    history (pd.DataFrame): The match history, see match_history.
+    sort_by (str):          The column to sort by, ties stay in chronological order.
+    ascending (bool):       Whether to sort ascending.
+    page (int):             The page to return, starting at 1. Clipped to the available pages.
+    page_size (int):        The number of matches per page.
+
+    Returns:
+    dict: The matches of the page, the page, the number of pages and the total number of matches.
+
+    Raises:
+    ValueError: If the sort column or page size is not valid.
+    """
+    if sort_by not in HISTORY_COLUMNS:
+        raise ValueError(f'Cannot sort by {sort_by}, choose one of {", ".join(HISTORY_COLUMNS)}')
+    if page_size < 1:
+        raise ValueError('The page size should be at least 1')
+
+    # The position of every value among the sorted distinct values, -1 for missing values
+    codes, _ = pd.factorize(history[sort_by], sort=True)
+    keys = np.where(codes < 0, np.iinfo(np.int64).max, codes if ascending else -codes)
+    # The history is in chronological order, so a stable sort keeps ties chronological and missing values last
+    positions = np.argsort(keys, kind='stable')
+
+    pages = max(1, -(-len(history) // page_size))
+    page = min(max(1, page), pages)
+    return {
+        'matches': history.iloc[positions[(page - 1) * page_size:page * page_size]].reset_index(drop=True),
+        'page': page,
+        'pages': pages,
+        'total': len(history),
+    }
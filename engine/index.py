@@ -0,0 +1,171 @@
+"""
+The per-team match index and the sidebar metadata built from it.
+
+The index maps every team to the positions of its matches and goals, so the rows of one team are
+gathered without scanning the tables.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .encoding import column_codes, encode_one, team_codes
+
+
+def inverted_index(codes, positions, n_codes):
+    """
+    Builds an inverted index that maps every code to the sorted positions of the rows it occurs in.
+
+    Parameters:
+    codes (np.ndarray):     The code per occurrence, negative codes (missing values) are skipped.
+    positions (np.ndarray): The row position per occurrence.
+    n_codes (int):          The number of distinct codes.
+
+    Returns:
+    tuple: The row positions grouped by code and the offsets per code, the rows of code c are positions[offsets[c]:offsets[c + 1]].
+    """
+    keep = codes >= 0
+    codes, positions = codes[keep], positions[keep]
+    order = np.lexsort((positions, codes))
+    offsets = np.zeros(n_codes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=n_codes), out=offsets[1:])
+    return positions[order].astype(np.int32), offsets
+
+
+def build_team_index(df_results: pd.DataFrame, df_goals: pd.DataFrame):
+    """
+    Builds the inverted indexes from team to its matches in the results table and to its goals in the goals table.
+
+    Parameters:
+    df_results (pd.DataFrame):  The DataFrame containing match data.
+    df_goals (pd.DataFrame):    The DataFrame containing the goals, typed with the same team categories as df_results.
+
+    Returns:
+    dict: The team names ('teams') and the inverted indexes of the results ('results') and goals ('goals') tables.
+    """
+    home_codes, away_codes, categories = team_codes(df_results)
+    positions = np.arange(len(df_results))
+    goal_codes = pd.Categorical(df_goals['team'], categories=categories).codes
+
+    return {
+        'teams': categories,
+        'results': inverted_index(np.concatenate([home_codes, away_codes]), np.concatenate([positions, positions]), len(categories)),
+        'goals': inverted_index(goal_codes, np.arange(len(df_goals)), len(categories)),
+    }
+
+
+def index_rows(index, table, team):
+    """
+    Looks up the row positions of a team in one of the inverted indexes.
+
+    Parameters:
+    index (dict):   The team index, see build_team_index.
+    table (str):    The table to look up, 'results' or 'goals'.
+    team (str):     The team to look up.
+
+    Returns:
+    np.ndarray: The sorted row positions, empty when the team is unknown.
+    """
+    positions, offsets = index[table]
+    team_code = encode_one(index['teams'], team)
+    if team_code < 0:
+        return positions[:0]
+    return positions[offsets[team_code]:offsets[team_code + 1]]
+
+
+@instrumented(rows='result')
+def team_matches(df_results: pd.DataFrame, index, team):
+    """
+    Returns the matches of a team as home or away team, slicing only the rows of that team.
+
+    Parameters:
+    df_results (pd.DataFrame):  The DataFrame containing match data the index was built from.
+    index (dict):               The team index, see build_team_index.
+    team (str):                 The team to look up.
+
+    Returns:
+    pd.DataFrame: The matches of the team in their original order and with their original index.
+    """
+    return df_results.iloc[index_rows(index, 'results', team)]
+
+
+@instrumented(rows='result')
+def team_goals(df_goals: pd.DataFrame, index, team):
+    """
+    Returns the goals scored by a team, slicing only the rows of that team.
+
+    Parameters:
+    df_goals (pd.DataFrame):    The DataFrame containing the goals the index was built from.
+    index (dict):               The team index, see build_team_index.
+    team (str):                 The team to look up.
+
+    Returns:
+    pd.DataFrame: The goals of the team in their original order and with their original index.
+    """
+    return df_goals.iloc[index_rows(index, 'goals', team)]
+
+
+# Sidebar metadata
+# ------------------------------
+
+def first_seen(team_of_row, codes, offsets, names):
+    """
+    Returns per team the distinct names of a column in order of first appearance, from the rows of the team index.
+
+    Parameters:
+    team_of_row (np.ndarray):   The team code of every position in the team index.
+    codes (np.ndarray):         The code of the column for every position in the team index, -1 for missing values.
+    offsets (np.ndarray):       The offsets per team of the team index.
+    names (pd.Index):           The names the codes refer to.
+
+    Returns:
+    list of list: The names per team code.
+    """
+    pairs = pd.DataFrame({'team': team_of_row, 'code': codes})
+    pairs = pairs[pairs['code'] >= 0].drop_duplicates()
+    # drop_duplicates keeps the first occurrence in index order, so the pairs stay grouped by team
+    bounds = np.searchsorted(pairs['team'].to_numpy(), np.arange(len(offsets)))
+    values = names[pairs['code'].to_numpy()].tolist()
+    return [values[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def build_metadata(df_results: pd.DataFrame, index):
+    """
+    Precomputes everything the sidebar needs once per dataset: the team list, the year bounds and the options per team.
+
+    Parameters:
+    df_results (pd.DataFrame):  The DataFrame containing match data the index was built from.
+    index (dict):               The team index, see build_team_index.
+
+    Returns:
+    dict: The sorted names of the teams that played a home match ('teams'), the first and last year played ('min_year',
+          'max_year'), all tournaments ('tournaments') and per team its tournaments, opponents, min_year and max_year ('options').
+    """
+    positions, offsets = index['results']
+    teams = index['teams']
+    team_of_row = np.repeat(np.arange(len(teams)), np.diff(offsets))
+    home_codes, _, _ = team_codes(df_results)
+    tournament_codes, tournament_names = column_codes(df_results['tournament'])
+    years = df_results['date'].dt.year.to_numpy()
+    max_year = int(years.max())
+
+    tournaments = first_seen(team_of_row, tournament_codes[positions], offsets, tournament_names)
+    opponents = first_seen(team_of_row, home_codes[positions], offsets, teams)
+    # The rows of the teams without matches are empty slices, so reduceat only starts at the teams that played
+    playing = np.flatnonzero(np.diff(offsets) > 0)
+    min_years = np.minimum.reduceat(years[positions], offsets[playing])
+
+    return {
+        'teams': sorted(teams[np.unique(home_codes[home_codes >= 0])]),
+        'min_year': int(years.min()),
+        'max_year': max_year,
+        'tournaments': sorted(tournament_names[np.unique(tournament_codes[tournament_codes >= 0])]),
+        'options': {
+            teams[code]: {
+                'tournaments': tournaments[code],
+                'opponents': opponents[code],
+                'min_year': int(min_year),
+                'max_year': max_year,
+            }
+            for code, min_year in zip(playing, min_years)
+        },
+    }
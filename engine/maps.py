@@ -0,0 +1,173 @@
+"""
+The win ratios per country and the world map of the dashboard.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+
+
+@instrumented
+def get_win_ratio(df_results, df_locations, for_team):
+    """
+    Calculates the win ratio of a team against every country present in the match data.
+
+    Parameters:
+    df_results (pd.DataFrame):      The input DataFrame containing match data.
+    df_locations (pd.DataFrame):    The DataFrame with the coordinates per country.
+    for_team (str):                 The team to calculate the win ratios for.
+
+    Returns:
+    pd.DataFrame: The locations of the countries that played in the match data, with a 'win_ratio' column.
+    """
+    long = team_perspective(df_results)
+    games = team_records(long)['games']
+
+    # Wins of the selected team per opponent, its own row holds the overall wins
+    ours = long[(long['team'] == for_team) & long['win']]
+    wins = ours.groupby('opponent').size()
+    wins.loc[for_team] = len(ours)
+
+    win_ratio = (wins.reindex(games.index, fill_value=0) / games).round(3)
+
+    df_locations = df_locations[df_locations['country'].isin(games.index)].copy()
+    df_locations['win_ratio'] = df_locations['country'].map(win_ratio).fillna(0.0)
+    return df_locations
+
+
+def team_perspective(df: pd.DataFrame):
+    """
+    Melts the home and away side of every match into one long table with a row per team per match.
+
+    Parameters:
+    df (pd.DataFrame):  The input DataFrame containing match data.
+
+    Returns:
+    pd.DataFrame: A DataFrame with the columns team, opponent, goals_for, goals_against, win, draw and loss.
+    """
+    home_teams = df['home_team'].to_numpy()
+    away_teams = df['away_team'].to_numpy()
+    home_scores = df['home_score'].to_numpy()
+    away_scores = df['away_score'].to_numpy()
+
+    long = pd.DataFrame({
+        'team': np.concatenate([home_teams, away_teams]),
+        'opponent': np.concatenate([away_teams, home_teams]),
+        'goals_for': np.concatenate([home_scores, away_scores]),
+        'goals_against': np.concatenate([away_scores, home_scores]),
+    })
+
+    # Comparisons with missing scores are False, so games to come count for neither outcome
+    long['win'] = long['goals_for'] > long['goals_against']
+    long['draw'] = long['goals_for'] == long['goals_against']
+    long['loss'] = long['goals_for'] < long['goals_against']
+    return long
+
+
+def team_records(long: pd.DataFrame):
+    """
+    Calculates the games, wins, draws and losses for all teams in one grouped pass.
+
+    Parameters:
+    long (pd.DataFrame):    The long "team perspective" table, see team_perspective.
+
+    Returns:
+    pd.DataFrame: A DataFrame indexed by team with the columns games, wins, draws and losses.
+    """
+    grouped = long.groupby('team', sort=False)
+    records = grouped[['win', 'draw', 'loss']].sum()
+    records.columns = ['wins', 'draws', 'losses']
+    records.insert(0, 'games', grouped.size())
+    return records
+
+
+# Marker colors by win ratio, from the highest lower bound down, countries below the last bound are red
+WIN_RATIO_COLORS = [(0.75, 'darkgreen'), (0.5, 'lightgreen'), (0.25, 'orange')]
+
+
+def point_features(df: pd.DataFrame, labels):
+    """
+    Converts countries with a location and a win ratio to one GeoJSON layer of points, with the marker color and popup label as properties.
+
+    Parameters:
+    df (pd.DataFrame):      The countries with the 'lat', 'lon' and 'win_ratio' columns.
+    labels (np.ndarray):    The popup label per country.
+
+    Returns:
+    dict: A GeoJSON FeatureCollection with a point per country.
+    """
+    win_ratio = df['win_ratio'].to_numpy()
+    colors = np.select([win_ratio > bound for bound, _ in WIN_RATIO_COLORS], [color for _, color in WIN_RATIO_COLORS], 'red')
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                'properties': {'color': color, 'label': label},
+            }
+            for lon, lat, color, label in zip(df['lon'].tolist(), df['lat'].tolist(), colors.tolist(), labels.tolist())
+        ],
+    }
+
+
+@instrumented
+def win_ratio_geojson(df_locations: pd.DataFrame):
+    """
+    Converts the win ratios per country to one GeoJSON layer of points, with the marker color and popup label as properties.
+
+    Parameters:
+    df_locations (pd.DataFrame):    The locations with a 'win_ratio' column, see get_win_ratio.
+
+    Returns:
+    dict: A GeoJSON FeatureCollection with a point per country the team won against.
+    """
+    df = df_locations[df_locations['win_ratio'] > 0]
+    labels = np.char.add(df['country'].to_numpy().astype(str), np.char.mod(': %.2f%%', df['win_ratio'].to_numpy() * 100))
+    return point_features(df, labels)
+
+
+@instrumented
+def venue_geojson(df_countries: pd.DataFrame, locations: pd.DataFrame):
+    """
+    Converts the record of a team per country it played in to one GeoJSON layer of points, see point_features.
+
+    Parameters:
+    df_countries (pd.DataFrame):    The record per country, see venue_countries.
+    locations (pd.DataFrame):       The 'lat' and 'lon' per country, indexed by country. Countries without a location are left out.
+
+    Returns:
+    dict: A GeoJSON FeatureCollection with a point per country the team played in.
+    """
+    df = df_countries.join(locations, on='country', how='inner')
+    labels = np.char.add(
+        np.char.add(df['country'].to_numpy().astype(str), np.char.mod(': %d games, ', df['games'].to_numpy())),
+        np.char.mod('%.1f%% won', df['win_ratio'].to_numpy() * 100),
+    )
+    return point_features(df, labels)
+
+
+def render_map(geojson):
+    """
+    Renders a GeoJSON layer of points on a world map as a standalone HTML page, with a circle marker per point in the
+    color of its properties and its label as popup.
+
+    Parameters:
+    geojson (dict): The layer, see point_features.
+
+    Returns:
+    str: The HTML of the map.
+    """
+    # Imported here, so only a map that is not cached yet pays for importing folium
+    import folium
+
+    m = folium.Map(location=[20, 0], zoom_start=2)
+    # An empty layer has no fields for the popup, e.g. for a team that never won
+    if geojson['features']:
+        folium.GeoJson(
+            geojson,
+            marker=folium.CircleMarker(radius=10, fill=True, fill_opacity=0.6),
+            style_function=lambda feature: {'color': feature['properties']['color'], 'fillColor': feature['properties']['color']},
+            popup=folium.GeoJsonPopup(fields=['label'], labels=False),
+        ).add_to(m)
+    return m.get_root().render()
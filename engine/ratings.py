@@ -0,0 +1,188 @@
+"""
+Elo ratings.
+
+The strength of every team over time, following the World Football Elo Ratings: the rating exchange of a match
+is K * G * (result - expected result), with K by the importance of the tournament and G growing with the goal difference.
+The matches are replayed in date order and the rating vector is checkpointed at the end of every year, so a rating at
+a date only replays the matches of one year and a refresh only replays the years from its first changed match.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .encoding import column_codes, team_codes
+
+
+ELO_START = 1500
+ELO_HOME_ADVANTAGE = 100
+# K per tournament, qualifications and Nations Leagues have K 40 and all other tournaments K 30
+ELO_K = {
+    'FIFA World Cup': 60,
+    'Confederations Cup': 50,
+    'UEFA Euro': 50,
+    'Copa América': 50,
+    'African Cup of Nations': 50,
+    'AFC Asian Cup': 50,
+    'Gold Cup': 50,
+    'Oceania Nations Cup': 50,
+    'Friendly': 20,
+}
+
+
+def elo_k(tournaments: pd.Index):
+    """
+    Returns the K factor of every tournament.
+
+    Parameters:
+    tournaments (pd.Index): The tournament names.
+
+    Returns:
+    np.ndarray: The K factor per tournament.
+    """
+    names = pd.Series(tournaments.astype(str))
+    default = np.where(names.str.contains('qualification') | names.str.contains('Nations League'), 40.0, 30.0)
+    return names.map(ELO_K).fillna(pd.Series(default)).to_numpy(dtype=float)
+
+
+def elo_matches(df_results: pd.DataFrame):
+    """
+    Prepares the played matches in date order for the rating loop, with everything that does not depend on the ratings precomputed.
+
+    Parameters:
+    df_results (pd.DataFrame):  The DataFrame containing match data, matches with missing values are left out like in filter_dataframe.
+
+    Returns:
+    dict: The team names ('teams') and per match in date order the date, year, home and away team codes, home advantage
+          and the rating exchange for an expected result of zero ('weight') and its actual result from the home team's view ('result').
+    """
+    df = df_results.dropna(subset=['home_team', 'away_team', 'home_score', 'away_score'])
+    df = df.iloc[np.argsort(df['date'].to_numpy(), kind='stable')]
+    home_teams, away_teams, teams = team_codes(df)
+    tournament_codes, tournaments = column_codes(df['tournament'])
+    goal_difference = df['home_score'].to_numpy() - df['away_score'].to_numpy()
+
+    margin = np.abs(goal_difference)
+    goal_factor = np.select([margin <= 1, margin == 2], [1.0, 1.5], (11 + margin) / 8)
+    k = np.where(tournament_codes >= 0, elo_k(tournaments)[tournament_codes], 30.0)
+    return {
+        'teams': teams,
+        'date': df['date'].to_numpy(),
+        'year': df['date'].dt.year.to_numpy(),
+        'home': home_teams.astype(np.int64),
+        'away': away_teams.astype(np.int64),
+        'advantage': np.where(df['neutral'].to_numpy(dtype=bool), 0.0, ELO_HOME_ADVANTAGE),
+        'weight': k * goal_factor,
+        'result': np.sign(goal_difference) / 2 + 0.5,
+    }
+
+
+def play_matches(ratings, matches, start, end):
+    """
+    Updates a rating vector in place with the matches from position start to end, in a tight loop over plain lists.
+
+    Parameters:
+    ratings (np.ndarray):   The rating per team code, updated in place.
+    matches (dict):         The matches in date order, see elo_matches.
+    start (int):            The position of the first match to play.
+    end (int):              The position after the last match to play.
+    """
+    values = ratings.tolist()
+    columns = [matches[name][start:end].tolist() for name in ['home', 'away', 'advantage', 'weight', 'result']]
+    for home, away, advantage, weight, result in zip(*columns):
+        expected = 1 / (1 + 10 ** ((values[away] - values[home] - advantage) / 400))
+        change = weight * (result - expected)
+        values[home] += change
+        values[away] -= change
+    ratings[:] = values
+
+
+def build_ratings(matches, previous: pd.DataFrame = None, from_year=None):
+    """
+    Replays the matches and checkpoints the rating of every team at the end of every year.
+
+    Parameters:
+    matches (dict):                     The matches in date order, see elo_matches.
+    previous (pd.DataFrame, optional):  Earlier checkpoints to continue from, only the years from from_year are replayed.
+    from_year (int, optional):          The first year to replay, e.g. the first year changed by a refresh.
+
+    Returns:
+    pd.DataFrame: The ratings at the end of every year, indexed by year with a column per team.
+    """
+    teams, years = matches['teams'], matches['year']
+    if not len(years):
+        return pd.DataFrame(columns=teams.astype(str), index=pd.Index([], name='year', dtype=int), dtype=float)
+    first_year, last_year = int(years[0]), int(years[-1])
+    ratings = np.full(len(teams), float(ELO_START))
+    kept = []
+
+    if previous is not None and from_year is not None and from_year > first_year:
+        # New teams start at the initial rating, teams that are gone are dropped
+        previous = previous.reindex(columns=teams.astype(str), fill_value=float(ELO_START))
+        kept = [previous.loc[previous.index < from_year]]
+        if from_year - 1 in previous.index:
+            ratings = previous.loc[from_year - 1].to_numpy(dtype=float).copy()
+            first_year = from_year
+        else:
+            kept = []
+
+    checkpoints = []
+    bounds = np.searchsorted(years, np.arange(first_year, last_year + 2))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        play_matches(ratings, matches, start, end)
+        checkpoints.append(ratings.copy())
+
+    replayed = pd.DataFrame(checkpoints, columns=teams.astype(str), index=pd.Index(range(first_year, last_year + 1), name='year'))
+    return pd.concat(kept + [replayed]) if kept else replayed
+
+
+@instrumented
+def ratings_at(matches, checkpoints: pd.DataFrame, date):
+    """
+    Returns the ratings of all teams after the matches played up to and including a date.
+
+    Parameters:
+    matches (dict):                 The matches in date order, see elo_matches.
+    checkpoints (pd.DataFrame):     The ratings at the end of every year, see build_ratings.
+    date (datetime-like):           The date.
+
+    Returns:
+    pd.Series: The rating per team.
+    """
+    date = np.datetime64(pd.Timestamp(date), 'ns')
+    year = pd.Timestamp(date).year
+    if year - 1 in checkpoints.index:
+        ratings = checkpoints.loc[year - 1].to_numpy(dtype=float).copy()
+    elif year > checkpoints.index.max():
+        ratings = checkpoints.iloc[-1].to_numpy(dtype=float).copy()
+    else:
+        ratings = np.full(len(matches['teams']), float(ELO_START))
+
+    # Replay the matches of the year up to the date, starting from the checkpoint of the year before
+    start = np.searchsorted(matches['year'], year)
+    end = np.searchsorted(matches['date'], date, side='right')
+    play_matches(ratings, matches, start, max(start, end))
+    return pd.Series(ratings, index=matches['teams'].astype(str))
+
+
+@instrumented
+def rating_per_year(checkpoints: pd.DataFrame, team, year_range=None):
+    """
+    Returns the rating of a team at the end of every year it had a rating in.
+
+    Parameters:
+    checkpoints (pd.DataFrame):     The ratings at the end of every year, see build_ratings.
+    team (str):                     The team.
+    year_range (tuple, optional):   A tuple specifying the start and end years (inclusive).
+
+    Returns:
+    pd.DataFrame: A DataFrame with the columns Year and Rating.
+    """
+    if team not in checkpoints.columns:
+        return pd.DataFrame({'Year': pd.Series(dtype=int), 'Rating': pd.Series(dtype=float)})
+    ratings = checkpoints[team]
+    # Before its first match a team has the initial rating, those years are left out
+    played = ratings.ne(float(ELO_START)).cummax()
+    ratings = ratings[played]
+    if year_range:
+        ratings = ratings[(ratings.index >= year_range[0]) & (ratings.index <= year_range[1])]
+    return pd.DataFrame({'Year': ratings.index.astype(int), 'Rating': ratings.round(1).to_numpy()})
@@ -0,0 +1,109 @@
+"""
+Statistics of a team from its filtered matches: the record, the won matches and the top scorers.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .encoding import column_codes, encode_one, team_codes
+
+
+def calculate_team_stats(df, team):
+    """
+    Calculates statistics for a specified team including wins, losses, draws, and total games played.
+
+    Parameters:
+    df (pd.DataFrame):  The input DataFrame containing match data.
+    team (str):         The team to calculate statistics for.
+
+    Returns:
+    dict: A dictionary containing the number of wins, losses, draws, and total games played by the specified team.
+    """
+    if team:
+        # Convert relevant columns to NumPy arrays
+        home_teams, away_teams, categories = team_codes(df)
+        home_scores = df['home_score'].values
+        away_scores = df['away_score'].values
+        
+        # Determine the matches involving the specified team
+        team_code = encode_one(categories, team)
+        is_home_team = home_teams == team_code
+        is_away_team = away_teams == team_code
+        
+        # Calculate wins, losses, and draws
+        wins = np.sum((is_home_team & (home_scores > away_scores)) | (is_away_team & (away_scores > home_scores)))
+        losses = np.sum((is_home_team & (home_scores < away_scores)) | (is_away_team & (away_scores < home_scores)))
+        draws = np.sum((is_home_team & (home_scores == away_scores)) | (is_away_team & (away_scores == home_scores)))
+        total_games = np.sum([wins, losses, draws])
+        return {'wins': wins, 'losses': losses, 'draws': draws, 'total_games': total_games}
+    
+    else:
+        return None
+    
+def team_won(df, team):
+    """
+    Identifies the indices of matches where the specified team won.
+
+    Parameters:
+    df (pd.DataFrame):  The input DataFrame containing match data.
+    team (str):         The team to identify wins for.
+
+    Returns:
+    pd.Index:           An index object containing the indices of the matches where the specified team won.
+    """
+
+    home_teams, away_teams, categories = team_codes(df)
+    home_scores = df['home_score'].values
+    away_scores = df['away_score'].values
+    team_code = encode_one(categories, team)
+
+    # Find the matches where the team won as home team or as away team
+    won = ((home_teams == team_code) & (home_scores > away_scores)) | ((away_teams == team_code) & (away_scores > home_scores))
+
+    return df.index[won]
+
+
+@instrumented
+def count_top_scorers(df_goals: pd.DataFrame, match_ids, n=10):
+    """
+    Counts the goals per scorer within a set of matches and returns the n scorers with the most goals.
+
+    Parameters:
+    df_goals (pd.DataFrame):    The DataFrame containing the goals (or the goals of one team, see team_goals) with a match_id column.
+    match_ids (array-like):     The match_id of the selected matches, e.g. the match_id column of a filtered results table.
+    n (int):                    The number of scorers to return.
+
+    Returns:
+    pd.DataFrame: A DataFrame with the columns scorer and counts, sorted from most to least goals.
+    """
+    goal_match_ids = df_goals['match_id'].to_numpy()
+    match_ids = np.asarray(match_ids)
+    scorer_codes, scorers = column_codes(df_goals['scorer'])
+
+    # Mark the selected matches in a lookup table, so selecting the goals is a single gather
+    is_selected = np.zeros(max(goal_match_ids.max(initial=-1), match_ids.max(initial=-1)) + 2, dtype=bool)
+    is_selected[match_ids] = True
+    selected = is_selected[goal_match_ids] & (goal_match_ids >= 0) & (scorer_codes >= 0)
+
+    counts = np.bincount(scorer_codes[selected], minlength=len(scorers))
+    return top_counts(counts, scorers, n)
+
+
+def top_counts(counts, names, n):
+    """
+    Selects the n largest counts without sorting all of them, ties are ordered by code.
+
+    Parameters:
+    counts (np.ndarray):    The count per code.
+    names (pd.Index):       The name per code.
+    n (int):                The number of names to return, names with a count of zero are left out.
+
+    Returns:
+    pd.DataFrame: A DataFrame with the columns scorer and counts, sorted from most to least.
+    """
+    n = min(n, np.count_nonzero(counts))
+    # One key that orders by count (most first) and then by code, so a tie at the n-th place is broken by code as well
+    order = -np.asarray(counts, dtype=np.int64) * len(counts) + np.arange(len(counts))
+    top = np.argpartition(order, n)[:n] if n < len(counts) else np.arange(len(counts))
+    top = top[np.argsort(order[top])][:n]
+    return pd.DataFrame({'scorer': names[top], 'counts': counts[top]})
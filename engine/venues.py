@@ -0,0 +1,111 @@
+"""
+Records per venue.
+
+The outcomes of all played matches summed per (team, opponent, tournament, year, venue country, venue type) like
+the outcome cube, so the record of a team per country it played in and at home, away or on neutral ground is a
+selection with cube_cells and one bincount, for any filter.
+"""
+import pandas as pd
+import numpy as np
+
+from instrument import instrumented
+from .cubes import combine_cells, cube_from_cells
+from .encoding import column_codes, team_codes
+
+
+VENUES = ['home', 'away', 'neutral']
+VENUE_COLUMNS = ['wins', 'draws', 'losses']
+
+
+def venue_cells(df_results: pd.DataFrame):
+    """
+    Sums the outcomes of the played matches per (team, opponent, tournament, year, country, venue) in one grouped pass.
+
+    Parameters:
+    df_results (pd.DataFrame):  The DataFrame containing match data, matches with missing values are left out like in outcome_cells.
+
+    Returns:
+    pd.DataFrame: The cells with the team, opponent, tournament and country codes, the year, the venue code (see VENUES) and the VENUE_COLUMNS.
+    """
+    df = df_results.dropna()
+    home_teams, away_teams, _ = team_codes(df)
+    tournaments, _ = column_codes(df['tournament'])
+    countries, _ = column_codes(df['country'])
+    years = df['date'].dt.year.to_numpy(dtype=np.int16)
+    home_scores = df['home_score'].to_numpy()
+    away_scores = df['away_score'].to_numpy()
+    neutral = df['neutral'].to_numpy(dtype=bool)
+
+    goals_for = np.concatenate([home_scores, away_scores])
+    goals_against = np.concatenate([away_scores, home_scores])
+    long = pd.DataFrame({
+        'team': np.concatenate([home_teams, away_teams]),
+        'opponent': np.concatenate([away_teams, home_teams]),
+        'tournament': np.concatenate([tournaments, tournaments]),
+        'year': np.concatenate([years, years]),
+        'country': np.concatenate([countries, countries]),
+        # The home team of a match on neutral ground is only the team listed first
+        'venue': np.where(np.concatenate([neutral, neutral]), 2, np.repeat(np.array([0, 1], dtype=np.int8), len(df))).astype(np.int8),
+        'wins': goals_for > goals_against,
+        'draws': goals_for == goals_against,
+        'losses': goals_for < goals_against,
+    })
+    return combine_cells([long], VENUE_COLUMNS)
+
+
+def build_venue_cube(df_results: pd.DataFrame):
+    """
+    Builds the venue cube from the match data in one grouped pass.
+
+    Returns:
+    dict: The team, tournament and country names, the cells sorted by team ('cells') and the offsets of every team in the cells ('offsets').
+    """
+    _, _, teams = team_codes(df_results)
+    _, tournaments = column_codes(df_results['tournament'])
+    _, countries = column_codes(df_results.dropna()['country'])
+    return cube_from_cells(venue_cells(df_results), teams, tournaments=tournaments, countries=countries)
+
+
+def venue_records(codes, cells: pd.DataFrame, names):
+    """
+    Sums the outcomes of cells per code, e.g. per venue or country.
+
+    Returns:
+    pd.DataFrame: The games, wins, draws, losses and win_ratio per name that has games.
+    """
+    sums = {column: np.bincount(codes, weights=cells[column].to_numpy(), minlength=len(names)).astype(int) for column in VENUE_COLUMNS}
+    df = pd.DataFrame({'games': sums['wins'] + sums['draws'] + sums['losses'], **sums}, index=names)
+    df = df[df['games'] > 0]
+    df['win_ratio'] = (df['wins'] / df['games']).round(3)
+    return df
+
+
+@instrumented
+def venue_splits(cells: pd.DataFrame):
+    """
+    Calculates the record of a team at home, away and on neutral ground.
+
+    Parameters:
+    cells (pd.DataFrame):   The selected cells of the venue cube, see cube_cells.
+
+    Returns:
+    pd.DataFrame: The venue, games, wins, draws, losses and win_ratio, in the order of VENUES.
+    """
+    df = venue_records(cells['venue'].to_numpy(), cells, VENUES).reindex(VENUES, fill_value=0)
+    return df.rename_axis('venue').reset_index()
+
+
+@instrumented
+def venue_countries(cube, cells: pd.DataFrame):
+    """
+    Calculates the record of a team per country it played in.
+
+    Parameters:
+    cube (dict):            The venue cube, see build_venue_cube.
+    cells (pd.DataFrame):   The selected cells of the venue cube, see cube_cells.
+
+    Returns:
+    pd.DataFrame: The country, games, wins, draws, losses and win_ratio, the country with the most games first.
+    """
+    df = venue_records(cells['country'].to_numpy(), cells, cube['countries'])
+    return df.rename_axis('country').reset_index().sort_values(by=['games', 'country'], ascending=[False, True], ignore_index=True)
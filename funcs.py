@@ -1,189 +1,160 @@
+from contextlib import contextmanager
+
 import pandas as pd
-import numpy as np
 import streamlit as st
 
+import instrument
+from engine import Engine
+from store import load_tables, read_manifest, read_ratings
+
 # Loading the data
-@st.cache_data
-def load_data():
+@st.cache_data(ttl=60)
+def load_manifest():
     """
-    A function that loads the data from csv and caches it so it can be shared accross sessions
+    Reads the manifest of the data store, checked at most once a minute so a refresh of the store is picked up by a running app.
     """
-    df_goals = pd.read_csv('data/goalscorers.csv')
-    df_results = pd.read_csv('data/results.csv')
-    df_shootouts = pd.read_csv('data/shootouts.csv')
-    df_locations = pd.read_csv('data/country_coords.csv')
-
-
-    df_goals['date'] = pd.to_datetime(df_goals['date'], format='%Y-%m-%d')
-    df_results['date'] = pd.to_datetime(df_results['date'], format='%Y-%m-%d')
-    df_shootouts['date'] = pd.to_datetime(df_shootouts['date'], format='%Y-%m-%d')
-
-
-    return df_goals, df_results, df_shootouts, df_locations
-
-@st.cache_data
-def get_win_ratio(df_results, df_locations, for_team):
-    teams = pd.concat([df_results['home_team'], df_results['away_team']]).unique()
-    df_locations = df_locations[df_locations['country'].isin(teams)]
-    for team in teams:
-        df = df_results[(df_results['home_team'] == team) | (df_results['away_team'] == team)]
-        games = len(df)
-        wins = len(team_won(df, for_team))
-        if wins > 0.0:
-            win_ratio = round(wins/games, 3)
-        else:
-            win_ratio = 0.0
-        df_locations.loc[df_locations['country'] == team, 'win_ratio'] = win_ratio
-    return df_locations
-
+    return read_manifest()
 
-def filter_team(df: pd.DataFrame, teams):
+@st.cache_resource(max_entries=1)
+def load_engine(version=None):
     """
-    Filters the DataFrame for matches involving the specified teams.
+    A function that loads the data from the columnar store (or csv when the store is not built) into the engine and caches it so it can be shared accross sessions.
+    The frames are shared without copying, so they should be treated as read-only.
 
     Parameters:
-    df (pd.DataFrame):              The input DataFrame containing match data.
-    teams (str or list of str):     The team(s) to filter by. Can be a single team as a string or multiple teams as a list of strings.
+    version (str, optional):    The dataset version from the manifest, a new version reloads the data.
+    """
+    # The manifest has the version per team and year, so a refresh only invalidates the cached results it affects
+    return Engine(load_tables(), version=version, ratings=read_ratings(version), manifest=read_manifest())
 
-    Returns:
-    pd.DataFrame: A DataFrame containing only the matches where the specified team(s) played as either the home or away team.
 
-    Raises:
-    ValueError: If the teams parameter is not a string or a list of strings, or if the teams are not present in the DataFrame.
-    """
-    if isinstance(teams, str):
-        teams = [teams]
-    if not isinstance(teams, list):
-        raise ValueError("Teams should be a string or a list of strings")
-    
-    if any(team in df["home_team"].unique() or team in df["away_team"].unique() for team in teams):
-        return df[(df["home_team"].isin(teams)) | (df['away_team'].isin(teams))]
-    else:
-        raise ValueError("One or more given teams are not available within the current set of filters")
+# The background of a row per outcome of the match, draws keep the default background
+OUTCOME_STYLES = {
+    'win': 'background-color: rgba(0, 255, 0, 0.1)',
+    'draw': '',
+    'loss': 'background-color: rgba(255, 0, 0, 0.1)',
+}
 
-def filter_tournament(df: pd.DataFrame, choices):    
+def highlight_outcomes(df, outcomes):
     """
-    Filters the DataFrame for matches from the specified tournaments.
+    Highlights the rows of a DataFrame by the outcome of their match. The styles are looked up once for all rows
+    and applied column by column, instead of calling a function per row.
 
     Parameters:
-    df (pd.DataFrame):      The input DataFrame containing match data.
-    choices (list of str):  The list of tournaments to filter by.
+    df (pd.DataFrame):          The DataFrame to style.
+    outcomes (array-like):      The outcome of every row, see engine.match_outcomes.
 
     Returns:
-    pd.DataFrame: A DataFrame containing only the matches from the specified tournaments.
+    pandas.io.formats.style.Styler: The styled DataFrame.
     """
-    return df[df['tournament'].isin(choices)]
+    styles = pd.Series(outcomes, dtype=object).map(OUTCOME_STYLES).fillna('').to_numpy()
+    return df.style.apply(lambda column: styles, axis=0)
 
-def filter_years(df: pd.DataFrame, year_range):
-    """
-    Filters the DataFrame for matches within the specified year range.
 
-    Parameters:
-    df (pd.DataFrame):      The input DataFrame containing match data.
-    year_range (tuple):     A tuple specifying the start and end years (inclusive) to filter by.
+# Instrumentation
+# ------------------------------
+# Only switched on for sessions that open a page with ?debug=1, all other sessions skip the spans
 
-    Returns:
-    pd.DataFrame: A DataFrame containing only the matches within the specified year range.
-    """
-    start, end = year_range
-    return df[(df["date"].dt.year >= start) & (df["date"].dt.year <= end)]
+def debug_enabled():
+    return st.query_params.get('debug') == '1'
 
-def filter_dataframe(df: pd.DataFrame, home_team=None, tournaments=None, opponents=None, year_range=None):
+def start_recording(name):
     """
-    Filters the DataFrame based on multiple criteria including home team, tournaments, opponents, and year range.
+    Starts recording the spans of a rerun of a page when debugging is enabled, and profiles the rerun when that was requested
+    in the debug panel.
 
     Parameters:
-    df (pd.DataFrame):                          The input DataFrame containing match data.
-    home_team (str or list of str, optional):   The team(s) to filter by for home matches.
-    tournaments (list of str, optional):        The tournaments to filter by.
-    opponents (str or list of str, optional):   The team(s) to filter by for opponent matches.
-    year_range (tuple, optional):               A tuple specifying the start and end years (inclusive) to filter by.
+    name (str): The name of the page.
 
     Returns:
-    pd.DataFrame: A DataFrame filtered based on the specified criteria.
+    instrument.Recorder: The recorder of the rerun, or None when debugging is not enabled.
     """
+    if not debug_enabled():
+        instrument.activate(None)
+        return None
+    recorder = instrument.Recorder(name)
+    instrument.activate(recorder)
+    if st.session_state.pop('debug_profile_next', False):
+        recorder.profiler = instrument.Profiler()
+        recorder.profiler.start()
+    return recorder
 
-    df = df.dropna()  # Drop missing values, e.g. games still to come
-    if home_team:
-        df = filter_team(df, home_team)
-    if tournaments:
-        df = filter_tournament(df, tournaments)
-    if opponents:
-        df = filter_team(df, opponents)
-    if year_range:
-        df = filter_years(df, year_range)
-    
-    return df
-
-
-def calculate_team_stats(df, team):
+def finish_recording(recorder):
     """
-    Calculates statistics for a specified team including wins, losses, draws, and total games played.
-
-    Parameters:
-    df (pd.DataFrame):  The input DataFrame containing match data.
-    team (str):         The team to calculate statistics for.
+    Stops recording, adds the spans to the totals of the process and keeps the recorder for the debug panel of the session.
+    """
+    instrument.activate(None)
+    instrument.METRICS.add(recorder.spans)
+    if recorder.profiler is not None:
+        st.session_state['debug_profile'] = recorder.profiler.stop()
+    # The last few recorders, so the runs of a fragment show up next to the run of the page
+    st.session_state['debug_recorders'] = (st.session_state.get('debug_recorders', []) + [recorder])[-20:]
 
-    Returns:
-    dict: A dictionary containing the number of wins, losses, draws, and total games played by the specified team.
-    """
-    if team:
-        # Convert relevant columns to NumPy arrays
-        home_teams = df['home_team'].values
-        away_teams = df['away_team'].values
-        home_scores = df['home_score'].values
-        away_scores = df['away_score'].values
-        
-        # Determine the matches involving the specified team
-        is_home_team = home_teams == team
-        is_away_team = away_teams == team
-        
-        # Calculate wins, losses, and draws
-        wins = np.sum((is_home_team & (home_scores > away_scores)) | (is_away_team & (away_scores > home_scores)))
-        losses = np.sum((is_home_team & (home_scores < away_scores)) | (is_away_team & (away_scores < home_scores)))
-        draws = np.sum((is_home_team & (home_scores == away_scores)) | (is_away_team & (away_scores == home_scores)))
-        total_games = np.sum([wins, losses, draws])
-        return {'wins': wins, 'losses': losses, 'draws': draws, 'total_games': total_games}
-    
-    else:
-        return None
-    
-def team_won(df, team):
+@contextmanager
+def timed(name):
     """
-    Identifies the indices of matches where the specified team won.
+    Times a section of a page. A fragment that reruns on its own is recorded as a run of its own.
 
     Parameters:
-    df (pd.DataFrame):  The input DataFrame containing match data.
-    team (str):         The team to identify wins for.
-
-    Returns:
-    pd.Index:           An index object containing the indices of the matches where the specified team won.
+    name (str): The name of the section.
     """
+    if instrument.active() is not None or not debug_enabled():
+        with instrument.span(name):
+            yield
+        return
+    recorder = start_recording(name)
+    try:
+        with instrument.span(name):
+            yield
+    finally:
+        finish_recording(recorder)
 
-    # Find indices where the team won as home team
-    home_wins = df[(df['home_team'] == team) & (df['home_score'] > df['away_score'])].index
-    
-    # Find indices where the team won as away team
-    away_wins = df[(df['away_team'] == team) & (df['away_score'] > df['home_score'])].index
-    
-    # Combine the indices
-    won_indices = home_wins.union(away_wins)
-    
-    return won_indices
-
-def highlight_wins(s, won_indices):
+def spans_frame(recorders):
     """
-    Highlights the rows in a DataFrame where the specified team won.
-
-    Parameters:
-    s (pd.Series):          A series object representing a row in the DataFrame.
-    won_indices (pd.Index): An index object containing the indices of the matches where the specified team won.
+    Returns the spans of recorders as a DataFrame, with the name indented by the nesting of the spans.
+    """
+    rows = [
+        {'run': recorder.name, 'span': '  ' * entry['depth'] + entry['name'], 'ms': round(entry['ms'], 2),
+         'rows': entry.get('rows'), 'cache': entry.get('cache')}
+        for recorder in recorders
+        for entry in sorted(recorder.spans, key=lambda entry: entry['start_ms'])
+    ]
+    return pd.DataFrame(rows, columns=['run', 'span', 'ms', 'rows', 'cache'])
 
-    Returns:
-    list: A list of strings representing the CSS styles to apply to the row. Rows where the team won are highlighted.
+def debug_panel(recorder, engine):
     """
+    Finishes the recording of a rerun and shows the hidden debug panel: the spans of the last runs, the cache statistics,
+    the export of the spans and totals to a local file and profiling of the next rerun.
 
-    if s.name in won_indices:
-        return ['background-color: rgba(0, 255, 0, 0.1)'] * len(s)
-    else:
-        return [''] * len(s)
\ No newline at end of file
+    Parameters:
+    recorder (instrument.Recorder): The recorder of the rerun, nothing is shown when it is None.
+    engine (Engine):                The engine of the page.
+    """
+    if recorder is None:
+        return
+    finish_recording(recorder)
+    recorders = st.session_state['debug_recorders']
+    # The run of the page and the fragment runs after the previous run of the page
+    page_runs = [position for position, run in enumerate(recorders[:-1]) if run.name == recorder.name]
+    latest = recorders[page_runs[-1] + 1:] if page_runs else recorders
+
+    with st.expander('Debug'):
+        total_ms = sum(entry['ms'] for entry in recorder.spans if entry['depth'] == 0)
+        st.caption(f'{len(recorder.spans)} spans, {total_ms:.1f} ms in the sections of this rerun')
+        st.dataframe(spans_frame(latest), hide_index=True, width='stretch')
+        if hasattr(engine.cache, 'stats'):
+            st.json(engine.cache.stats(), expanded=False)
+
+        col1, col2, col3 = st.columns(3)
+        if col1.button('Export JSON lines'):
+            st.success(f'Written to {instrument.write_jsonl(recorder)}')
+        if col2.button('Export Prometheus'):
+            st.success(f'Written to {instrument.write_prometheus()}')
+        if col3.button('Profile the next rerun'):
+            st.session_state['debug_profile_next'] = True
+            st.rerun()
+
+        if 'debug_profile' in st.session_state:
+            path, report = st.session_state['debug_profile']
+            st.caption(f'Profile of a rerun, written to {path}')
+            st.code(report, language=None)
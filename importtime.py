@@ -0,0 +1,109 @@
+"""
+Import-time check of the app, so a heavy import at startup is caught before it reaches the autoscaled replicas.
+
+Imports the modules every page needs before it renders in a fresh interpreter with `python -X importtime`, and fails
+when their import takes longer than the budget or when it pulls in a module that should only load when its section
+renders. The pages themselves are checked for imports of those modules that run on every rerun, i.e. outside of a
+function. A page that draws a chart on every run imports its library plainly instead, see PAGE_MODULES:
+
+    python importtime.py
+    python importtime.py --budget 1500 --repeat 5
+
+The run exits with status 1 when a check fails.
+"""
+import argparse
+import ast
+import glob
+import os
+import subprocess
+import sys
+
+# The modules the pages import before anything is rendered
+STARTUP_MODULES = ['streamlit', 'funcs']
+# Only imported by the section that needs them (folium, altair) or by the refresh pipeline (kaggle)
+LAZY_MODULES = ['altair', 'folium', 'kaggle']
+# Imported plainly by a page since it draws them on every run, these count towards the budget
+PAGE_MODULES = {'⚽_Football_Statistics.py': ['altair']}
+PAGES = ['⚽_Football_Statistics.py'] + sorted(glob.glob('pages/*.py'))
+DEFAULT_BUDGET_MS = 2000
+
+
+def measure(modules):
+    """
+    Imports modules in a fresh interpreter with -X importtime.
+
+    Parameters:
+    modules (list of str):  The modules to import.
+
+    Returns:
+    dict: The cumulative import time in ms per imported module, including the modules they import.
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {", ".join(modules)}'],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if process.returncode:
+        raise RuntimeError(process.stderr)
+
+    # Lines look like "import time:  self [us] | cumulative | imported package", nested imports are indented
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def top_level_imports(path):
+    """
+    Returns the modules a page imports on every rerun, i.e. anywhere outside of a function or class body.
+    """
+    with open(path, encoding='utf-8') as file:
+        tree = ast.parse(file.read())
+    names = []
+    nodes = list(tree.body)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ast.Import):
+            names += [alias.name.split('.')[0] for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.append(node.module.split('.')[0])
+        # A with, if or try block at the top level runs on every rerun as well, a function only when it is called
+        elif not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            nodes += [child for child in ast.iter_child_nodes(node) if isinstance(child, ast.stmt)]
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of the app against a budget.')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_MS, help='the maximum import time of the startup modules in ms')
+    parser.add_argument('--repeat', type=int, default=3, help='the best of this many runs counts, the first one also compiles the bytecode')
+    args = parser.parse_args()
+
+    # The budget covers the startup modules together with the modules the pages import plainly
+    budgeted = STARTUP_MODULES + sorted({name for names in PAGE_MODULES.values() for name in names})
+    runs = [measure(budgeted) for _ in range(args.repeat)]
+    times = min(runs, key=lambda times: sum(times[name] for name in budgeted))
+    total = sum(times[name] for name in budgeted)
+
+    failures = []
+    if total > args.budget:
+        failures.append(f'importing {", ".join(budgeted)} took {total:.0f} ms, over the budget of {args.budget:.0f} ms')
+    startup = measure(STARTUP_MODULES)
+    failures += [f'{name} is imported at startup' for name in LAZY_MODULES if name in startup]
+    for page in PAGES:
+        allowed = PAGE_MODULES.get(page, [])
+        failures += [f'{page} imports {name} on every rerun' for name in top_level_imports(page) if name in LAZY_MODULES and name not in allowed]
+
+    print(f'Startup imports took {total:.0f} ms (budget {args.budget:.0f} ms), the slowest packages:')
+    packages = {name: ms for name, ms in times.items() if '.' not in name}
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:10]:
+        print(f'  {name:<24} {ms:8.1f} ms')
+    for failure in failures:
+        print(f'FAILED: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
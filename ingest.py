@@ -0,0 +1,161 @@
+"""
+Chunked ingestion for datasets that do not fit in memory.
+
+The csv files are streamed in fixed-size chunks and folded into the outcome cube and a scorer cube,
+so the raw matches and goals are never resident at the same time. This is a memory-bounded import only:
+the cubes are returned by ingest and nothing is written, the app itself still builds its indexes from the
+store (`python store.py`). Run `python ingest.py [directory]` to see whether a directory of csv files can be
+folded within bounded memory, with the progress and memory reported per chunk. checks.py compares the
+folded cubes with the ones the engine builds from the store.
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from engine import CUBE_COLUMNS, combine_cells, cube_from_cells, outcome_cells
+from store import DATA_DIR
+
+# Combine the partial cells once this many chunks have been folded, so their number stays bounded
+COMPACT_EVERY = 8
+KEY_BASE = 2**20
+
+
+class GrowingEncoding:
+    """
+    Maps names to integer codes across chunks, new names get the next free code so earlier codes never change.
+    """
+
+    def __init__(self):
+        self.names = pd.Index([], dtype=object)
+
+    def dtype(self, *columns):
+        """
+        Adds the unseen names of the given columns and returns the categorical dtype of all names seen so far.
+        """
+        values = pd.concat([column.dropna().astype(str) for column in columns]).unique()
+        unseen = values[self.names.get_indexer(values) < 0]
+        if len(unseen):
+            self.names = self.names.append(pd.Index(unseen, dtype=object))
+        return pd.CategoricalDtype(self.names)
+
+
+def match_keys(dates, home_codes, away_codes):
+    """
+    Combines the date and the team codes of every match into one integer key that does not depend on the number of teams.
+    """
+    days = dates.to_numpy().astype('datetime64[D]').astype(np.int64)
+    return (days * KEY_BASE + home_codes.astype(np.int64) + 1) * KEY_BASE + away_codes.astype(np.int64) + 1
+
+
+def report_memory():
+    """
+    Returns the current and peak memory traced since the ingestion started, in MB.
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    return current / 2**20, peak / 2**20
+
+
+def print_progress(table, chunk, rows, current, peak):
+    print(f'{table}: chunk {chunk}, {rows} rows, {current:.1f} MB current, {peak:.1f} MB peak')
+
+
+def ingest(data_dir=DATA_DIR, chunksize=50_000, progress=print_progress):
+    """
+    Streams the results and goals csv files in chunks and folds them into the outcome cube and the scorer cube.
+
+    Parameters:
+    data_dir (str):         The directory containing results.csv and goalscorers.csv.
+    chunksize (int):        The number of rows per chunk.
+    progress (callable):    Called after every chunk with the table, chunk number, rows so far and the current and peak memory in MB.
+
+    Returns:
+    dict: The outcome cube ('outcomes'), the scorer cube ('scorers') and the number of rows and peak memory in MB ('stats').
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+
+    teams, tournaments, scorers = GrowingEncoding(), GrowingEncoding(), GrowingEncoding()
+    outcome_parts, key_parts, tournament_parts = [], [], []
+    rows = {'results': 0, 'goalscorers': 0}
+
+    # Fold the matches into the outcome cube, keeping only the key and tournament of every match for the goals
+    chunks = pd.read_csv(os.path.join(data_dir, 'results.csv'), chunksize=chunksize, parse_dates=['date'])
+    for chunk_number, chunk in enumerate(chunks, start=1):
+        team_dtype = teams.dtype(chunk['home_team'], chunk['away_team'])
+        chunk = chunk.astype({'home_team': team_dtype, 'away_team': team_dtype, 'tournament': tournaments.dtype(chunk['tournament'])})
+
+        outcome_parts.append(outcome_cells(chunk))
+        if len(outcome_parts) >= COMPACT_EVERY:
+            outcome_parts = [combine_cells(outcome_parts, CUBE_COLUMNS)]
+        key_parts.append(match_keys(chunk['date'], chunk['home_team'].cat.codes, chunk['away_team'].cat.codes))
+        tournament_parts.append(chunk['tournament'].cat.codes.to_numpy())
+
+        rows['results'] += len(chunk)
+        progress('results', chunk_number, rows['results'], *report_memory())
+
+    # Like the store, the goals of a match that is listed twice belong to its first listing
+    match_lookup = pd.Index(np.concatenate(key_parts))
+    first = ~match_lookup.duplicated()
+    match_lookup = pd.Index(match_lookup[first])
+    match_tournaments = np.concatenate(tournament_parts)[first]
+    del key_parts, tournament_parts
+
+    scorer_parts = []
+    chunks = pd.read_csv(os.path.join(data_dir, 'goalscorers.csv'), chunksize=chunksize, parse_dates=['date'])
+    for chunk_number, chunk in enumerate(chunks, start=1):
+        rows['goalscorers'] += len(chunk)
+        team_dtype = teams.dtype(chunk['home_team'], chunk['away_team'], chunk['team'])
+        chunk = chunk.dropna(subset=['scorer']).astype({
+            'home_team': team_dtype, 'away_team': team_dtype, 'team': team_dtype, 'scorer': scorers.dtype(chunk['scorer']),
+        })
+        home_codes = chunk['home_team'].cat.codes.to_numpy()
+        away_codes = chunk['away_team'].cat.codes.to_numpy()
+        team_codes = chunk['team'].cat.codes.to_numpy()
+
+        position = match_lookup.get_indexer(match_keys(chunk['date'], home_codes, away_codes))
+        found = position >= 0
+        scorer_parts.append(pd.DataFrame({
+            'team': team_codes[found],
+            'opponent': np.where(team_codes == home_codes, away_codes, home_codes)[found],
+            'tournament': match_tournaments[position[found]],
+            'year': chunk['date'].dt.year.to_numpy(dtype=np.int16)[found],
+            'scorer': chunk['scorer'].cat.codes.to_numpy()[found],
+            'goals': np.ones(found.sum(), dtype=np.int32),
+        }))
+        if len(scorer_parts) >= COMPACT_EVERY:
+            scorer_parts = [combine_cells(scorer_parts, ['goals'])]
+
+        progress('goalscorers', chunk_number, rows['goalscorers'], *report_memory())
+
+    team_names, tournament_names = teams.names, tournaments.names
+    outcomes = cube_from_cells(combine_cells(outcome_parts, CUBE_COLUMNS), team_names, tournaments=tournament_names)
+    scorer_cube = cube_from_cells(combine_cells(scorer_parts, ['goals']), team_names, tournaments=tournament_names, scorers=scorers.names)
+
+    _, peak = report_memory()
+    if not tracing:
+        tracemalloc.stop()
+    return {'outcomes': outcomes, 'scorers': scorer_cube, 'stats': {'rows': rows, 'peak_mb': peak}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest csv files in chunks within bounded memory and report the peak.')
+    parser.add_argument('data_dir', nargs='?', default=DATA_DIR)
+    parser.add_argument('--chunksize', type=int, default=50_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    aggregates = ingest(args.data_dir, chunksize=args.chunksize)
+
+    stats = aggregates['stats']
+    print(f'Ingested {sum(stats["rows"].values())} rows from {args.data_dir} in {time.perf_counter() - start:.2f}s, '
+          f'{stats["peak_mb"]:.1f} MB peak: {len(aggregates["outcomes"]["cells"])} outcome cells and '
+          f'{len(aggregates["scorers"]["cells"])} scorer cells for {len(aggregates["outcomes"]["teams"])} teams')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Opt-in instrumentation of the dashboard, without any dependency on Streamlit.
+
+Code is timed with `span(name)` blocks and the `instrumented` decorator. They only record when a Recorder is active in
+the current context (the page activates one with ?debug=1), otherwise they cost a single context variable lookup.
+The spans of a rerun can be exported as JSON lines, and the totals of all reruns of the process as Prometheus text.
+"""
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+DEBUG_DIR = './debug'
+
+_active = contextvars.ContextVar('recorder', default=None)
+
+
+class Recorder:
+    """
+    Collects the spans of one rerun, in the order they finished. A profiler can be attached to profile the rerun as well.
+    """
+
+    def __init__(self, name='rerun'):
+        self.name = name
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+        self.profiler = None
+
+
+def activate(recorder):
+    """
+    Makes a recorder the active one of the current context, or switches recording off with None.
+    """
+    _active.set(recorder)
+
+
+def active():
+    """
+    Returns the active recorder, or None when nothing is recorded.
+    """
+    return _active.get()
+
+
+@contextmanager
+def span(name, **fields):
+    """
+    Times a block of code as a span of the active recorder.
+
+    Parameters:
+    name (str):     The name of the span.
+    fields:         Extra fields of the span, e.g. rows. The block can add more to the yielded dictionary.
+
+    Yields:
+    dict: The fields of the span.
+    """
+    recorder = _active.get()
+    if recorder is None:
+        yield fields
+        return
+
+    start = time.perf_counter()
+    fields = {'name': name, 'depth': recorder.depth, 'start_ms': (start - recorder.origin) * 1000, **fields}
+    recorder.depth += 1
+    try:
+        yield fields
+    finally:
+        fields['ms'] = (time.perf_counter() - start) * 1000
+        recorder.depth -= 1
+        recorder.spans.append(fields)
+
+
+def instrumented(function=None, rows='argument'):
+    """
+    Records every call of a function as a span, used as @instrumented or @instrumented(rows='result').
+
+    Parameters:
+    function (callable):    The function to record.
+    rows (str):             Where the rows scanned come from: 'argument' for the first DataFrame argument, 'result' for
+                            functions that read through an index or slice a cube, which only touch the rows they return.
+    """
+    if function is None:
+        return functools.partial(instrumented, rows=rows)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _active.get() is None:
+            return function(*args, **kwargs)
+        with span(function.__name__) as fields:
+            result = function(*args, **kwargs)
+            values = (result,) if rows == 'result' else (*args, *kwargs.values())
+            frames = [value for value in values if isinstance(value, pd.DataFrame)]
+            fields['rows'] = len(frames[0]) if frames else None
+            return result
+    return wrapper
+
+
+class Metrics:
+    """
+    Totals of the spans of all recorded reruns of the process: the number of calls, the time, the rows scanned
+    and the cache hits and misses per span name.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, spans):
+        with self._lock:
+            for entry in spans:
+                total = self.totals.setdefault(entry['name'], {'count': 0, 'seconds': 0.0, 'rows': 0, 'hit': 0, 'miss': 0})
+                total['count'] += 1
+                total['seconds'] += entry['ms'] / 1000
+                total['rows'] += entry.get('rows') or 0
+                if entry.get('cache') in ('hit', 'miss'):
+                    total[entry['cache']] += 1
+
+    def prometheus(self):
+        """
+        Returns the totals in the Prometheus text exposition format.
+        """
+        lines = [
+            '# HELP football_span_seconds Time spent in a section or function of the dashboard.',
+            '# TYPE football_span_seconds summary',
+        ]
+        with self._lock:
+            totals = sorted(self.totals.items())
+        for name, total in totals:
+            lines.append(f'football_span_seconds_sum{{span="{name}"}} {total["seconds"]:.6f}')
+            lines.append(f'football_span_seconds_count{{span="{name}"}} {total["count"]}')
+        lines += ['# HELP football_rows_scanned_total Rows scanned by a function of the dashboard.', '# TYPE football_rows_scanned_total counter']
+        lines += [f'football_rows_scanned_total{{span="{name}"}} {total["rows"]}' for name, total in totals if total['rows']]
+        lines += ['# HELP football_cache_requests_total Cached queries of the dashboard by result.', '# TYPE football_cache_requests_total counter']
+        for name, total in totals:
+            if total['hit'] or total['miss']:
+                lines.append(f'football_cache_requests_total{{query="{name}",result="hit"}} {total["hit"]}')
+                lines.append(f'football_cache_requests_total{{query="{name}",result="miss"}} {total["miss"]}')
+        return '\n'.join(lines) + '\n'
+
+
+# The totals of this process, added to at the end of every recorded rerun
+METRICS = Metrics()
+
+
+def write_jsonl(recorder, path=os.path.join(DEBUG_DIR, 'spans.jsonl')):
+    """
+    Appends the spans of a recorder to a JSON lines file, one line per span.
+
+    Returns:
+    str: The path of the file.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as file:
+        for entry in recorder.spans:
+            file.write(json.dumps({'rerun': recorder.name, 'started': recorder.started, **entry}, default=str) + '\n')
+    return path
+
+
+def write_prometheus(metrics=METRICS, path=os.path.join(DEBUG_DIR, 'metrics.prom')):
+    """
+    Writes the totals in the Prometheus text format, e.g. for the textfile collector of the node exporter.
+
+    Returns:
+    str: The path of the file.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.tmp', 'w') as file:
+        file.write(metrics.prometheus())
+    os.replace(f'{path}.tmp', path)
+    return path
+
+
+class Profiler:
+    """
+    Runs cProfile and tracemalloc around one rerun and writes a report of the slowest functions and the largest allocations.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        tracemalloc.start()
+        self.profile.enable()
+
+    def stop(self, directory=DEBUG_DIR, top=30):
+        """
+        Stops profiling and writes the report.
+
+        Returns:
+        tuple: The path of the report and its text.
+        """
+        self.profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        report = io.StringIO()
+        pstats.Stats(self.profile, stream=report).sort_stats('cumulative').print_stats(top)
+        report.write(f'\nPeak traced memory: {peak / 2**20:.1f} MB\nLargest allocations:\n')
+        for statistic in snapshot.statistics('lineno')[:top]:
+            report.write(f'{statistic}\n')
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'profile-{datetime.now():%Y%m%d-%H%M%S}.txt')
+        with open(path, 'w') as file:
+            file.write(report.getvalue())
+        return path, report.getvalue()
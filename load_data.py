@@ -1,4 +1,6 @@
-import kaggle
+import sys
 
-api = kaggle.api
-kaggle.api.dataset_download_files('martj42/international-football-results-from-1872-to-2017', path='./data_new', unzip=True)
\ No newline at end of file
+from refresh import DirectorySource, KaggleSource, main
+
+# Refreshes the data store with the latest Kaggle dataset, or with the csv files in a directory when one is given
+main(DirectorySource(sys.argv[1]) if len(sys.argv) > 1 else KaggleSource())
@@ -0,0 +1,331 @@
+"""
+Load test of the dashboard with many concurrent sessions, to see how the rerun latency holds up under load and
+whether a change to the caching actually helps when many viewers use the app at the same time.
+
+Every session is a headless run of the main page (Streamlit's AppTest) that reruns the page after a random change,
+like a viewer clicking through the dashboard: another team, tournaments, opponents, years or an opened section.
+The sessions run at the same time, each on its own thread in one process like the sessions of one `streamlit run`
+server, so they share the engine of st.cache_resource and its result cache and contend for it and for the GIL.
+The web server itself (the websocket and the rendering in the browser) is not part of the test:
+
+    python loadtest.py
+    python loadtest.py --sessions 16 --reruns 20 --seed 1
+
+Reports the p50/p95/p99 rerun latency, the throughput, the most runs that were in flight at once, and the hit rate
+of the shared result cache and the RSS of the process.
+Every run is saved to ./loadtest/ and compared with the previous run, or with the run given with --baseline.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, the RSS is left out there
+    resource = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PAGE = os.path.join(ROOT, '⚽_Football_Statistics.py')
+RESULTS_DIR = os.path.join(ROOT, 'loadtest')
+# The expanders of the page below the fold, opened by setting their key in the session state
+SECTIONS = ['form_section', 'match_history_section', 'games_per_tournament_section', 'goal_timing_section', 'shootout_section', 'world_map_section']
+# How often a viewer changes what, a section is opened on top of the current filters
+ACTIONS = {'team': 0.3, 'tournaments': 0.15, 'opponents': 0.15, 'years': 0.2, 'section': 0.2}
+
+
+def random_action(at, rnd):
+    """
+    Changes one widget of a session at random, the change takes effect on the next run.
+
+    Parameters:
+    at (AppTest):           The session after at least one run.
+    rnd (random.Random):    The random generator of the session.
+
+    Returns:
+    str: The kind of change, one of ACTIONS.
+    """
+    action = rnd.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+    sidebar = at.sidebar
+    if action == 'team':
+        sidebar.selectbox[0].set_value(rnd.choice(sidebar.selectbox[0].options))
+    elif action in ('tournaments', 'opponents'):
+        widget = sidebar.multiselect[0 if action == 'tournaments' else 1]
+        # Half of the time the filter is cleared again
+        choices = rnd.sample(widget.options, k=min(len(widget.options), rnd.randint(1, 3))) if rnd.random() < 0.5 else []
+        widget.set_value(choices)
+    elif action == 'years':
+        slider = sidebar.slider[0]
+        start, end = sorted(rnd.sample(range(int(slider.min), int(slider.max) + 1), k=2))
+        slider.set_range(start, end)
+    else:
+        at.session_state[rnd.choice(SECTIONS)] = True
+    return action
+
+
+def process_memory():
+    """
+    Returns the current and the peak resident memory of this process in MB, None where it cannot be read.
+    """
+    current = peak = None
+    if resource is not None:
+        # In kB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as file:
+            current = int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    return current, peak
+
+
+def hit_rates(stats):
+    """
+    Calculates the hit rates from the statistics of the result cache, see cache.py.
+
+    Parameters:
+    stats (dict):   The statistics of an LRUCache, DiskCache or NullCache, or of a TieredCache ({'first', 'second'}).
+
+    Returns:
+    dict: The hit rate of every tier and overall, the share of lookups that did not have to be computed.
+    """
+    tiers = {'memory': stats['first'], 'disk': stats['second']} if 'first' in stats else {'memory': stats}
+    rates = {}
+    for name, tier in tiers.items():
+        lookups = tier['hits'] + tier['misses']
+        rates[name] = tier['hits'] / lookups if lookups else None
+    lookups = stats['first']['hits'] + stats['first']['misses'] if 'first' in stats else stats['hits'] + stats['misses']
+    computed = stats['second']['misses'] if 'first' in stats else stats['misses']
+    rates['overall'] = 1 - computed / lookups if lookups else None
+    return rates
+
+
+def keep_runtime():
+    """
+    AppTest installs a mock Streamlit runtime for every run and removes it again when the run ends. With the sessions
+    on threads one session would remove it while another one still runs, so the runtime of the latest run is kept.
+    """
+    from streamlit.runtime import Runtime
+
+    latest = {}
+
+    def current(cls):
+        if cls._instance is not None:
+            latest['runtime'] = cls._instance
+        return latest.get('runtime')
+
+    def instance(cls):
+        runtime = current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+
+
+def run_sessions(sessions, reruns, seed, timeout):
+    """
+    Runs the sessions at the same time, each on its own thread, against the engine and cache they share.
+
+    Parameters:
+    sessions (int):     The number of concurrent sessions.
+    reruns (int):       The number of reruns per session after its first run.
+    seed (int):         The seed of the random changes.
+    timeout (float):    The maximum time of one run in seconds.
+
+    Returns:
+    dict: The runs (kind and latency in ms), the errors, the most runs in flight at once, the statistics of the
+          shared cache and the memory of the process.
+    """
+    # Imported here, so --help does not have to load Streamlit and the engine
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    from streamlit.testing.v1 import AppTest
+
+    import funcs
+    from store import read_manifest
+
+    # AppTest compiles the page again on every run, and the magic of Streamlit parses it with ast.parse, which is not
+    # thread-safe on Python 3.11. The pages do not use magic, and a server compiles a page only once anyway.
+    config.set_option('runner.magicEnabled', False)
+    # Without a server every session warns that it runs in bare mode
+    set_log_level('error')
+    keep_runtime()
+    os.chdir(ROOT)
+    runs, errors = [], []
+    # An exception on a thread of Streamlit (e.g. the thread that runs the page) counts as an error as well
+    threading.excepthook = lambda hook: errors.append(f'{hook.thread.name if hook.thread else "thread"}: {hook.exc_value!r}')
+    lock = threading.Lock()
+    in_flight = {'now': 0, 'most': 0}
+    # All sessions start their first run together
+    start_line = threading.Barrier(sessions)
+
+    def run(at, kind):
+        with lock:
+            in_flight['now'] += 1
+            in_flight['most'] = max(in_flight['most'], in_flight['now'])
+        start = time.perf_counter()
+        try:
+            at.run()
+        except Exception as error:  # A timeout or a broken session counts as an error, the other sessions go on
+            errors.append(f'{kind}: {error!r}')
+            return False
+        finally:
+            with lock:
+                in_flight['now'] -= 1
+        runs.append({'kind': kind, 'ms': (time.perf_counter() - start) * 1000})
+        errors.extend(f'{kind}: {exception.value}' for exception in at.exception)
+        return True
+
+    def session(number):
+        rnd = random.Random(f'{seed}-{number}')
+        at = AppTest.from_file(PAGE, default_timeout=timeout)
+        start_line.wait()
+        if not run(at, 'first'):
+            return
+        for _ in range(reruns):
+            if not run(at, random_action(at, rnd)):
+                return
+
+    threads = [threading.Thread(target=session, args=(number,)) for number in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The one engine (and cache) all sessions used, st.cache_resource returns the same object here
+    engine = funcs.load_engine(read_manifest()['version'])
+    rss, peak_rss = process_memory()
+    return {
+        'runs': runs, 'errors': errors, 'most_in_flight': in_flight['most'],
+        'cache': engine.cache.stats(), 'rss_mb': rss, 'peak_rss_mb': peak_rss,
+    }
+
+
+def percentiles(values):
+    """
+    Returns the p50, p95 and p99 of a list of latencies, None when it is empty.
+    """
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+
+def summarize(result, seconds, args):
+    """
+    Turns the runs of the sessions into the report of the run.
+
+    Returns:
+    dict: The settings of the run, the latency percentiles of the reruns overall and per kind of change, the
+          throughput, the errors, the most runs in flight at once and the cache hit rates and memory of the process.
+    """
+    runs = result['runs']
+    reruns = [entry['ms'] for entry in runs if entry['kind'] != 'first']
+    kinds = sorted({entry['kind'] for entry in runs})
+    return {
+        'started': args.started,
+        'settings': {'sessions': args.sessions, 'reruns': args.reruns, 'seed': args.seed},
+        'seconds': seconds,
+        'runs': len(runs),
+        'throughput': len(runs) / seconds,
+        'errors': len(result['errors']),
+        'error_messages': result['errors'][:10],
+        'most_in_flight': result['most_in_flight'],
+        'latency_ms': percentiles(reruns),
+        'first_run_ms': percentiles([entry['ms'] for entry in runs if entry['kind'] == 'first']),
+        'latency_per_kind_ms': {kind: percentiles([entry['ms'] for entry in runs if entry['kind'] == kind]) for kind in kinds},
+        'hit_rates': hit_rates(result['cache']),
+        'cache': result['cache'],
+        'rss_mb': result['rss_mb'],
+        'peak_rss_mb': result['peak_rss_mb'],
+    }
+
+
+def print_report(report, baseline=None):
+    """
+    Prints the report of a run, with the change against the baseline when there is one.
+    """
+    def change(path, value, lower_is_better=True):
+        if baseline is None or value is None:
+            return ''
+        before = baseline
+        for name in path:
+            before = before.get(name) if isinstance(before, dict) else None
+        if not before:
+            return ''
+        delta = (value - before) / before * 100
+        better = (delta < 0) == lower_is_better
+        return f'  ({delta:+.1f}% vs baseline, {"better" if better else "worse"})'
+
+    settings = report['settings']
+    print(f'{settings["sessions"]} concurrent sessions x {settings["reruns"]} reruns: '
+          f'{report["runs"]} runs in {report["seconds"]:.1f} s, at most {report["most_in_flight"]} at once, {report["errors"]} errors')
+    print(f'Throughput: {report["throughput"]:.1f} runs/s{change(["throughput"], report["throughput"], lower_is_better=False)}')
+    for name in ['p50', 'p95', 'p99']:
+        value = report['latency_ms'][name]
+        if value is not None:
+            print(f'Rerun {name}: {value:8.1f} ms{change(["latency_ms", name], value)}')
+    print(f'First run p50: {report["first_run_ms"]["p50"]:8.1f} ms')
+    print('Rerun latency per change:')
+    for kind, latency in report['latency_per_kind_ms'].items():
+        if kind != 'first':
+            print(f'  {kind:<12} p50 {latency["p50"]:8.1f} ms  p95 {latency["p95"]:8.1f} ms')
+    rates = ', '.join(f'{name} {rate:.0%}' for name, rate in report['hit_rates'].items() if rate is not None)
+    print(f'Shared cache hit rate: {rates or "-"}')
+    if report['rss_mb'] is not None:
+        print(f'RSS of the process: {report["rss_mb"]:.0f} MB (peak {report["peak_rss_mb"]:.0f} MB)')
+    for error in report['error_messages']:
+        print(f'  ERROR {error}')
+
+
+def latest_run(directory=RESULTS_DIR):
+    """
+    Returns the path of the most recent saved run, or None when there is none.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, 'run-*.json')))
+    return paths[-1] if paths else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the dashboard with concurrent sessions.')
+    parser.add_argument('--sessions', type=int, default=8, help='the number of sessions, they all run at the same time in one process')
+    parser.add_argument('--reruns', type=int, default=10, help='the number of reruns per session after its first run')
+    parser.add_argument('--seed', type=int, default=0, help='the seed of the random changes, the same seed repeats the same clicks')
+    parser.add_argument('--timeout', type=float, default=120, help='the maximum time of one run in seconds')
+    parser.add_argument('--baseline', help='the saved run to compare with, the previous run by default')
+    args = parser.parse_args()
+    args.started = datetime.now().isoformat(timespec='seconds')
+
+    baseline_path = args.baseline or latest_run()
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+
+    start = time.perf_counter()
+    result = run_sessions(args.sessions, args.reruns, args.seed, args.timeout)
+    report = summarize(result, time.perf_counter() - start, args)
+
+    if baseline is not None:
+        print(f'Baseline: {baseline_path} ({baseline["started"]})')
+        if baseline['settings'] != report['settings']:
+            print(f'The baseline ran with other settings ({baseline["settings"]}), the changes are not comparable')
+    print_report(report, baseline)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'run-{datetime.now():%Y%m%d-%H%M%S}.json')
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'Saved the run to {path}, the next run is compared with it')
+    sys.exit(1 if report['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
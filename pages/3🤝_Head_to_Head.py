@@ -0,0 +1,99 @@
+# Importing the required packages
+# ------------------------------
+import streamlit as st
+
+from funcs import load_manifest, load_engine
+
+st.set_page_config(
+    page_title='Head to Head',
+    page_icon="./assets/icons8-football-ball-pastel-96.png"
+)
+
+# Loading the data
+# ------------------------------
+engine = load_engine(load_manifest()['version'])
+metadata = engine.metadata
+
+# Sidebar area
+# ------------------------------
+
+teams = engine.teams()
+team = st.sidebar.selectbox(
+    'Which team?',
+    teams,
+    index=teams.index('Netherlands') if 'Netherlands' in teams else 0,
+)
+# The most played opponent first
+opponents = engine.opponent_records(team)['opponent'].tolist() or teams
+opponent = st.sidebar.selectbox(
+    'Against which team?',
+    opponents,
+)
+
+tournaments = st.sidebar.multiselect(
+    "Filter tournament?",
+    metadata['tournaments']
+)
+
+years = st.sidebar.slider(
+    "During which years?",
+    min_value=metadata['min_year'],
+    max_value=metadata['max_year'],
+    value=(metadata['min_year'], metadata['max_year'])
+)
+
+# Record of the team against the opponent
+# ------------------------------
+
+st.title(f'{team} vs {opponent} :handshake:')
+
+record = engine.head_to_head(team, opponent, tournaments=tournaments, years=years)
+if record['total_games']:
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric('Wins', record['wins'])
+    col2.metric('Draws', record['draws'])
+    col3.metric('Losses', record['losses'])
+    col4.metric('Goal Difference', f"{record['goal_difference']:+d}")
+else:
+    st.info(f'{team} did not play {opponent} within the selected filters.')
+
+# Record against all opponents, the table can be sorted by clicking a column
+# ------------------------------
+
+st.subheader(f'{team} against all opponents')
+records = engine.opponent_records(team, tournaments=tournaments, years=years)
+st.dataframe(
+    records,
+    hide_index=True,
+    width='stretch',
+    column_config={
+        'opponent': 'Opponent',
+        'games': 'Games',
+        'wins': 'Wins',
+        'draws': 'Draws',
+        'losses': 'Losses',
+        'goals_for': 'Goals For',
+        'goals_against': 'Goals Against',
+        'goal_difference': 'Goal Difference',
+        'win_percentage': st.column_config.NumberColumn('Win Percentage', format='%.1f%%'),
+    },
+)
+
+# Matrix of the wins between a group of teams
+# ------------------------------
+
+st.subheader('Head-to-head matrix')
+group = st.multiselect(
+    'Which teams?',
+    teams,
+    default=[team] + [name for name in records['opponent'].head(5) if name != team],
+)
+value = st.radio(
+    'Show',
+    ['wins', 'draws', 'losses', 'goal_difference', 'games'],
+    format_func=lambda value: value.replace('_', ' ').capitalize(),
+    horizontal=True,
+)
+if group:
+    st.caption(f'The {value.replace("_", " ")} of the team in the row against the team in the column.')
+    st.dataframe(engine.head_to_head_matrix(group, value=value, tournaments=tournaments, years=years), width='stretch')
@@ -0,0 +1,126 @@
+# Importing the required packages
+# ------------------------------
+import streamlit as st
+
+from funcs import load_manifest, load_engine
+
+st.set_page_config(
+    page_title='Compare Teams',
+    page_icon="./assets/icons8-football-ball-pastel-96.png"
+)
+
+# The charts get one color per team, more teams than this are hard to tell apart
+MAX_TEAMS = 8
+
+# Charts
+# ------------------------------
+# Altair is only imported once a chart is drawn, so a session without a selection never loads it, see importtime.py
+
+def win_percentage_chart(per_year, selected):
+    import altair as alt
+
+    return alt.Chart(per_year).mark_line(point=True).encode(
+        x=alt.X('Year:O', title='Year'),
+        y=alt.Y('Win Percentage:Q', title='Win Percentage', scale=alt.Scale(domain=[0, 100])),
+        color=alt.Color('Team:N', title='Team', sort=selected),
+        tooltip=['Team', 'Year', 'Win Percentage'],
+    ).properties(
+        width=800,
+        height=400
+    )
+
+
+def top_scorers_chart(top_scorers, selected):
+    import altair as alt
+
+    return alt.Chart(top_scorers).mark_bar().encode(
+        x=alt.X('counts:Q', title='Count of Goals'),
+        y=alt.Y('scorer:N', sort='-x', title='Name of the Player'),
+        color=alt.Color('team:N', title='Team', sort=selected),
+        tooltip=['team', 'scorer', 'counts'],
+    ).properties(
+        height=alt.Step(18)
+    )
+
+
+# Loading the data
+# ------------------------------
+engine = load_engine(load_manifest()['version'])
+metadata = engine.metadata
+
+# Sidebar area
+# ------------------------------
+
+teams = engine.teams()
+selected = st.sidebar.multiselect(
+    'Which teams?',
+    teams,
+    default=[team for team in ['Netherlands', 'Germany', 'Spain'] if team in teams],
+    max_selections=MAX_TEAMS,
+)
+
+tournaments = st.sidebar.multiselect(
+    "Filter tournament?",
+    metadata['tournaments']
+)
+
+opponents = st.sidebar.multiselect(
+    "Filter opponent?",
+    teams
+)
+
+years = st.sidebar.slider(
+    "During which years?",
+    min_value=metadata['min_year'],
+    max_value=metadata['max_year'],
+    value=(metadata['min_year'], metadata['max_year'])
+)
+
+st.title('Compare teams :bar_chart:')
+
+if not selected:
+    st.info('Select one or more teams in the sidebar to compare them.')
+    st.stop()
+
+# All teams are computed together in one batched pass, see compare_teams in engine/compare.py
+comparison = engine.compare(selected, tournaments=tournaments, opponents=opponents, years=years)
+
+# Statistics of every team
+# ------------------------------
+
+st.subheader('Game statistics')
+st.dataframe(
+    comparison['stats'],
+    hide_index=True,
+    width='stretch',
+    column_config={
+        'team': 'Team',
+        'total_games': 'Games',
+        'wins': 'Wins',
+        'draws': 'Draws',
+        'losses': 'Losses',
+        'goals_for': 'Goals For',
+        'goals_against': 'Goals Against',
+        'win_percentage': st.column_config.NumberColumn('Win Percentage', format='%.1f%%'),
+    },
+)
+
+# Win percentage per year, one line per team
+# ------------------------------
+
+st.subheader('Win percentage per year')
+per_year = comparison['win_percentage_per_year']
+if per_year.empty:
+    st.info('None of the selected teams played within the selected filters.')
+else:
+    st.altair_chart(win_percentage_chart(per_year, selected), width='stretch')
+
+# Top scorers of every team
+# ------------------------------
+
+st.subheader('Top scorers')
+top_scorers = comparison['top_scorers']
+if top_scorers.empty:
+    st.info('No goals with a known scorer within the selected filters.')
+else:
+    st.altair_chart(top_scorers_chart(top_scorers, selected), width='stretch')
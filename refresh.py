@@ -0,0 +1,240 @@
+"""
+Incremental refresh of the data store.
+
+The new csv files of a source are compared with the current store per match, keyed on (date, home_team, away_team).
+Only new or changed rows are merged into the store and only the tables that changed are written. The manifest records
+which teams and years changed: the engine keys its cached results on those versions (see Engine.team_version), so
+the cached results of all other teams stay valid.
+"""
+import os
+import shutil
+import time
+import zipfile
+
+import pandas as pd
+
+from engine import build_ratings, elo_matches
+from store import (DATA_DIR, STORE_DIR, apply_types, dataset_version, initial_manifest, load_tables,
+                   read_manifest, read_ratings, write_manifest, write_ratings, write_store)
+
+MATCH_KEY = ['date', 'home_team', 'away_team']
+KAGGLE_DATASET = 'martj42/international-football-results-from-1872-to-2017'
+# The tables published by the source, the country coordinates are maintained in this repository
+SOURCE_TABLES = ['results', 'goalscorers', 'shootouts']
+
+
+class DirectorySource:
+    """
+    A source that reads the csv files from a local directory, e.g. for tests or a manual download.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self):
+        """
+        Returns the directory containing the csv files of the source.
+        """
+        return self.path
+
+
+class KaggleSource:
+    """
+    A source that downloads the csv files from the Kaggle dataset, skipping files that did not change since the last download.
+    """
+
+    def __init__(self, path='./data_new', dataset=KAGGLE_DATASET):
+        self.path = path
+        self.dataset = dataset
+
+    def fetch(self):
+        """
+        Downloads the csv files of the dataset and returns the directory containing them.
+        """
+        # Imported here so the app itself never needs the Kaggle client or its credentials,
+        # it is only installed for the refresh (pip install -r requirements-refresh.txt)
+        import kaggle
+
+        for name in SOURCE_TABLES:
+            kaggle.api.dataset_download_file(self.dataset, f'{name}.csv', path=self.path, force=False)
+            archive = os.path.join(self.path, f'{name}.csv.zip')
+            if os.path.exists(archive):
+                with zipfile.ZipFile(archive) as zipped:
+                    zipped.extractall(self.path)
+                os.remove(archive)
+        return self.path
+
+
+def match_hashes(df: pd.DataFrame):
+    """
+    Calculates a hash per row keyed on the match and the occurrence of that match, so duplicated matches stay apart.
+
+    Parameters:
+    df (pd.DataFrame):  A table with the columns date, home_team and away_team.
+
+    Returns:
+    pd.Series: The hash of every row, indexed by (date, home_team, away_team, occurrence).
+    """
+    keys = untyped(df[MATCH_KEY])
+    keys['occurrence'] = keys.groupby(MATCH_KEY, dropna=False).cumcount()
+    # Categorical values hash the same as their plain values, so the categories of either table do not matter.
+    # The match_id is derived from the row position and is assigned again after the refresh.
+    hashes = pd.util.hash_pandas_object(df.drop(columns='match_id', errors='ignore'), index=False)
+    return pd.Series(hashes.to_numpy(), index=pd.MultiIndex.from_frame(keys))
+
+
+def diff_results(current: pd.DataFrame, new: pd.DataFrame):
+    """
+    Compares the results tables row by row.
+
+    Parameters:
+    current (pd.DataFrame): The results table in the store.
+    new (pd.DataFrame):     The results table of the source.
+
+    Returns:
+    tuple: The positions of the changed rows in current with the positions of their replacement in new, and the positions of the new rows in new.
+    """
+    current_hashes = match_hashes(current)
+    new_hashes = match_hashes(new)
+
+    position = current_hashes.index.get_indexer(new_hashes.index)
+    is_known = position >= 0
+    is_changed = is_known & (current_hashes.to_numpy()[position] != new_hashes.to_numpy())
+
+    changed = (position[is_changed], is_changed.nonzero()[0])
+    added = (~is_known).nonzero()[0]
+    return changed, added
+
+
+def diff_matches(current: pd.DataFrame, new: pd.DataFrame):
+    """
+    Compares tables with several rows per match (goals, shootouts) match by match.
+
+    Parameters:
+    current (pd.DataFrame): The table in the store.
+    new (pd.DataFrame):     The table of the source.
+
+    Returns:
+    pd.Index: The keys (date, home_team, away_team) of the matches that are new or have different rows.
+    """
+    def per_match(df):
+        hashes = match_hashes(df)
+        # Combine the row hashes with their occurrence, so both the rows and their order count
+        occurrence = hashes.index.get_level_values('occurrence').to_numpy().astype('uint64')
+        mixed = (hashes.to_numpy() * (occurrence * 2 + 1)).view('int64')
+        return pd.Series(mixed, index=hashes.index.droplevel('occurrence')).groupby(level=MATCH_KEY, dropna=False).sum()
+
+    current_matches = per_match(current)
+    new_matches = per_match(new)
+    position = current_matches.index.get_indexer(new_matches.index)
+    is_changed = (position < 0) | (current_matches.to_numpy()[position] != new_matches.to_numpy())
+    return new_matches.index[is_changed]
+
+
+def untyped(df: pd.DataFrame):
+    """
+    Converts the categorical columns back to plain values, so tables with different categories can be combined.
+    """
+    return df.astype({column: object for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)})
+
+
+def replace_matches(current: pd.DataFrame, new: pd.DataFrame, keys: pd.Index):
+    """
+    Replaces the rows of the given matches in current by their rows in new, the replaced matches are appended at the end.
+    """
+    def is_selected(df):
+        return pd.MultiIndex.from_frame(untyped(df[MATCH_KEY])).isin(keys)
+
+    kept = untyped(current[~is_selected(current)])
+    added = untyped(new[is_selected(new)])
+    return pd.concat([kept, added], ignore_index=True), added
+
+
+def refresh(source, data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """
+    Refreshes the store with the new and changed rows of a source.
+
+    Parameters:
+    source (DirectorySource or KaggleSource):   The source of the new csv files.
+    data_dir (str):                             The directory with the csv files, these are replaced by the files of the source.
+    store_dir (str):                            The directory containing the Feather files.
+
+    Returns:
+    dict: The number of changed and added rows per table, the tables that were written, the affected teams and years,
+          the first year of which the ratings were replayed (None when all years were) and the new dataset version.
+    """
+    source_dir = source.fetch()
+    tables = load_tables(data_dir, store_dir)
+    stored = dict(tables)
+    new_tables = apply_types({name: pd.read_csv(os.path.join(source_dir, f'{name}.csv')) for name in SOURCE_TABLES})
+
+    summary = {}
+    touched = []
+
+    # Results: changed rows are updated in place so row positions stay stable, new rows are appended
+    current, new = tables['results'], new_tables['results']
+    (changed_at, changed_from), added = diff_results(current, new)
+    results = untyped(current)
+    replacement = untyped(new.iloc[changed_from])
+    for column_position, column in enumerate(results.columns):
+        results.iloc[changed_at, column_position] = replacement[column].to_numpy()
+    results = pd.concat([results, untyped(new.iloc[added])], ignore_index=True)
+    tables['results'] = results
+    touched += [results.iloc[changed_at], untyped(new.iloc[added])]
+    summary['results'] = {'changed': len(changed_at), 'added': len(added)}
+
+    # Goals and shootouts: all rows of a changed match are replaced
+    for name in ['goalscorers', 'shootouts']:
+        keys = diff_matches(tables[name], new_tables[name])
+        tables[name], added_rows = replace_matches(tables[name], new_tables[name], keys)
+        touched.append(added_rows)
+        summary[name] = {'changed': len(keys)}
+
+    if not any(len(rows) for rows in touched):
+        return {'tables': summary, 'written': [], 'teams': [], 'years': [], 'ratings_from': None, 'version': read_manifest(store_dir)['version']}
+
+    tables = apply_types({name: untyped(df) for name, df in tables.items()})
+    touched = pd.concat([rows[MATCH_KEY] for rows in touched], ignore_index=True)
+    teams = sorted(set(pd.concat([touched['home_team'], touched['away_team']]).dropna().astype(str)))
+    years = sorted(set(pd.to_datetime(touched['date']).dt.year.astype(str)))
+
+    manifest = read_manifest(store_dir)
+    # Without a store every table is written, otherwise only those whose rows or types changed. A new team changes
+    # the categories of the team columns, so then all tables with a team column are written.
+    written = [name for name, df in tables.items() if manifest['version'] is None or not df.equals(stored[name])]
+    # Only the rating checkpoints from the first affected year on are replayed
+    previous_ratings = read_ratings(manifest['version'], store_dir)
+    ratings_from = int(years[0])
+    if manifest['version'] is None:
+        manifest = initial_manifest(tables)
+    version = dataset_version(tables)
+    manifest['version'] = version
+    manifest['teams'].update({team: version for team in teams})
+    manifest['years'].update({year: version for year in years})
+
+    write_store({name: tables[name] for name in written}, store_dir)
+    write_ratings(build_ratings(elo_matches(tables['results']), previous_ratings, ratings_from), version, store_dir)
+    write_manifest(manifest, store_dir)
+    if os.path.abspath(source_dir) != os.path.abspath(data_dir):
+        for name in SOURCE_TABLES:
+            shutil.copyfile(os.path.join(source_dir, f'{name}.csv'), os.path.join(data_dir, f'{name}.csv'))
+
+    return {
+        'tables': summary, 'written': written, 'teams': teams, 'years': years,
+        'ratings_from': ratings_from if previous_ratings is not None else None, 'version': version,
+    }
+
+
+def main(source=None):
+    start = time.perf_counter()
+    summary = refresh(source or KaggleSource())
+    print(f'Refreshed the store to version {summary["version"]} in {time.perf_counter() - start:.2f}s')
+    for name, counts in summary['tables'].items():
+        print(f'  {name}: ' + ', '.join(f'{count} {kind}' for kind, count in counts.items()))
+    print(f'  {len(summary["teams"])} teams and {len(summary["years"])} years affected, wrote {", ".join(summary["written"]) or "no tables"}')
+    if summary['ratings_from'] is not None:
+        print(f'  ratings replayed from {summary["ratings_from"]}')
+
+
+if __name__ == '__main__':
+    main()
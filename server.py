@@ -0,0 +1,226 @@
+"""
+Local JSON API on top of the data engine, for scripts and notebooks that want the numbers of the dashboard without Streamlit.
+
+Run `python server.py [--port 8502]`, all requests share one warm engine and its cache:
+
+    GET /teams
+    GET /options?team=Netherlands
+    GET /team_summary?team=Netherlands&tournaments=FIFA World Cup,UEFA Euro&opponents=Germany&years=1980,2024
+    GET /games_per_tournament?team=Netherlands&years=1980,2024  (same filters as /team_summary)
+    GET /win_ratio_map?team=Netherlands&years=1980,2024         (a GeoJSON FeatureCollection)
+    GET /venues?team=Netherlands&years=1980,2024                (same filters as /team_summary)
+    GET /map?team=Netherlands&layer=venues&years=1980,2024      (the world map as HTML, layer opponents or venues)
+    GET /head_to_head?team=Netherlands&opponent=Germany&tournaments=FIFA World Cup&years=1980,2024
+    GET /opponent_records?team=Netherlands&years=1980,2024
+    GET /compare?teams=Netherlands,Germany,Spain&tournaments=UEFA Euro&opponents=Italy&years=1980,2024
+    GET /rating_per_year?team=Netherlands&years=1980,2024
+    GET /team_form?team=Netherlands&years=1980,2024
+    GET /rolling_win_rate?team=Netherlands&window=10&years=1980,2024
+    GET /match_history?team=Netherlands&sort_by=date&ascending=false&page=1&page_size=25  (same filters as /team_summary)
+    GET /goal_timing?team=Netherlands&years=1980,2024           (same filters as /team_summary)
+    GET /shootout_record?team=Netherlands&years=1980,2024       (same filters as /team_summary)
+    GET /cache
+
+Every endpoint answers a team that is not in /teams with the same 404, and a missing or malformed parameter with 400.
+"""
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from engine import Engine, frame_records
+
+
+def list_parameter(query, name):
+    """
+    Returns a comma separated query parameter as a list, or None when it is not given.
+    """
+    if name not in query:
+        return None
+    return [value for value in query[name][0].split(',') if value]
+
+
+def years_parameter(query):
+    """
+    Returns the years query parameter ('start,end') as a tuple of ints, or None when it is not given.
+
+    Raises:
+    ValueError: If the parameter does not consist of two years.
+    """
+    years = list_parameter(query, 'years')
+    if years is None:
+        return None
+    if len(years) != 2:
+        raise ValueError('years should be given as start,end')
+    return int(years[0]), int(years[1])
+
+
+class UnknownTeams(LookupError):
+    """
+    Raised for teams that are not in Engine.teams, every endpoint answers it with the same 404.
+    """
+
+    def __init__(self, teams):
+        super().__init__(f'Unknown team {teams[0]}' if len(teams) == 1 else f'Unknown teams {", ".join(teams)}')
+
+
+class Handler(BaseHTTPRequestHandler):
+    engine = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        routes = {
+            '/teams': self.teams,
+            '/options': self.options,
+            '/team_summary': self.team_summary,
+            '/games_per_tournament': self.games_per_tournament,
+            '/win_ratio_map': self.win_ratio_map,
+            '/venues': self.venues,
+            '/map': self.map,
+            '/head_to_head': self.head_to_head,
+            '/opponent_records': self.opponent_records,
+            '/compare': self.compare,
+            '/rating_per_year': self.rating_per_year,
+            '/team_form': self.team_form,
+            '/rolling_win_rate': self.rolling_win_rate,
+            '/match_history': self.match_history,
+            '/goal_timing': self.goal_timing,
+            '/shootout_record': self.shootout_record,
+            '/cache': self.cache,
+        }
+        if url.path not in routes:
+            return self.respond(404, {'error': f'Unknown path {url.path}'})
+        try:
+            status, body = routes[url.path](query)
+        except UnknownTeams as error:
+            status, body = 404, {'error': str(error)}
+        except ValueError as error:
+            status, body = 400, {'error': str(error)}
+        self.respond(status, body)
+
+    def known(self, teams):
+        """
+        Returns the teams when they are all known.
+
+        Raises:
+        UnknownTeams: If one of the teams is not in Engine.teams.
+        """
+        unknown = [team for team in teams if team not in self.engine.teams()]
+        if unknown:
+            raise UnknownTeams(unknown)
+        return teams
+
+    def team(self, query, name='team'):
+        """
+        Returns a required team parameter.
+
+        Raises:
+        ValueError:     If the parameter is not given.
+        UnknownTeams:   If the team is not known.
+        """
+        team = query.get(name, [None])[0]
+        if team is None:
+            raise ValueError(f'The {name} parameter is required')
+        return self.known([team])[0]
+
+    def teams(self, query):
+        return 200, self.engine.teams()
+
+    def options(self, query):
+        return 200, self.engine.options(self.team(query))
+
+    def filtered(self, query, answer):
+        return answer(
+            self.team(query), tournaments=list_parameter(query, 'tournaments'), opponents=list_parameter(query, 'opponents'), years=years_parameter(query),
+        )
+
+    def team_summary(self, query):
+        return 200, self.filtered(query, self.engine.team_summary).to_dict()
+
+    def games_per_tournament(self, query):
+        return 200, frame_records(self.filtered(query, self.engine.games_per_tournament))
+
+    def win_ratio_map(self, query):
+        return 200, self.filtered(query, self.engine.win_ratio_map)
+
+    def venues(self, query):
+        return 200, {name: frame_records(records) for name, records in self.filtered(query, self.engine.venues).items()}
+
+    def map(self, query):
+        layer = query.get('layer', ['opponents'])[0]
+        return 200, self.filtered(query, lambda team, **filters: self.engine.map_html(team, layer, **filters))
+
+    def head_to_head(self, query):
+        team, opponent = self.team(query), self.team(query, 'opponent')
+        return 200, self.engine.head_to_head(team, opponent, tournaments=list_parameter(query, 'tournaments'), years=years_parameter(query))
+
+    def opponent_records(self, query):
+        team = self.team(query)
+        records = self.engine.opponent_records(team, tournaments=list_parameter(query, 'tournaments'), years=years_parameter(query))
+        return 200, frame_records(records)
+
+    def compare(self, query):
+        teams = list_parameter(query, 'teams')
+        if not teams:
+            raise ValueError('The teams parameter is required')
+        body = self.engine.compare(
+            self.known(teams), tournaments=list_parameter(query, 'tournaments'), opponents=list_parameter(query, 'opponents'), years=years_parameter(query),
+        )
+        return 200, {name: frame_records(records) for name, records in body.items()}
+
+    def match_history(self, query):
+        page = {
+            'sort_by': query.get('sort_by', ['date'])[0],
+            'ascending': query.get('ascending', ['false'])[0].lower() == 'true',
+            'page': int(query.get('page', [1])[0]),
+            'page_size': int(query.get('page_size', [25])[0]),
+        }
+        body = self.filtered(query, lambda team, **filters: self.engine.match_history(team, **filters, **page))
+        return 200, {**body, 'matches': frame_records(body['matches'])}
+
+    def goal_timing(self, query):
+        body = self.filtered(query, self.engine.goal_timing)
+        return 200, {'minutes': frame_records(body['minutes']), 'shares': body['shares']}
+
+    def shootout_record(self, query):
+        return 200, self.filtered(query, self.engine.shootout_record)
+
+    def rating_per_year(self, query):
+        return 200, frame_records(self.engine.rating_per_year(self.team(query), years=years_parameter(query)))
+
+    def team_form(self, query):
+        return 200, self.engine.team_form(self.team(query), years=years_parameter(query))
+
+    def rolling_win_rate(self, query):
+        window = int(query.get('window', [10])[0])
+        return 200, frame_records(self.engine.rolling_win_rate(self.team(query), window=window, years=years_parameter(query)))
+
+    def cache(self, query):
+        return 200, self.engine.cache.stats()
+
+    def respond(self, status, body):
+        # The map is sent as HTML, all other answers as JSON
+        html = isinstance(body, str)
+        data = body.encode() if html else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8' if html else 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the football statistics as JSON.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+
+    Handler.engine = Engine.load()
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f'Serving {len(Handler.engine.teams())} teams on http://{args.host}:{args.port}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
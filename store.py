@@ -0,0 +1,308 @@
+"""
+Columnar data store for the football data.
+
+Run `python store.py` once to convert the csv files in ./data into typed, uncompressed Feather files
+in ./data/store. The app reads those files when they exist and falls back to the csv files otherwise.
+Reading them is fast since nothing has to be parsed, but the tables are still converted into pandas memory
+per process, see read_store.
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+DATA_DIR = './data'
+STORE_DIR = './data/store'
+TABLES = ['goalscorers', 'results', 'shootouts', 'country_coords']
+
+# Columns holding a team name, these share one categorical dtype so they can be compared and merged directly
+TEAM_COLUMNS = {
+    'goalscorers': ['home_team', 'away_team', 'team'],
+    'results': ['home_team', 'away_team'],
+    'shootouts': ['home_team', 'away_team', 'winner', 'first_shooter'],
+}
+CATEGORY_COLUMNS = {
+    'goalscorers': ['scorer'],
+    'results': ['tournament'],
+}
+DATE_TABLES = ['goalscorers', 'results', 'shootouts']
+# Scores and minutes can be missing, so they are always stored as floats (also when a file has no missing values)
+FLOAT_COLUMNS = {
+    'goalscorers': ['minute'],
+    'results': ['home_score', 'away_score'],
+}
+MANIFEST = 'manifest.json'
+# The Elo rating checkpoints per year, see build_ratings in engine/ratings.py
+RATINGS = 'ratings.feather'
+# The on-disk cache of query results, filled by warmup.py and read by the app
+CACHE_PATH = os.path.join(STORE_DIR, 'cache.sqlite')
+
+
+def apply_types(tables):
+    """
+    Converts the raw csv tables to their typed form: parsed dates, float scores and categorical team, tournament and scorer columns.
+
+    Parameters:
+    tables (dict):  A dictionary with the table name as key and the raw DataFrame as value.
+
+    Returns:
+    dict: The same dictionary with typed DataFrames.
+    """
+    team_names = pd.concat([
+        tables[name][column] for name, columns in TEAM_COLUMNS.items() for column in columns
+    ]).dropna().unique()
+    team_dtype = pd.CategoricalDtype(sorted(team_names))
+
+    for name in DATE_TABLES:
+        tables[name]['date'] = pd.to_datetime(tables[name]['date'], format='%Y-%m-%d')
+    for name, columns in TEAM_COLUMNS.items():
+        for column in columns:
+            tables[name][column] = tables[name][column].astype(team_dtype)
+    for name, columns in CATEGORY_COLUMNS.items():
+        for column in columns:
+            tables[name][column] = tables[name][column].astype('category')
+    for name, columns in FLOAT_COLUMNS.items():
+        for column in columns:
+            tables[name][column] = tables[name][column].astype('float64')
+    return assign_match_ids(tables)
+
+
+def match_keys(df, n_teams):
+    """
+    Combines the date and the team codes of every match into one integer key.
+
+    Parameters:
+    df (pd.DataFrame):  A typed table with the columns date, home_team and away_team.
+    n_teams (int):      The number of team categories.
+
+    Returns:
+    np.ndarray: The key of every row.
+    """
+    days = df['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    # Shift the codes by one so missing teams (-1) get a key of their own
+    home_codes = df['home_team'].cat.codes.to_numpy().astype(np.int64) + 1
+    away_codes = df['away_team'].cat.codes.to_numpy().astype(np.int64) + 1
+    return (days * (n_teams + 1) + home_codes) * (n_teams + 1) + away_codes
+
+
+def assign_match_ids(tables):
+    """
+    Gives every match a match_id, its position in the results table, and stores it on the goals and shootouts of that match.
+    Changed results are updated in place by a refresh, so the match_id of a match stays the same.
+
+    Parameters:
+    tables (dict):  A dictionary with the table name as key and the typed DataFrame as value.
+
+    Returns:
+    dict: The same dictionary, with a match_id column on the results, goalscorers and shootouts tables.
+    """
+    df_results = tables['results']
+    n_teams = len(df_results['home_team'].cat.categories)
+    df_results['match_id'] = np.arange(len(df_results), dtype=np.int32)
+
+    # A few matches are listed twice, their goals belong to the first listing
+    keys = pd.Index(match_keys(df_results, n_teams))
+    first = ~keys.duplicated()
+    lookup = pd.Index(keys[first])
+    match_ids = df_results['match_id'].to_numpy()[first]
+    for name in ['goalscorers', 'shootouts']:
+        position = lookup.get_indexer(match_keys(tables[name], n_teams))
+        tables[name]['match_id'] = np.where(position >= 0, match_ids[position], -1).astype(np.int32)
+    return tables
+
+
+def read_csv_tables(data_dir=DATA_DIR):
+    """
+    Reads and types the csv files.
+
+    Parameters:
+    data_dir (str): The directory containing the csv files.
+
+    Returns:
+    dict: A dictionary with the table name as key and the typed DataFrame as value.
+    """
+    tables = {name: pd.read_csv(os.path.join(data_dir, f'{name}.csv')) for name in TABLES}
+    return apply_types(tables)
+
+
+def write_store(tables, store_dir=STORE_DIR):
+    """
+    Writes the typed tables as uncompressed Feather files, so they can be read without parsing or decompressing.
+
+    Parameters:
+    tables (dict):      A dictionary with the table name as key and the typed DataFrame as value.
+    store_dir (str):    The directory to write the Feather files to.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    for name, df in tables.items():
+        # Write to a temporary file first so readers never see a half written table
+        path = os.path.join(store_dir, f'{name}.feather')
+        feather.write_feather(df.reset_index(drop=True), f'{path}.tmp', compression='uncompressed')
+        os.replace(f'{path}.tmp', path)
+
+
+def read_store(store_dir=STORE_DIR):
+    """
+    Reads the Feather files of the store into DataFrames.
+
+    The files are memory-mapped, but most columns are still copied into pandas memory: the categorical codes,
+    the floats with missing values and the booleans have another layout in Arrow. Only the columns without
+    missing values that pandas can use as they are (the dates and the match ids) stay views on the mapped file,
+    so every process that reads the store holds its own copy of the rest.
+
+    Parameters:
+    store_dir (str):    The directory containing the Feather files.
+
+    Returns:
+    dict: A dictionary with the table name as key and the DataFrame as value, or None if the store is incomplete.
+    """
+    paths = {name: os.path.join(store_dir, f'{name}.feather') for name in TABLES}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    # split_blocks keeps every column in its own block, so the columns that can be views are not consolidated into a copy
+    return {name: feather.read_table(path, memory_map=True).to_pandas(split_blocks=True) for name, path in paths.items()}
+
+
+def dataset_version(tables):
+    """
+    Calculates a content hash of the tables, used as the version of the dataset.
+
+    Parameters:
+    tables (dict):  A dictionary with the table name as key and the DataFrame as value.
+
+    Returns:
+    str: A short hexadecimal hash that changes whenever a value in one of the tables changes.
+    """
+    digest = hashlib.sha1()
+    for name in sorted(tables):
+        hashes = pd.util.hash_pandas_object(tables[name].reset_index(drop=True), index=True)
+        digest.update(name.encode())
+        digest.update(hashes.to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def read_manifest(store_dir=STORE_DIR):
+    """
+    Reads the manifest of the store with the dataset version and the version per team and year.
+
+    Parameters:
+    store_dir (str):    The directory containing the Feather files.
+
+    Returns:
+    dict: The manifest, with version None and empty teams and years when the store is not built.
+    """
+    path = os.path.join(store_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'version': None, 'teams': {}, 'years': {}}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def write_manifest(manifest, store_dir=STORE_DIR):
+    """
+    Writes the manifest of the store.
+
+    Parameters:
+    manifest (dict):    The manifest with the keys version, teams and years.
+    store_dir (str):    The directory containing the Feather files.
+    """
+    path = os.path.join(store_dir, MANIFEST)
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(f'{path}.tmp', path)
+
+
+def initial_manifest(tables):
+    """
+    Creates the manifest for a freshly imported store, where every team and year has the dataset version.
+
+    Parameters:
+    tables (dict):  A dictionary with the table name as key and the typed DataFrame as value.
+
+    Returns:
+    dict: The manifest.
+    """
+    version = dataset_version(tables)
+    df_results = tables['results']
+    teams = pd.concat([df_results['home_team'], df_results['away_team']]).dropna().unique()
+    years = df_results['date'].dt.year.unique()
+    return {
+        'version': version,
+        'teams': {str(team): version for team in teams},
+        'years': {str(year): version for year in years},
+    }
+
+
+def write_ratings(checkpoints, version, store_dir=STORE_DIR):
+    """
+    Writes the rating checkpoints together with the dataset version they were computed for.
+
+    Parameters:
+    checkpoints (pd.DataFrame): The ratings at the end of every year, indexed by year with a column per team.
+    version (str):              The dataset version.
+    store_dir (str):            The directory containing the Feather files.
+    """
+    table = pa.Table.from_pandas(checkpoints)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'version': str(version).encode()})
+    path = os.path.join(store_dir, RATINGS)
+    feather.write_feather(table, f'{path}.tmp', compression='uncompressed')
+    os.replace(f'{path}.tmp', path)
+
+
+def read_ratings(version, store_dir=STORE_DIR):
+    """
+    Reads the rating checkpoints of the store.
+
+    Parameters:
+    version (str):      The expected dataset version, checkpoints of another version are not returned.
+    store_dir (str):    The directory containing the Feather files.
+
+    Returns:
+    pd.DataFrame: The checkpoints, or None when they are missing, the version is None or they were computed for another version.
+    """
+    path = os.path.join(store_dir, RATINGS)
+    if version is None or not os.path.exists(path):
+        return None
+    table = feather.read_table(path)
+    if table.schema.metadata.get(b'version') != str(version).encode():
+        return None
+    return table.to_pandas()
+
+
+def load_tables(data_dir=DATA_DIR, store_dir=STORE_DIR):
+    """
+    Loads the tables from the columnar store when it exists and from the csv files otherwise.
+
+    Parameters:
+    data_dir (str):     The directory containing the csv files.
+    store_dir (str):    The directory containing the Feather files.
+
+    Returns:
+    dict: A dictionary with the table name as key and the typed DataFrame as value.
+    """
+    tables = read_store(store_dir)
+    if tables is None:
+        tables = read_csv_tables(data_dir)
+    return tables
+
+
+def main():
+    start = time.perf_counter()
+    tables = read_csv_tables()
+    write_store(tables)
+    manifest = initial_manifest(tables)
+    write_manifest(manifest)
+    # Imported here, the engine itself reads the store
+    from engine import build_ratings, elo_matches
+    write_ratings(build_ratings(elo_matches(tables['results'])), manifest['version'])
+    rows = sum(len(df) for df in tables.values())
+    print(f'Imported {rows} rows from {DATA_DIR} into {STORE_DIR} in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
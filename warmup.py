@@ -0,0 +1,122 @@
+"""
+Warm-up of the on-disk cache, so the first visit to every team is fast after a deploy or a refresh of the store.
+
+Run `python warmup.py [--workers N]` after `python store.py` or `python load_data.py`. The teams are spread over
+a pool of processes that each compute the default dashboard of their teams: the statistics, win percentage per year,
+top scorers and last matches, the rating per year, the games per tournament and the world map, rendered to HTML. The results are
+written to the on-disk cache (./data/store/cache.sqlite), where the app finds them under the same keys.
+
+Results that are already in the on-disk cache are not computed again. Their keys contain the version of the teams and
+years they depend on, so after a refresh only the results of the teams and years it touched are computed.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import MISSING, DiskCache
+from engine import RESULTS_SCHEMA, Engine
+from store import CACHE_PATH, load_tables, read_manifest, read_ratings
+
+# The queries the page reads, intermediate results such as the filtered matches are not worth the disk space
+WARM_QUERIES = ['team_summary', 'rating_per_year', 'games_per_tournament', 'win_ratios', 'win_ratio_map', 'map_html']
+# The engine of a worker process, loaded once by init_worker
+worker_engine = None
+
+
+class CollectingCache:
+    """
+    A cache that keeps every value, so a worker can send the results it computed for a team back to the main process.
+    Values that are already stored in the on-disk cache are read from it instead of computed.
+    """
+
+    def __init__(self, stored=None):
+        self.entries = {}
+        self.computed = set()
+        self.stored = stored
+
+    def get_or_compute(self, key, compute):
+        if key not in self.entries:
+            value = self.stored.get(key) if self.stored is not None else MISSING
+            if value is MISSING:
+                value = compute()
+                self.computed.add(key)
+            self.entries[key] = value
+        return self.entries[key]
+
+
+def init_worker(manifest, path):
+    global worker_engine
+    # Every worker reads its own copy of the tables from the store, which is fast since nothing has to be parsed
+    version = manifest['version']
+    cache = CollectingCache(DiskCache(path, schema=RESULTS_SCHEMA))
+    worker_engine = Engine(load_tables(), version=version, cache=cache, ratings=read_ratings(version), manifest=manifest)
+
+
+def warm_team(team):
+    """
+    Computes the default dashboard of one team in a worker process.
+
+    Parameters:
+    team (str): The team to compute the dashboard for.
+
+    Returns:
+    list of tuple: The (key, value) pairs of the queries of the dashboard that were not stored yet.
+    """
+    engine = worker_engine
+    engine.cache.entries = {}
+    engine.cache.computed = set()
+    years = engine.default_years(team)
+    engine.team_summary(team, years=years)
+    engine.rating_per_year(team, years=years)
+    engine.games_per_tournament(team, years=years)
+    engine.map_html(team, years=years)
+    return [(key, value) for key, value in engine.cache.entries.items() if key in engine.cache.computed and key[0] in WARM_QUERIES]
+
+
+def warm_up(workers=None, path=CACHE_PATH):
+    """
+    Computes the default dashboard of every team in a pool of processes and stores the results in the on-disk cache.
+
+    Parameters:
+    workers (int, optional):    The number of processes, the number of cores when not given.
+    path (str):                 The path of the SQLite file of the on-disk cache.
+
+    Returns:
+    dict: The number of teams, the number of teams with new results and the number of new entries, the number of workers
+          and the time taken in seconds.
+    """
+    start = time.perf_counter()
+    manifest = read_manifest()
+    version = manifest['version']
+    if version is None:
+        raise ValueError('The store is not built, run `python store.py` first')
+
+    workers = workers or os.cpu_count()
+    teams = Engine(load_tables(), version=version, cache=CollectingCache(), ratings=read_ratings(version), manifest=manifest).teams()
+    cache = DiskCache(path, schema=RESULTS_SCHEMA)
+    entries = changed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(manifest, path)) as executor:
+        # Send the teams in a few batches per worker, so the overhead per task stays small but the work is balanced
+        for items in executor.map(warm_team, teams, chunksize=max(1, len(teams) // (workers * 4))):
+            if items:
+                cache.put_many(items)
+                entries += len(items)
+                changed += 1
+
+    return {'teams': len(teams), 'changed': changed, 'entries': entries, 'workers': workers, 'seconds': time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the default dashboard of every team into the on-disk cache.')
+    parser.add_argument('--workers', type=int, help='the number of processes, the number of cores by default')
+    parser.add_argument('--output', default=CACHE_PATH, help='the SQLite file of the on-disk cache')
+    args = parser.parse_args()
+
+    result = warm_up(args.workers, args.output)
+    print(f'Warmed up {result["teams"]} teams ({result["entries"]} new results for {result["changed"]} teams) in {result["seconds"]:.2f}s '
+          f'with {result["workers"]} workers, {result["teams"] / result["seconds"]:.1f} teams/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,10 @@
 # Importing the required packages
 # ------------------------------
-import streamlit as st
-import pandas as pd
 import altair as alt
-from datetime import datetime
-import folium
-from streamlit_folium import st_folium
-from country_coords import country_coords
+import streamlit as st
 
-from funcs import load_data, get_win_ratio, filter_dataframe, calculate_team_stats, team_won, highlight_wins
+from engine import HISTORY_COLUMNS, match_outcomes
+from funcs import load_manifest, load_engine, highlight_outcomes, start_recording, timed, debug_panel
 
 #Page configurations including favicon and title
 st.set_page_config(
@@ -16,210 +12,315 @@ st.set_page_config(
     page_icon="./assets/icons8-football-ball-pastel-96.png"
 )
 
+# Every section is timed when the page is opened with ?debug=1, see the debug panel at the bottom
+recorder = start_recording('Football Statistics')
+
 # Loading the data
 # ------------------------------
-df_goals, df_results, df_shootouts, df_locations = load_data()
-df_temp = pd.DataFrame(pd.concat([df_results['home_team'], df_results['away_team']]).unique())
-df_temp.to_csv('./temp.csv')
+# The team list, year bounds and filter options per team are precomputed once per dataset version
+with timed('load_engine'):
+    engine = load_engine(load_manifest()['version'])
 
 # Sidebar area
 # ------------------------------
 
-teams = df_results["home_team"].sort_values().unique().tolist()
-idx_nl = teams.index('Netherlands') if 'Netherlands' in teams else 0
-team = st.sidebar.selectbox(
-    'What team would you like to see the stats from?',
-    teams,
-    index=idx_nl,
-)
-
-tournaments = st.sidebar.multiselect(
-    "Filter tournament?", 
-    list(df_results[(df_results['home_team'] == team) | (df_results['away_team'] == team)].tournament.unique())
+with timed('sidebar'):
+    teams = engine.teams()
+    idx_nl = teams.index('Netherlands') if 'Netherlands' in teams else 0
+    team = st.sidebar.selectbox(
+        'What team would you like to see the stats from?',
+        teams,
+        index=idx_nl,
     )
+    options = engine.options(team)
 
-opponents = st.sidebar.multiselect(
-    'Against a specific team or teams?',
-    df_results[(df_results['home_team'] == team) | (df_results['away_team'] == team)]["home_team"].unique()
-)
+    tournaments = st.sidebar.multiselect(
+        "Filter tournament?",
+        options['tournaments']
+        )
 
-min_value = df_results[(df_results['home_team'] == team) | (df_results['away_team'] == team)]['date'].dt.year.min()
-max_value = df_results['date'].dt.year.max()
+    opponents = st.sidebar.multiselect(
+        'Against a specific team or teams?',
+        options['opponents']
+    )
 
-years = st.sidebar.slider(
-    "During which years?", 
-    min_value=min_value,
-    max_value=max_value,
-    value=(1980 if 1980 > min_value else min_value, max_value)
-)
+    min_value = options['min_year']
+    max_value = options['max_year']
+
+    years = st.sidebar.slider(
+        "During which years?",
+        min_value=min_value,
+        max_value=max_value,
+        value=engine.default_years(team)
+    )
 
 # Filter the results based on sidebar
 # ------------------------------
 
-df_res_filtered = filter_dataframe(df_results, home_team=team, tournaments=tournaments, opponents=opponents, year_range=years)
+with timed('team_summary_section'):
+    summary = engine.team_summary(team, tournaments=tournaments, opponents=opponents, years=years)
 
 # Graph showing the top 10 scorers for the country
 # ------------------------------
 
 st.title(f'Football stats of {team} :soccer:')
 
-st.subheader('Top 10 scorers!')
-top_scorers = df_goals[df_goals['team'] == team].merge(
-    df_res_filtered[['date', 'home_team', 'away_team']],
-    on=['date', 'home_team', 'away_team'],
-    how='inner'
-)
-top_scorers = top_scorers.groupby(by='scorer').size().reset_index(name='counts')
-top_scorers = top_scorers.sort_values('counts', ascending=False)[:10]
+with timed('top_scorers_section'):
+    st.subheader('Top 10 scorers!')
+    top_scorers = summary.top_scorers
 
-bar_chart = alt.Chart(top_scorers[:10]).mark_bar().encode(
-    x=alt.X('counts:Q', title='Count of Goals'),
-    y=alt.Y('scorer:N', sort='-x', title='Name of the Player'),
-    color=alt.Color('counts:Q', scale=alt.Scale(scheme='oranges'), legend=None)
-)
+    bar_chart = alt.Chart(top_scorers[:10]).mark_bar().encode(
+        x=alt.X('counts:Q', title='Count of Goals'),
+        y=alt.Y('scorer:N', sort='-x', title='Name of the Player'),
+        color=alt.Color('counts:Q', scale=alt.Scale(scheme='oranges'), legend=None)
+    )
 
-st.altair_chart(bar_chart, use_container_width=True)
+    st.altair_chart(bar_chart, width='stretch')
 
 # KPI from game statistics
 # ------------------------------
-st.subheader('Game Statistics')
-outcome = calculate_team_stats(df=df_res_filtered, team=team)
-if outcome:
-    col1, col2, col3 = st.columns(3)    
-    win_ratio = round(outcome['wins'] / outcome['total_games'] * 100, 1)
-    lose_ratio = round(outcome['losses'] / outcome['total_games'] * 100, 1)
-    draw_ratio = round(outcome['draws'] / outcome['total_games'] * 100, 1)
-    win_label = ':green-background[Win Percentage]' if win_ratio > 50 else ':red-background[Win Percentage]'
-    
-    col1.metric(win_label, f'{win_ratio}%')
-    col2.metric("Losing Percentage", f'{lose_ratio}%')
-    col3.metric("Draw Percentage", f'{draw_ratio}%')
+with timed('game_statistics_section'):
+    st.subheader('Game Statistics')
+    outcome = summary.stats
+    if outcome:
+        col1, col2, col3 = st.columns(3)
+        win_ratio = round(outcome['wins'] / outcome['total_games'] * 100, 1)
+        lose_ratio = round(outcome['losses'] / outcome['total_games'] * 100, 1)
+        draw_ratio = round(outcome['draws'] / outcome['total_games'] * 100, 1)
+        win_label = ':green-background[Win Percentage]' if win_ratio > 50 else ':red-background[Win Percentage]'
+
+        col1.metric(win_label, f'{win_ratio}%')
+        col2.metric("Losing Percentage", f'{lose_ratio}%')
+        col3.metric("Draw Percentage", f'{draw_ratio}%')
 
 # Total win percentage per year versus win percentage of filters
 # ------------------------------
-st.subheader('Win Percentage Per Year')
-df_results_year = df_res_filtered.groupby(df_res_filtered['date'].dt.year)
-df_results_total = filter_dataframe(df_results, home_team=team, year_range=years)
-df_results_total = df_results_total.groupby(df_results_total['date'].dt.year)
-years_filtered = []
-win_pct_filtered = []
-years_total = []
-win_pct_total = []
-
-for year, df in df_results_year:
-    won_indices = team_won(df, team=team)
-    total_games = df[~df['home_score'].isna()].shape[0]
-    if total_games:
-        win_pct = round(len(won_indices) / df[~df['home_score'].isna()].shape[0] * 100, 1)
-    else:
-        win_pct = 0.0
-    win_pct_filtered.append(win_pct)
-    years_filtered.append(year)
-
-for year, df in df_results_total:
-    won_indices = team_won(df, team=team)
-    total_games = df[~df['home_score'].isna()].shape[0]
-    if total_games:
-        win_pct = round(len(won_indices) / df[~df['home_score'].isna()].shape[0] * 100, 1)
-    else:
-        win_pct = 0.0
-    win_pct_total.append(win_pct)
-    years_total.append(year)
-
-
-# Create DataFrames for plotting
-df_plot_filter = pd.DataFrame({"Year": years_filtered, "Win Percentage": win_pct_filtered, "Type": "Filtered"})
-df_plot = pd.DataFrame({"Year": years_total, "Win Percentage": win_pct_total, "Type": "Total"})
-
-# Combine DataFrames
-df_combined = pd.concat([df_plot_filter, df_plot])
-
-# Create the Altair line chart with both lines and a legend
-line_chart = alt.Chart(df_combined).mark_line().encode(
-    x=alt.X('Year:O', title='Year'),
-    y=alt.Y('Win Percentage:Q', title='Win Percentage', scale=alt.Scale(domain=[0, 100])),
-    color=alt.Color('Type:N', title='Type', scale=alt.Scale(domain=['Filtered', 'Total'], range=['#FFA07A', '#FF4500'])),  # Lighter and darker shades of orange
-    tooltip=['Year', 'Win Percentage', 'Type']
-)
+with timed('win_percentage_section'):
+    st.subheader('Win Percentage Per Year')
+    df_combined = summary.win_percentage_per_year
+    df_plot_filter = df_combined[df_combined['Type'] == 'Filtered']
+
+    # Create the Altair line chart with both lines and a legend
+    line_chart = alt.Chart(df_combined).mark_line().encode(
+        x=alt.X('Year:O', title='Year'),
+        y=alt.Y('Win Percentage:Q', title='Win Percentage', scale=alt.Scale(domain=[0, 100])),
+        color=alt.Color('Type:N', title='Type', scale=alt.Scale(domain=['Filtered', 'Total'], range=['#FFA07A', '#FF4500'])),  # Lighter and darker shades of orange
+        tooltip=['Year', 'Win Percentage', 'Type']
+    )
 
-# Create points for filtered data with the same lighter orange color
-points_filtered = alt.Chart(df_plot_filter).mark_point(size=100, filled=True).encode(
-    x=alt.X('Year:O'),
-    y=alt.Y('Win Percentage:Q'),
-    color=alt.value('#FFA07A')  # Lighter orange color for the points
-)
+    # Create points for filtered data with the same lighter orange color
+    points_filtered = alt.Chart(df_plot_filter).mark_point(size=100, filled=True).encode(
+        x=alt.X('Year:O'),
+        y=alt.Y('Win Percentage:Q'),
+        color=alt.value('#FFA07A')  # Lighter orange color for the points
+    )
 
-# Combine the line chart with the points
-combined_chart = alt.layer(line_chart, points_filtered).configure_axis(
-    labelFontSize=12,
-    titleFontSize=14
-).configure_title(
-    fontSize=16
-).configure_legend(
-    titleFontSize=14,
-    labelFontSize=12
-)
+    # Combine the line chart with the points
+    combined_chart = alt.layer(line_chart, points_filtered).configure_axis(
+        labelFontSize=12,
+        titleFontSize=14
+    ).configure_title(
+        fontSize=16
+    ).configure_legend(
+        titleFontSize=14,
+        labelFontSize=12
+    )
+
+    st.altair_chart(combined_chart, width='stretch')
 
-st.altair_chart(combined_chart, use_container_width=True)
+# Elo rating at the end of every year, a strength rating that accounts for the opponents
+# ------------------------------
+with timed('elo_rating_section'):
+    st.subheader('Elo Rating Per Year')
+    df_rating = engine.rating_per_year(team, years=years)
+
+    rating_chart = alt.Chart(df_rating).mark_line(color='#FF4500').encode(
+        x=alt.X('Year:O', title='Year'),
+        y=alt.Y('Rating:Q', title='Elo Rating', scale=alt.Scale(zero=False)),
+        tooltip=['Year', 'Rating']
+    ).configure_axis(
+        labelFontSize=12,
+        titleFontSize=14
+    )
+
+    st.altair_chart(rating_chart, width='stretch')
+
+# Last ten matches displayed in a table
+# ------------------------------
+with timed('last_matches_section'):
+    st.subheader('Last Ten Matches')
+    df_10 = summary.last_matches.drop(['city', 'country', 'neutral', 'match_id'], axis=1)
+    outcomes = match_outcomes(df_10, team)
+    df_10['date'] = df_10['date'].dt.date
+    df_10[['home_score', 'away_score']] = df_10[['home_score', 'away_score']].astype(int)
+    df_10 = highlight_outcomes(df_10, outcomes)
+    st.dataframe(df_10, hide_index=True, width='stretch')
+
+# Form at the end of the selected years, from running sums over the matches of the team
+# ------------------------------
+
+@st.fragment
+def form_section(team, years):
+    with timed('form_section'), st.expander('Form', key='form_section', on_change='rerun') as section:
+        if not section.open:
+            return
+        form = engine.team_form(team, years=years)
+        if not form['games']:
+            st.info(f'{team} did not play within the selected years.')
+            return
+        st.caption(f'All matches of {team} up to {years[1]}, whatever the tournament or opponent.')
+
+        # The win percentage over the last matches and years, with the record as help text
+        kpis = [(f'Last {n} Matches', record) for n, record in form['last_matches'].items()]
+        kpis += [(f'Last {n} Years' if n > 1 else 'Last Year', record) for n, record in form['last_years'].items()]
+        for column, (label, record) in zip(st.columns(len(kpis)), kpis):
+            column.metric(label, f"{record['win_percentage'] or 0}%", help=f"{record['wins']} wins, {record['draws']} draws and {record['losses']} losses")
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric('Winning Streak', form['current_win_streak'])
+        col2.metric('Unbeaten Streak', form['current_unbeaten_streak'])
+        col3.metric('Longest Winning Streak', form['longest_win_streak'])
+        col4.metric('Longest Unbeaten Streak', form['longest_unbeaten_streak'])
+
+        window = st.select_slider('Rolling win percentage over the last', [5, 10, 20, 50], value=10, format_func=lambda n: f'{n} matches', key='form_window')
+        rolling_chart = alt.Chart(engine.rolling_win_rate(team, window=window, years=years)).mark_line(color='#FF4500').encode(
+            x=alt.X('Date:T', title='Date'),
+            y=alt.Y('Win Percentage:Q', title='Win Percentage', scale=alt.Scale(domain=[0, 100])),
+            tooltip=['Date', 'Win Percentage']
+        )
+        st.altair_chart(rolling_chart, width='stretch')
+
+form_section(team, years)
+
+# All matches within the filters, sorted and paged by the engine so only one page is styled and sent
+# ------------------------------
+
+@st.fragment
+def match_history_section(team, tournaments, opponents, years):
+    with timed('match_history_section'), st.expander('Match History', key='match_history_section', on_change='rerun') as section:
+        if not section.open:
+            return
+        col1, col2, col3, col4 = st.columns(4)
+        sort_by = col1.selectbox('Sort by', HISTORY_COLUMNS, format_func=lambda column: column.replace('_', ' ').capitalize(), key='history_sort_by')
+        ascending = col2.selectbox('Order', [False, True], format_func=lambda ascending: 'Ascending' if ascending else 'Descending', key='history_ascending')
+        page_size = col3.selectbox('Matches per page', [25, 50, 100], key='history_page_size')
+        # Pages past the end show the last page
+        page = col4.number_input('Page', min_value=1, step=1, key='history_page')
+
+        history = engine.match_history(
+            team, tournaments=tournaments, opponents=opponents, years=years, sort_by=sort_by, ascending=ascending, page=page, page_size=page_size
+        )
+        df_page = history['matches']
+        start = (history['page'] - 1) * page_size
+        st.caption(f"Matches {start + 1 if len(df_page) else 0} to {start + len(df_page)} of {history['total']}, page {history['page']} of {history['pages']}")
+
+        df_page = df_page.assign(date=df_page['date'].dt.date)
+        df_page[['home_score', 'away_score']] = df_page[['home_score', 'away_score']].astype('Int64')
+        st.dataframe(highlight_outcomes(df_page, df_page['outcome']), hide_index=True, width='stretch')
+
+match_history_section(team, tournaments, opponents, years)
 
 # Games played over the time range per tournament
 # ------------------------------
-st.subheader(f'Games per Tournament from {years[0]} to {years[1]}')
-games_tournament = df_res_filtered.groupby('tournament').size().reset_index(name='count').sort_values(by='count', ascending=False)
+# The sections below the fold only compute when their expander is open, and rerun on their own as a fragment
 
-bar_chart = alt.Chart(games_tournament).mark_bar().encode(
-    x=alt.X('count:Q', title='Count of Games'),
-    y=alt.Y('tournament:N', sort='-x', title='Tournament'),
-    color=alt.Color('count:Q', scale=alt.Scale(scheme='oranges'), legend=None)
-)
+@st.fragment
+def games_per_tournament_section(team, tournaments, opponents, years):
+    with timed('games_per_tournament_section'), st.expander(f'Games per Tournament from {years[0]} to {years[1]}', key='games_per_tournament_section', on_change='rerun') as section:
+        if not section.open:
+            return
+        games_tournament = engine.games_per_tournament(team, tournaments=tournaments, opponents=opponents, years=years)
 
-# Display the bar chart in Streamlit
-st.altair_chart(bar_chart, use_container_width=True)
+        bar_chart = alt.Chart(games_tournament).mark_bar().encode(
+            x=alt.X('count:Q', title='Count of Games'),
+            y=alt.Y('tournament:N', sort='-x', title='Tournament'),
+            color=alt.Color('count:Q', scale=alt.Scale(scheme='oranges'), legend=None)
+        )
 
-# Last ten matches displayed in a table
+        # Display the bar chart in Streamlit
+        st.altair_chart(bar_chart, width='stretch')
+
+games_per_tournament_section(team, tournaments, opponents, years)
+
+# Goals scored and conceded per 15 minutes, with the share of penalties and own goals
+# ------------------------------
+
+@st.fragment
+def goal_timing_section(team, tournaments, opponents, years):
+    with timed('goal_timing_section'), st.expander('Goals by Minute', key='goal_timing_section', on_change='rerun') as section:
+        if not section.open:
+            return
+        timing = engine.goal_timing(team, tournaments=tournaments, opponents=opponents, years=years)
+        shares = timing['shares']
+        if not shares['goals'] and not shares['conceded']:
+            st.info('No goals are known for the selected matches.')
+            return
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric('Penalties Scored', f"{shares['penalty_share'] or 0}%")
+        col2.metric('Own Goals in Favour', f"{shares['own_goal_share'] or 0}%")
+        col3.metric('Penalties Conceded', f"{shares['penalty_share_conceded'] or 0}%")
+        col4.metric('Own Goals Conceded', f"{shares['own_goal_share_conceded'] or 0}%")
+
+        df_minutes = timing['minutes'].melt(id_vars='Minutes', var_name='Type', value_name='Goals')
+        bar_chart = alt.Chart(df_minutes).mark_bar().encode(
+            x=alt.X('Minutes:N', title='Minutes', sort=None),
+            xOffset='Type:N',
+            y=alt.Y('Goals:Q', title='Count of Goals'),
+            color=alt.Color('Type:N', title='Type', scale=alt.Scale(domain=['Scored', 'Conceded'], range=['#FF4500', '#FFA07A'])),
+            tooltip=['Minutes', 'Type', 'Goals']
+        )
+        st.altair_chart(bar_chart, width='stretch')
+
+goal_timing_section(team, tournaments, opponents, years)
+
+# Penalty shootouts of the team and of all teams
 # ------------------------------
-st.subheader('Last Ten Matches')
-df_10 = df_res_filtered.drop(['city', 'country', 'neutral'], axis=1)
-df_10 = df_10.sort_values(by='date', ascending=False)
-df_10 = df_10[df_10['date'] <= datetime.now()].head(10)
-df_10['date'] = df_10['date'].dt.date
-df_10[['home_score', 'away_score']] = df_10[['home_score', 'away_score']].astype(int)
-df_10 = df_10.style.apply(highlight_wins, won_indices=team_won(df_10, team=team), axis=1)
-st.dataframe(df_10, hide_index=True, use_container_width=True)
+
+@st.fragment
+def shootout_section(team, tournaments, opponents, years):
+    with timed('shootout_section'), st.expander('Penalty Shootouts', key='shootout_section', on_change='rerun') as section:
+        if not section.open:
+            return
+        record = engine.shootout_record(team, tournaments=tournaments, opponents=opponents, years=years)
+        col1, col2, col3 = st.columns(3)
+        col1.metric('Shootouts', record['shootouts'])
+        col2.metric('Won', record['won'])
+        col3.metric('Won When Shooting First', f"{record['won_shot_first']} of {record['shot_first']}")
+
+        st.caption('All teams with at least 5 shootouts within the selected tournaments and years')
+        st.dataframe(engine.shootout_table(tournaments=tournaments, years=years, min_shootouts=5), hide_index=True, width='stretch')
+
+shootout_section(team, tournaments, opponents, years)
 
 # World map
 # ---------
 
-df_locations = get_win_ratio(df_res_filtered, df_locations, team)
-st.dataframe(df_locations)
-
-# Function to map win ratio to color
-def win_ratio_to_color(win_ratio):
-    if win_ratio > 0.75:
-        return 'darkgreen'
-    elif win_ratio > 0.5:
-        return 'lightgreen'
-    elif win_ratio > 0.25:
-        return 'orange'
-    else:
-        return 'red'
-
-# Create a base map
-m = folium.Map(location=[20, 0], zoom_start=2)
-
-# Add countries to the map
-for idx, row in df_locations.iterrows():
-    if row['win_ratio']:
-        folium.CircleMarker(
-            location=(row['lat'], row['lon']),
-            radius=10,
-            color=win_ratio_to_color(row['win_ratio']),
-            fill=True,
-            fill_color=win_ratio_to_color(row['win_ratio']),
-            fill_opacity=0.6,
-            popup=f"{row['country']}: {row['win_ratio'] * 100:.2f}%"
-        ).add_to(m)
-
-# Display the map in Streamlit
-st.title('Win Ratios by Country')
-st_folium(m, width=800, height=500)
+@st.fragment
+def world_map_section(team, tournaments, opponents, years):
+    st.title('Win Ratios by Country')
+    with timed('world_map_section'), st.expander('Show the world map', key='world_map_section', on_change='rerun') as section:
+        if not section.open:
+            return
+        layer = st.radio(
+            'Show',
+            ['opponents', 'venues'],
+            format_func=lambda layer: {'opponents': 'Win ratio against every country', 'venues': 'Record in every country played in'}[layer],
+            horizontal=True,
+            key='map_layer',
+        )
+        if layer == 'opponents':
+            st.dataframe(engine.win_ratios(team, tournaments=tournaments, opponents=opponents, years=years))
+        else:
+            venues = engine.venues(team, tournaments=tournaments, opponents=opponents, years=years)
+            st.dataframe(venues['splits'], hide_index=True, width='stretch')
+            st.dataframe(venues['countries'], hide_index=True, width='stretch')
+
+        # The map is rendered to HTML once per layer and filters and then served from the cache, without folium
+        st.iframe(engine.map_html(team, layer, tournaments=tournaments, opponents=opponents, years=years), height=500)
+
+world_map_section(team, tournaments, opponents, years)
+
+# Hidden debug panel, only shown with ?debug=1
+# ------------------------------
+debug_panel(recorder, engine)